@@ -2,6 +2,7 @@ import sys
 import os
 import re
 import glob
+import fcntl
 import pandas as pd
 import argparse
 
@@ -141,16 +142,20 @@ def analyse_at_epoch(report_prefix, path_to_equilibration, execution_dir, steps=
     result = get_score_for_folder(report_prefix=report_prefix, path_to_equilibration=path_to_equilibration,
                                   steps=steps, column=column, quantile_value=quantile_value)
     out_file = os.path.join(execution_dir, "simulation_score_summary.tsv")
-    if os.path.exists(out_file):
-        #Pandas new version compatibility
-        try:
-            df = pd.read_csv(out_file, sep="\t", header=0, ignore_index=True)
-        except TypeError:
-            df = pd.read_csv(out_file, sep="\t", header=0, index_col=False)
-        df = pd.concat([df, pd.DataFrame([result],  columns=["Fragment_Results_Folder", "Score"])])
-    else:
-        df = pd.DataFrame([result], columns=["Fragment_Results_Folder", "Score"])
-    df.to_csv(out_file, sep="\t", index=False)
+    # Concurrent growings share the summary file, so the read-modify-write is done holding a lock
+    with open(out_file + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(out_file):
+            #Pandas new version compatibility
+            try:
+                df = pd.read_csv(out_file, sep="\t", header=0, ignore_index=True)
+            except TypeError:
+                df = pd.read_csv(out_file, sep="\t", header=0, index_col=False)
+            df = pd.concat([df, pd.DataFrame([result],  columns=["Fragment_Results_Folder", "Score"])])
+        else:
+            df = pd.DataFrame([result], columns=["Fragment_Results_Folder", "Score"])
+        df.to_csv(out_file, sep="\t", index=False)
+        fcntl.flock(lock, fcntl.LOCK_UN)
 
 
 def main(report_prefix, path_to_equilibration, equil_pattern="equilibration*", steps=False, out_report=False,
@@ -0,0 +1,359 @@
+"""
+Benchmarks of the stages of FrAG that do not depend on PELE (clustering, overlapping check, selection of the best
+structures, scoring, RMSD, template reading, modification and atom removal), run over synthetic PELE results and
+templates of configurable size, and the memory of a parsed template. The timings can be saved as a baseline and
+compared with later runs to detect performance regressions:
+
+    python -m frag_pele.Benchmark.benchmark --processors 8 --steps 20 --save_baseline
+    python -m frag_pele.Benchmark.benchmark --processors 8 --steps 20
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import tempfile
+import argparse
+import statistics
+import tracemalloc
+import contextlib
+import logging
+# Local imports
+import frag_pele.constants as c
+from frag_pele.Benchmark import synthetic
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+TESTS_DIR = os.path.abspath(os.path.join(c.DIR, "..", "tests"))
+COMPLEX_PDB = os.path.join(TESTS_DIR, "1w7h_preparation_structure_2w.pdb")
+TEMPLATES_FOLDER = os.path.join(TESTS_DIR, "data/original/DataLocal/Templates/OPLS2005/HeteroAtoms/templates_generated")
+BASELINE_FILE = "benchmark_baselines.json"
+TEMPLATE_ATOMS = 150  # Atoms of the synthetic large template
+TOLERANCE = 0.2  # Relative slow down accepted before reporting a regression
+
+
+class BenchmarkContext(object):
+    """
+    Synthetic inputs shared by all the benchmarks, created once in a temporary folder.
+    """
+    def __init__(self, complex_pdb, templates_folder, processors, steps, growing_steps, folder,
+                 template_atoms=TEMPLATE_ATOMS):
+        self.complex_pdb = complex_pdb
+        self.templates_folder = templates_folder
+        self.processors = processors
+        self.steps = steps
+        self.growing_steps = growing_steps
+        self.template_atoms = template_atoms
+        self.folder = folder
+        self.results = os.path.join(folder, "sampling_result")
+        self.trajectories = synthetic.create_results_folder(complex_pdb, self.results, processors, steps)
+        self.clustering_pdbs = synthetic.create_clustering_pdbs(complex_pdb, os.path.join(folder, "clustering_PDBs"),
+                                                                max(processors - 1, 1))
+        os.makedirs(os.path.join(folder, "templates"), exist_ok=True)
+        self.large_template = synthetic.create_large_template(os.path.join(templates_folder, "grwz"),
+                                                              os.path.join(folder, "templates", "largez"),
+                                                              template_atoms)
+
+    def output_folder(self, name):
+        """
+        :return: new empty folder for the outputs of a benchmark. str
+        """
+        folder = os.path.join(self.folder, "outputs", name)
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        os.makedirs(folder)
+        return folder
+
+
+def bench_cluster_traject(context):
+    from frag_pele.Helpers import clusterizer
+    column_number = clusterizer.get_column_num(context.results, c.SELECTION_CRITERIA, c.REPORT_NAME)
+    output = context.output_folder("cluster_traject")
+    clusterizer.cluster_traject("GRW", max(context.processors - 1, 1), column_number, c.DISTANCE_COUNTER,
+                                c.CONTACT_THRESHOLD, "{}*".format(os.path.join(context.results, c.TRAJECTORY_NAME)),
+                                output, output, c.EPSILON, c.REPORT_NAME, c.CONDITION, c.METRICS_WEIGHTS,
+                                c.NUM_CLUSTERS)
+
+
+def bench_check_atom_overlapping(context):
+    from frag_pele.Helpers import clusterizer
+    clusterizer.check_atom_overlapping(context.clustering_pdbs)
+
+
+def bench_bestStructs(context):
+    from frag_pele.Growing import bestStructs
+    bestStructs.main(c.SELECTION_CRITERIA, context.output_folder("bestStructs"), path=context.results, n_structs=50)
+
+
+def bench_analyser(context):
+    from frag_pele.Analysis import analyser
+    analyser.analyse_at_epoch(report_prefix=c.REPORT_NAME, path_to_equilibration=context.results,
+                              execution_dir=context.output_folder("analyser"), column=c.SELECTION_CRITERIA,
+                              quantile_value=0.25)
+
+
+def bench_rmsd_computer(context):
+    from frag_pele.Analysis import rmsd_computer
+    rmsd_computer.compute_rmsd_in_serie(context.clustering_pdbs[0], context.results, resname="GRW",
+                                        report_pref="{}_".format(c.REPORT_NAME), processors=1)
+
+
+def bench_template_fragmenter(context):
+    from frag_pele.Growing import template_fragmenter
+    output = context.output_folder("template_fragmenter")
+    for step in range(1, context.growing_steps + 1):
+        template_fragmenter.main(template_initial_path=os.path.join(context.templates_folder, "3ipz"),
+                                 template_grown_path=os.path.join(context.templates_folder, "grwz"),
+                                 step=step, total_steps=context.growing_steps, hydrogen_to_replace="H7",
+                                 core_atom_linker="C6", tmpl_out_path=os.path.join(output, "grwz_{}".format(step)),
+                                 null_charges=True)
+
+
+def bench_read_template(context):
+    from frag_pele.Growing import template_fragmenter
+    # Both templates are read in each growing step
+    for step in range(2 * (context.growing_steps + 1)):
+        template_fragmenter.TemplateImpact(context.large_template)
+
+
+def bench_load_template(context):
+    from frag_pele.Growing import template_fragmenter
+    # As bench_read_template, but the unchanged template is taken from the memory of the process
+    for step in range(2 * (context.growing_steps + 1)):
+        template_fragmenter.load_template(context.large_template)
+
+
+def bench_erase_atoms(context):
+    from frag_pele.Growing import template_fragmenter
+    template = template_fragmenter.TemplateImpact(context.large_template)
+    # As the covalent corrections, removing atoms one by one with their bonds, angles and dihedrals
+    with contextlib.redirect_stdout(None):
+        for atom in list(template.list_of_atoms.values())[::2]:
+            template.erease_atom_from_template(atom.pdb_atom_name)
+
+
+BENCHMARKS = [("cluster_traject", bench_cluster_traject),
+              ("check_atom_overlapping", bench_check_atom_overlapping),
+              ("bestStructs", bench_bestStructs),
+              ("analyser", bench_analyser),
+              ("rmsd_computer", bench_rmsd_computer),
+              ("template_fragmenter", bench_template_fragmenter),
+              ("read_template", bench_read_template),
+              ("load_template", bench_load_template),
+              ("erase_atoms", bench_erase_atoms)]
+
+
+def time_benchmark(function, context, repeats):
+    """
+    :return: wall seconds of each repetition. list
+    """
+    timings = []
+    for repeat in range(repeats):
+        # The stages print a lot, it would be measured too
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start_time = time.perf_counter()
+            function(context)
+            timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+def run_benchmarks(context, repeats=3, selected=None):
+    """
+    :param context: BenchmarkContext with the synthetic inputs.
+    :param repeats: repetitions of each benchmark. int
+    :param selected: names of the benchmarks to run. By default, all. list
+    :return: dictionary {name: result}. Each result has the "min" and "median" wall seconds and all the "timings", or
+    the "error" that prevented running it (p.ex. a missing dependency). dict
+    """
+    results = {}
+    for name, function in BENCHMARKS:
+        if selected and name not in selected:
+            continue
+        try:
+            timings = time_benchmark(function, context, repeats)
+        except ImportError as e:
+            logger.warning("Benchmark {} skipped: {}".format(name, e))
+            results[name] = {"error": "skipped: {}".format(e)}
+            continue
+        except Exception as e:
+            logger.exception("Benchmark {} failed".format(name))
+            results[name] = {"error": "{}: {}".format(type(e).__name__, e)}
+            continue
+        results[name] = {"min": min(timings), "median": statistics.median(timings), "timings": timings}
+    return results
+
+
+def measure_template_memory(template_path, copies=10):
+    """
+    :param template_path: template to parse. str
+    :param copies: parsed copies kept in memory at the same time. int
+    :return: bytes allocated for each parsed template (average of the copies). float
+    """
+    from frag_pele.Growing import template_fragmenter
+    template_fragmenter.TemplateImpact(template_path)  # Not counting the imports and the shared values
+    tracemalloc.start()
+    try:
+        templates = [template_fragmenter.TemplateImpact(template_path) for copy in range(copies)]
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size / len(templates)
+
+
+def get_configuration(context, repeats):
+    return {"processors": context.processors, "steps": context.steps, "growing_steps": context.growing_steps,
+            "repeats": repeats, "complex": os.path.basename(context.complex_pdb),
+            "template_atoms": context.template_atoms}
+
+
+def get_configuration_key(configuration):
+    return "p{processors}_s{steps}_g{growing_steps}_t{template_atoms}_{complex}".format(
+        **dict({"template_atoms": TEMPLATE_ATOMS}, **configuration))
+
+
+def load_baselines(baseline_file):
+    if not os.path.exists(baseline_file):
+        return {}
+    with open(baseline_file) as input_file:
+        return json.load(input_file)
+
+
+def save_baseline(baseline_file, configuration, results, template_memory=None):
+    """
+    Stores the results as the baseline of their configuration (processors, steps...), keeping the baselines of other
+    configurations.
+    """
+    baselines = load_baselines(baseline_file)
+    baselines[get_configuration_key(configuration)] = {"configuration": configuration,
+                                                       "host": socket.gethostname(),
+                                                       "python": platform.python_version(),
+                                                       "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                                                       "results": results,
+                                                       "template_memory": template_memory}
+    with open(baseline_file, "w") as output_file:
+        json.dump(baselines, output_file, indent=2, sort_keys=True)
+    logger.info("Baseline saved in {}".format(baseline_file))
+
+
+def compare_with_baseline(results, baseline, tolerance=TOLERANCE):
+    """
+    :param results: results of run_benchmarks. dict
+    :param baseline: results stored as baseline for the same configuration. dict
+    :param tolerance: relative slow down of the best time accepted. float
+    :return: list of (name, baseline seconds, current seconds, ratio, flag), where flag is "REGRESSION", "faster", "ok"
+    or "-" if it can not be compared. list
+    """
+    comparison = []
+    for name, result in results.items():
+        previous = baseline.get(name, {})
+        if "min" not in result or "min" not in previous:
+            comparison.append((name, previous.get("min"), result.get("min"), None, "-"))
+            continue
+        ratio = result["min"] / previous["min"] if previous["min"] else float("inf")
+        if ratio > 1 + tolerance:
+            flag = "REGRESSION"
+        elif ratio < 1 - tolerance:
+            flag = "faster"
+        else:
+            flag = "ok"
+        comparison.append((name, previous["min"], result["min"], ratio, flag))
+    return comparison
+
+
+def format_results(results, comparison=None):
+    def seconds(value):
+        return "{:.3f}".format(value) if value is not None else "-"
+
+    lines = ["{:<25} {:>10} {:>10} {:>12} {:>8} {:>11}".format("Benchmark", "Min(s)", "Median(s)", "Baseline(s)",
+                                                              "Ratio", "Status")]
+    comparison = {row[0]: row for row in comparison or []}
+    for name, result in results.items():
+        _, previous, _, ratio, flag = comparison.get(name, (name, None, None, None, "-"))
+        if "error" in result:
+            flag = result["error"]
+        lines.append("{:<25} {:>10} {:>10} {:>12} {:>8} {:>11}".format(
+            name, seconds(result.get("min")), seconds(result.get("median")), seconds(previous),
+            "{:.2f}".format(ratio) if ratio is not None else "-", flag))
+    return "\n".join(lines)
+
+
+def parse_arguments():
+    """
+        Parse user arguments
+        Output: list with all the user arguments
+    """
+    parser = argparse.ArgumentParser(description="""Benchmarks the stages of FrAG that process PELE results, using
+    synthetic results of the given size. Results are compared with the stored baseline of the same configuration.""")
+    parser.add_argument("-p", "--processors", type=int, default=4,
+                        help="Processors of the synthetic simulation (processors - 1 trajectories). By default = 4")
+    parser.add_argument("-s", "--steps", type=int, default=10,
+                        help="PELE steps of each synthetic trajectory. By default = 10")
+    parser.add_argument("-g", "--growing_steps", type=int, default=c.GROWING_STEPS,
+                        help="Growing steps of the template modification. By default = {}".format(c.GROWING_STEPS))
+    parser.add_argument("-r", "--repeats", type=int, default=3,
+                        help="Repetitions of each benchmark, the best time is compared. By default = 3")
+    parser.add_argument("-b", "--benchmarks", nargs="+", default=None, choices=[name for name, _ in BENCHMARKS],
+                        help="Benchmarks to run. By default, all of them.")
+    parser.add_argument("-cx", "--complex_pdb", default=COMPLEX_PDB,
+                        help="Complex used to build the synthetic trajectories, with the ligand in chain L.")
+    parser.add_argument("-tf", "--templates_folder", default=TEMPLATES_FOLDER,
+                        help="Folder with the 3ipz (core) and grwz (grown) templates.")
+    parser.add_argument("-ta", "--template_atoms", type=int, default=TEMPLATE_ATOMS,
+                        help="Atoms of the synthetic large template, built from copies of grwz. By default = {}".format(
+                            TEMPLATE_ATOMS))
+    parser.add_argument("-bf", "--baseline_file", default=BASELINE_FILE,
+                        help="JSON file with the baselines. By default = {}".format(BASELINE_FILE))
+    parser.add_argument("-sb", "--save_baseline", action="store_true",
+                        help="Store the results as the baseline of this configuration.")
+    parser.add_argument("-t", "--tolerance", type=float, default=TOLERANCE,
+                        help="Relative slow down accepted before reporting a regression. By default = {}".format(
+                            TOLERANCE))
+    parser.add_argument("-k", "--keep", default=None,
+                        help="Folder where the synthetic inputs are created and kept. By default, a temporary one.")
+    args = parser.parse_args()
+    return args.processors, args.steps, args.growing_steps, args.repeats, args.benchmarks, args.complex_pdb, \
+           args.templates_folder, args.baseline_file, args.save_baseline, args.tolerance, args.keep, \
+           args.template_atoms
+
+
+def main(processors=4, steps=10, growing_steps=c.GROWING_STEPS, repeats=3, benchmarks=None, complex_pdb=COMPLEX_PDB,
+         templates_folder=TEMPLATES_FOLDER, baseline_file=BASELINE_FILE, save=False, tolerance=TOLERANCE,
+         keep=None, template_atoms=TEMPLATE_ATOMS):
+    """
+    Runs the benchmarks and compares them with the baseline.
+    :return: True if no benchmark is slower than its baseline beyond the tolerance. bool
+    """
+    folder = keep or tempfile.mkdtemp(prefix="frag_benchmark_")
+    try:
+        context = BenchmarkContext(complex_pdb, templates_folder, processors, steps, growing_steps, folder,
+                                   template_atoms)
+        results = run_benchmarks(context, repeats, benchmarks)
+        template_memory = measure_template_memory(context.large_template)
+    finally:
+        if not keep:
+            shutil.rmtree(folder, ignore_errors=True)
+    configuration = get_configuration(context, repeats)
+    baseline = load_baselines(baseline_file).get(get_configuration_key(configuration), {})
+    comparison = compare_with_baseline(results, baseline.get("results", {}), tolerance)
+    print("Configuration: {}".format(configuration))
+    if baseline:
+        print("Baseline from {} ({}, Python {})".format(baseline["date"], baseline["host"], baseline["python"]))
+    print(format_results(results, comparison))
+    print("Memory of a parsed template of {} atoms: {:.1f} KB (baseline: {})".format(
+        context.template_atoms, template_memory / 1024,
+        "{:.1f} KB".format(baseline["template_memory"] / 1024) if baseline.get("template_memory") else "-"))
+    if save:
+        save_baseline(baseline_file, configuration, results, template_memory)
+    return not [row for row in comparison if row[4] == "REGRESSION"]
+
+
+if __name__ == '__main__':
+    processors, steps, growing_steps, repeats, benchmarks, complex_pdb, templates_folder, baseline_file, save, \
+    tolerance, keep, template_atoms = parse_arguments()
+    if not main(processors, steps, growing_steps, repeats, benchmarks, complex_pdb, templates_folder, baseline_file,
+                save, tolerance, keep, template_atoms):
+        sys.exit(1)
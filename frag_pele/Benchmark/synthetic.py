@@ -0,0 +1,132 @@
+"""
+Generation of synthetic PELE result trees (reports, trajectories and clustering PDBs) and templates of configurable
+size, built from a real complex and template, to benchmark the stages of FrAG that process them.
+"""
+import os
+import random
+import logging
+# Local imports
+import frag_pele.constants as c
+from frag_pele.Helpers import fake_pele
+from frag_pele.Growing import template_fragmenter
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+
+def rename_ligand(lines, chain, resname):
+    """
+    :param lines: PDB lines. list
+    :param chain: chain of the ligand. str
+    :param resname: new residue name of the ligand (3 characters). str
+    :return: PDB lines with the HETATM records of the chain renamed. list
+    """
+    return ["{}{:>3}{}".format(line[:17], resname, line[20:]) if line.startswith("HETATM") and line[21:22] == chain
+            else line for line in lines]
+
+
+def create_results_folder(complex_pdb, output_folder, processors=4, steps=10, chain="L", resname="GRW",
+                          seed=c.SEED, metrics=("Binding Energy", "sasaLig")):
+    """
+    Writes the results of a synthetic PELE simulation: one report and one trajectory for each processor (except the
+    master one, as PELE does), with steps + 1 models of the complex where the ligand is slightly moved.
+    :param complex_pdb: complex used for all the models, its size sets the size of the trajectories. str
+    :param output_folder: folder where the results are written. str
+    :param processors: number of processors of the simulation. int
+    :param steps: PELE steps of each trajectory. int
+    :param chain: chain of the ligand. str
+    :param resname: residue name given to the ligand. str
+    :param seed: seed of the random displacements and energies. int
+    :param metrics: columns of the reports after the PELE ones. tuple
+    :return: paths to the trajectories. list
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    structure = rename_ligand(fake_pele.read_structure(complex_pdb), chain, resname)
+    parameters = {"report_path": os.path.join(output_folder, c.REPORT_NAME),
+                  "trajectory_path": os.path.join(output_folder, "{}.pdb".format(c.TRAJECTORY_NAME)),
+                  "steps": steps, "chain": chain, "metrics": list(metrics)}
+    trajectories = []
+    for processor in range(1, max(processors - 1, 1) + 1):
+        fake_pele.write_trajectory_and_report(structure, parameters, processor, 0., random.Random(seed + processor))
+        trajectories.append(fake_pele.get_numbered_path(parameters["trajectory_path"], processor))
+    with open(os.path.join(output_folder, "processorMapping.txt"), "w") as processor_mapping:
+        processor_mapping.write(":".join(["(0, 1, 1)"] * len(trajectories)))
+    logger.info("Synthetic PELE results with {} trajectories of {} steps written in {}".format(len(trajectories),
+                                                                                            steps, output_folder))
+    return trajectories
+
+
+def create_clustering_pdbs(complex_pdb, output_folder, n_structures=4, chain="L", resname="GRW", seed=c.SEED):
+    """
+    Writes the PDBs selected by the clustering of a growing step (initial_0_N.pdb), the inputs of the next step.
+    :return: paths to the PDBs. list
+    """
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    structure = rename_ligand(fake_pele.read_structure(complex_pdb), chain, resname)
+    rng = random.Random(seed)
+    pdbs = []
+    for n in range(n_structures):
+        pdb = os.path.join(output_folder, "initial_0_{}.pdb".format(n))
+        with open(pdb, "w") as pdb_file:
+            pdb_file.write("REMARK 000 File created using FrAG benchmarks\n")
+            pdb_file.write("\n".join(fake_pele.displace_ligand(structure, chain, rng)))
+            pdb_file.write("\nEND\n")
+        pdbs.append(pdb)
+    return pdbs
+
+
+def create_large_template(template_path, output_path, n_atoms=150):
+    """
+    Writes a template of n_atoms atoms made of copies of the atoms, bonds, angles and dihedrals of template_path (with
+    new atom ids and PDB atom names), to benchmark the template operations on large ligands or covalent residues.
+    :param template_path: OPLS2005 template used as building block. str
+    :param output_path: path of the new template. str
+    :param n_atoms: number of atoms of the new template. int
+    :return: output_path. str
+    """
+    template = template_fragmenter.TemplateImpact(template_path)
+    atoms = list(template.list_of_atoms.values())
+    bonds = list(template.list_of_bonds.values())
+    thetas = list(template.list_of_thetas.values())
+    phis, iphis = list(template.list_of_phis), list(template.list_of_iphis)
+    n_original = len(atoms)
+
+    def shift(atom_id, offset):
+        return atom_id + offset if atom_id >= 0 else atom_id - offset
+
+    offset = n_original
+    while len(template.list_of_atoms) < n_atoms:
+        for atom in atoms:
+            atom_id = atom.atom_id + offset
+            if atom_id > n_atoms:
+                break
+            parent_id = atom.parent_id + offset if atom.parent_id else offset - n_original + 1
+            new_atom = template_fragmenter.Atom(atom_id, parent_id, atom.location, atom.atom_type,
+                                                "Z{:03X}".format(atom_id), atom.unknown, atom.x_zmatrix,
+                                                atom.y_zmatrix, atom.z_zmatrix, atom.sigma, atom.epsilon,
+                                                atom.charge, atom.radnpSGB, atom.radnpType, atom.sgbnpGamma,
+                                                atom.sgbnpType)
+            template.list_of_atoms[atom_id] = new_atom
+        for bond in bonds:
+            if max(bond.atom1, bond.atom2) + offset <= n_atoms:
+                key = (bond.atom1 + offset, bond.atom2 + offset)
+                template.add_bond(template_fragmenter.Bond(key[0], key[1], bond.spring, bond.eq_dist))
+        for theta in thetas:
+            if max(theta.atom1, theta.atom2, theta.atom3) + offset <= n_atoms:
+                key = (theta.atom1 + offset, theta.atom2 + offset, theta.atom3 + offset)
+                template.add_theta(template_fragmenter.Theta(key[0], key[1], key[2], theta.spring, theta.eq_angle))
+        for phi in phis + iphis:
+            if max([abs(atom_id) for atom_id in (phi.atom1, phi.atom2, phi.atom3, phi.atom4)]) + offset <= n_atoms:
+                template.add_phi(template_fragmenter.Phi(shift(phi.atom1, offset), shift(phi.atom2, offset),
+                                                         shift(phi.atom3, offset), shift(phi.atom4, offset),
+                                                         phi.constant, phi.prefactor, phi.nterm, phi.improper))
+        offset += n_original
+    template.num_nbon_params = len(template.list_of_atoms)
+    template.num_bond_params = len(template.list_of_bonds)
+    template.num_angle_params = len(template.list_of_thetas)
+    template.num_dihedr_params = template.num_dihedr_params * len(template.list_of_atoms) // n_original
+    template.write_template_to_file(template_new_name=output_path)
+    return output_path
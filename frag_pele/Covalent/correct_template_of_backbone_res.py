@@ -55,7 +55,7 @@ def correct_template(template, aminoacid_path="Data/Templates/OPLS2005/Protein/g
     templ = tf.TemplateImpact(template)
     templ.erease_atom_from_template('_HN_')
     templ.erease_atom_from_template('_HXT')
-    templ_to_copy = tf.TemplateImpact(os.path.join(work_dir, aminoacid_path))
+    templ_to_copy = tf.load_template(os.path.join(work_dir, aminoacid_path))
     for name in BACKBONE_ATOMS:
         replace_atom_template(templ_to_copy, templ, name)
         replace_bond_template(templ_to_copy, templ, name)
@@ -2,18 +2,21 @@ import prody
 #import pybel
 import logging
 import sys
+# Local imports
+from frag_pele.Helpers import parsed_pdb
 
 # Getting the name of the module for the log system
 logger = logging.getLogger(__name__)
 
 
-def pdb_parser_ligand(pdb_file, ligand_chain="L"):
+def pdb_parser_ligand(pdb_file, ligand_chain="L", structure=None):
     """
     :param pdb_file: input PDB file of the complex that we want to get their ligand
     :param ligand_chain: chain where the ligand is placed
+    :param structure: PRODY object already parsed from pdb_file. If set, the file is not parsed again.
     :return: PRODY object with the atoms of the ligand of the input PDB
     """
-    pdb = prody.parsePDB(pdb_file)
+    pdb = structure if structure is not None else parsed_pdb.load(pdb_file).get_structure()
     ligand = pdb.select("chain {}".format(ligand_chain))
     if ligand is None:
         logger.critical("Wrong chain selected!")
@@ -23,13 +26,14 @@ def pdb_parser_ligand(pdb_file, ligand_chain="L"):
        logger.critical("The selected chain does not contain heteroatoms!")
 
 
-def pdb_parser_residue(pdb_file, res_chain, res_num):
+def pdb_parser_residue(pdb_file, res_chain, res_num, structure=None):
     """
     :param pdb_file: input PDB file of the complex that we want to get their residue
     :param res_chain: chain where the residue is placed
+    :param structure: PRODY object already parsed from pdb_file. If set, the file is not parsed again.
     :return: PRODY object with the atoms of the residue of the input PDB
     """
-    pdb = prody.parsePDB(pdb_file)
+    pdb = structure if structure is not None else parsed_pdb.load(pdb_file).get_structure()
     residue = pdb.select("chain {} and resnum {}".format(res_chain, res_num))
     if residue is None:
         logger.critical("Wrong selection!")
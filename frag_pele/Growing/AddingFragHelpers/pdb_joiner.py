@@ -45,7 +45,8 @@ def select_atoms_from_list(PDB_atom_name, atoms_list):
             return atom
 
 
-def get_H_bonded_to_grow(PDB_atom_name, prody_complex, PDB_atom_to_replace=None, chain="L", resnum=None):
+def get_H_bonded_to_grow(PDB_atom_name, prody_complex, PDB_atom_to_replace=None, chain="L", resnum=None,
+                         hydrogens=None):
     """
     Given a heavy atom name (string) and a complex (prody molecule) it returns the hydrogen atom of the chain L
     placed at bonding distance of the input atom name. If there is more than one, a checking of contacts with the
@@ -55,12 +56,17 @@ def get_H_bonded_to_grow(PDB_atom_name, prody_complex, PDB_atom_to_replace=None,
     :param PDB_atom_name: heavy atom name (string) of a ligand
     :param prody_complex: prody molecule object
     :param PDB_atom_to_replace: if selected, the name of the specific H atom that you want to bond.
+    :param hydrogens: names of the hydrogens bonded to the heavy atom (p.ex. read from the fragment index). If set,
+    they are not searched by distance.
     :return: hydrogen atom of the ligand placed at bonding distance of the heavy atom
     """
     # Select the hydrogens bonded to the heavy atom 'PDB_atom_name'
 
     # When non specific atom is selected we search hydrogens automatically
-    if not resnum:
+    if hydrogens is not None:
+        selected_atom = prody_complex.select("chain {} and name {}".format(chain, " ".join(hydrogens))) \
+            if hydrogens else None
+    elif not resnum:
         selected_atom = prody_complex.select("chain {} and hydrogen within 1.74 of name {}".format(chain, 
                                                                                              PDB_atom_name))
     else:
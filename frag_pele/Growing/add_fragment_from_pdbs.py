@@ -3,15 +3,17 @@ import sys
 import logging
 import numpy as np
 import pickle
-from scipy.spatial import distance
+import collections
+from scipy.spatial import distance, cKDTree
 import math
 import os
+import io
 import shutil
 import re
 import Bio.PDB as bio
 # Local imports
 import frag_pele.constants as c
-from frag_pele.Helpers import checker
+from frag_pele.Helpers import checker, parsed_pdb, fragment_index
 from frag_pele.Growing.AddingFragHelpers import complex_to_prody, pdb_joiner, atom_constants
 try:
     import rdkit
@@ -25,20 +27,26 @@ if RDKIT:
 logger = logging.getLogger(__name__)
 # Lists
 LIST_OF_IONS = ["ZN", "MN", "FE", "CO", "NI", "CA", "CD"]
+# Pose of the fragment on its bond with the core: conformer (0 is the input one), rotation around the bond, and its
+# clashing atoms and minimum distance to the core and to the receptor
+Pose = collections.namedtuple("Pose", ["conformer", "angle", "clashes", "min_distance", "protein_clashes",
+                                       "min_protein_distance"])
 
 
-def extract_atoms_pdbs(pdb, create_file=True, chain="L", resnum=None, get_atoms=False, output_folder="."):
+def extract_atoms_pdbs(pdb, create_file=True, chain="L", resnum=None, get_atoms=False, output_folder=".",
+                       structure=None):
     """
     From a pdb file, it extracts the chain L and checks if the structure has hydrogens. After that, the chain L is
     written in a new PDB file which will have the following format: "{residue name}.pdb".
     :param pdb: pdb file (with a ligand in the chain L).
+    :param structure: ProDy molecule already parsed from pdb. If set, the file is not parsed again.
     :return: Writes a new pdb file "{residue name}.pdb" with the chain L isolated an returns the residue name (string).
     """
     # Parse the complex file and isolate the ligand core and the fragment
     if not resnum:
-        selection = complex_to_prody.pdb_parser_ligand(pdb, chain)
+        selection = complex_to_prody.pdb_parser_ligand(pdb, chain, structure=structure)
     else:
-        selection = complex_to_prody.pdb_parser_residue(pdb, chain, resnum)
+        selection = complex_to_prody.pdb_parser_residue(pdb, chain, resnum, structure=structure)
     if selection is None:
         raise TypeError("The selection can not be found. Selection for {}: chain {} and resnum {}".format(pdb, chain, resnum))
     # Check if the ligand has H
@@ -71,6 +79,35 @@ def from_pdb_to_bioatomlist(list_of_pdb_names):
     return list_of_lists
 
 
+def from_prody_to_bioatomlist(molecules):
+    """
+    Given a list of ProDy molecules, it builds in memory the Bio.PDB.Atom objects of their atoms, the same ones that
+    from_pdb_to_bioatomlist reads from their PDB files (with single precision coordinates, as Bio.PDB).
+    :param molecules: list of ProDy molecules.
+    :return: list of lists with the Bio.PDB.Atom objects of each molecule.
+    """
+    list_of_lists = []
+    for molecule in molecules:
+        residues = {}
+        bioatomlist = []
+        # The atoms are numbered from 1, as prody.writePDB does
+        for serial, atom in enumerate(molecule, 1):
+            residue_key = (atom.getChid(), atom.getResnum(), atom.getIcode(), atom.getResname())
+            if residue_key not in residues:
+                hetero_flag = "H_{}".format(atom.getResname()) if atom.getFlag("hetatm") else " "
+                residues[residue_key] = bio.Residue.Residue((hetero_flag, int(atom.getResnum()),
+                                                             atom.getIcode() or " "), atom.getResname(), "    ")
+            name = atom.getName()
+            bioatom = bio.Atom.Atom(name, np.array(atom.getCoords(), "f"), float(atom.getBeta()),
+                                    float(atom.getOccupancy()), atom.getAltloc() or " ",
+                                    " {:<3}".format(name) if len(name) < 4 else name, serial,
+                                    atom.getElement() or None)
+            residues[residue_key].add(bioatom)
+            bioatomlist.append(bioatom)
+        list_of_lists.append(bioatomlist)
+    return list_of_lists
+
+
 def extract_heavy_atoms(pdb_atom_names, lists_of_bioatoms):
     """
     Given a heavy atom name (string) and a list of Bio.PDB.Atom objects, it selects this atom of the list and return it
@@ -88,7 +125,7 @@ def extract_heavy_atoms(pdb_atom_names, lists_of_bioatoms):
 
 
 def extract_hydrogens(pdb_atom_names, lists_of_bioatoms, list_of_pdbs, h_core=None, h_frag=None, c_chain="L", f_chain="L",
-                      c_resnum=None, f_resnum=None):
+                      c_resnum=None, f_resnum=None, structures=None):
     """
     Given a heavy atom name (string), a list of Bio.PDB.Atoms objects and a list of pdb files, it returns the hydrogens
     at bonding distance of the heavy atom. If there is more than one, a checking of contacts with the
@@ -98,6 +135,8 @@ def extract_hydrogens(pdb_atom_names, lists_of_bioatoms, list_of_pdbs, h_core=No
     :param pdb_atom_names: heavy atom name (string).
     :param lists_of_bioatoms: list of Bio.PDB.Atom objects.
     :param list_of_pdbs: list of PDB files.
+    :param structures: list of ProDy molecules already parsed from list_of_pdbs. If set, the files are not parsed again.
+    The hydrogens of the fragments of an indexed library are read from its index (see fragment_index).
     :return: Bio.PDB.Atom object correspondent to the hydrogen bonded to the heavy atom
     """
 
@@ -105,11 +144,16 @@ def extract_hydrogens(pdb_atom_names, lists_of_bioatoms, list_of_pdbs, h_core=No
     selected_hydrogens = [h_core, h_frag]
     chains = [c_chain, f_chain]
     resnums = [c_resnum, f_resnum]
-    for atom_name, pdb, list_of_bioatoms, sel_h, chain, resnum in zip(pdb_atom_names, list_of_pdbs, lists_of_bioatoms, selected_hydrogens, chains,
-                                                              resnums):
-        complex = prody.parsePDB(pdb)
+    if structures is None:
+        structures = [None] * len(list_of_pdbs)
+    for atom_name, pdb, structure, list_of_bioatoms, sel_h, chain, resnum in zip(pdb_atom_names, list_of_pdbs, structures,
+                                                                            lists_of_bioatoms, selected_hydrogens,
+                                                                            chains, resnums):
+        complex = structure if structure is not None else parsed_pdb.load(pdb).get_structure()
+        indexed_hydrogens = fragment_index.get_bonded_hydrogens(pdb, atom_name, chain) if not resnum else None
         # Select name of the H atoms bonded to this heavy atom (the place where we will grow)
-        atom_name_hydrogens = pdb_joiner.get_H_bonded_to_grow(atom_name, complex, sel_h, chain=chain, resnum=resnum)
+        atom_name_hydrogens = pdb_joiner.get_H_bonded_to_grow(atom_name, complex, sel_h, chain=chain, resnum=resnum,
+                                                              hydrogens=indexed_hydrogens)
         # Select this hydrogen atoms
         atom_hydrogen = pdb_joiner.select_atoms_from_list(atom_name_hydrogens, list_of_bioatoms)
         hydrogens.append(atom_hydrogen)
@@ -157,34 +201,6 @@ def bond(hydrogen_atom_names, molecules):
         i += 2
     return bonds
 
-def join_structures_to_rotate(core_bond, fragment_bond, list_of_atoms, core_structure, fragment_structure):
-    """
-    It joins two ProDy structures into a single one, merging both bonds (core bond and fragment bond) creating a unique
-    bond between the molecules. In order to do that this function performs a cross superimposition (in BioPython) of
-    the whole fragment using as reference (fixed part) the atoms of the bond. Then, it transforms this BioPython object
-    into ProDy molecule with the coordinates modified. Once we have all ready, the Hydrogens of the bonds will be
-    deleted and both structures will be concatenated into a single ProDy object.
-    :param core_bond: Bio.PDB.Atom list with two elements: [heavy atom, hydrogen atom]. These two atoms have to be the
-    ones participating in the bond of the core that we would like to use as linking point between core and fragment.
-    :param fragment_bond: Bio.PDB.Atom list with two elements: [hydrogen atom, heavy atom]. These two atoms have to be the
-    ones participating in the bond of the fragment that we would like to use as linking point between fragment and core.
-    :param list_of_atoms: Bio.PDB.Atom list with all the atoms of the fragment. These atoms have to contain
-    coordinates.
-    :param core_structure: ProDy molecule that contain only the core ligand.
-    :param fragment_structure: ProDy molecule that contain only the fragment ligand.
-    :return: ProDy molecule with the core_structure and the fragment_structure (with the coordinates modified)
-    concatenated.
-    """
-    # Superimpose atoms of the fragment to the core bond
-    pdb_joiner.superimpose(core_bond, fragment_bond, list_of_atoms)
-    # Get the new coords and change them in prody
-    transform_coords_from_bio2prody(fragment_structure, list_of_atoms)
-    # Now, we have to remove the hydrogens of the binding
-    h_atom_names = [core_bond[1].name, fragment_bond[0].name]
-    merged_structure = bond(h_atom_names, [core_structure, fragment_structure])
-    return merged_structure
-
-
 def join_structures(core_bond, fragment_bond, core_structure, fragment_structure, pdb_complex,
                     pdb_fragment, chain_complex, chain_fragment, output_path, only_grow=False,
                     core_resnum=None):
@@ -227,8 +243,12 @@ def join_structures(core_bond, fragment_bond, core_structure, fragment_structure
                                                       chain=chain_fragment)
     else:
         print("WARNING: YOU CAN NOT REPLACE HEAVY ATOMS FOR HYDROGENS WITHOUT RDKIT!")
-    fragment_rdkit = rdkit.Chem.MolFromPDBFile(pdb_fragment, removeHs=False)
-    bond_type = detect_bond_type(fragment_rdkit, fragment_bond[0], fragment_bond[1])
+    # The bonds of the fragments of an indexed library are read from its index
+    bond_type = fragment_index.get_bond_type(pdb_fragment, fragment_bond[0].name, fragment_bond[1].name,
+                                             chain_fragment)
+    if bond_type is None:
+        fragment_rdkit = rdkit.Chem.MolFromPDBFile(pdb_fragment, removeHs=False)
+        bond_type = detect_bond_type(fragment_rdkit, fragment_bond[0], fragment_bond[1])
     print(bond_type)
     if RDKIT:
         if core_bond[1].element != "H":
@@ -255,11 +275,9 @@ def join_structures(core_bond, fragment_bond, core_structure, fragment_structure
                 set(fragment_structure.getNames()) ^ set(atoms_to_delete_fragment))  # Compare two sets and get the common items
             names_to_keep.remove(name_to_replace_fragment)
             fragment_structure = fragment_structure.select("name {}".format(" ".join(names_to_keep)))
-            prody.writePDB(os.path.join(output_path, "{}.pdb".format(fragment_structure.getResnames()[0])),
-                           fragment_structure)  # Overwrite the initial structure
             name_to_replace_fragment = fragment_structure[atom_replaced_idx].getName()
             fragment_bond[0].coord = new_coords
-    bio_list = from_pdb_to_bioatomlist([os.path.join(output_path, "{}".format(fragment_structure.getResnames()[0]))])[0] # Its a list, so we keep only the unique element that is inside
+    bio_list = from_prody_to_bioatomlist([fragment_structure])[0]  # Its a list, so we keep only the unique element that is inside
     # Superimpose atoms of the fragment to the core bond
     pdb_joiner.superimpose(core_bond, fragment_bond, bio_list)
     # Get the new coords and change them in prody
@@ -420,33 +438,241 @@ def modify_distance_between_structures(coords_core, coords_fragment, coords_to_m
     return new_coords
 
 
-def rotation_thought_axis(bond, theta, core_bond, list_of_atoms, fragment_bond, core_structure, fragment_structure,
-                          pdb_complex, pdb_fragment, chain_complex, chain_fragment, output_path, only_grow=False):
+def get_scan_angles(coarse_interval=math.pi/18, fine_interval=math.pi/180):
+    """
+    Angles of the rotations tried to solve the clashes, in order of preference: no rotation, the steps of coarse_interval
+    (10º) and then the remaining steps of fine_interval (1º).
+    :param coarse_interval: coarse rotation step in rads. float
+    :param fine_interval: fine rotation step in rads. float
+    :return: array with the angles in rads. np.array
     """
-    Given a core molecule and a fragment, this function rotates the fragment atoms a certain theta angle around an axis
-    (set by the bond).
+    coarse = np.arange(0, math.pi*2 - 1e-9, coarse_interval)
+    fine = np.arange(0, math.pi*2 - 1e-9, fine_interval)
+    fine = fine[np.min(np.abs(fine[:, None] - coarse[None, :]), axis=1) > 1e-9]
+    return np.concatenate([coarse, fine])
+
+
+def get_rotation_matrices(axis, angles):
+    """
+    Rotation matrices of all the angles around an axis (Rodrigues' rotation formula), computed at once.
+    :param axis: vector with the direction of the axis. np.array
+    :param angles: angles in rads. np.array
+    :return: array (angles, 3, 3) with the rotation matrix of each angle. np.array
+    """
+    x, y, z = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+    cross = np.array([[0., -z, y], [z, 0., -x], [-y, x, 0.]])
+    angles = np.asarray(angles, dtype=float)[:, None, None]
+    return np.eye(3) + np.sin(angles) * cross + (1 - np.cos(angles)) * cross.dot(cross)
+
+
+def rotate_around_axis(coords, origin, axis, angles):
+    """
+    :param coords: coordinates (atoms, 3) to rotate. np.array
+    :param origin: point of the axis. np.array
+    :param axis: vector with the direction of the axis. np.array
+    :param angles: angles in rads. np.array
+    :return: array (angles, atoms, 3) with the coordinates rotated by each angle. np.array
+    """
+    matrices = get_rotation_matrices(axis, angles)
+    return np.einsum("aij,nj->ani", matrices, coords - origin) + origin
+
+
+def count_clashes(tree, poses_coords, threshold_clash):
+    """
+    :param tree: KD-tree of the atoms that can clash with the poses. None if there are no atoms. cKDTree
+    :param poses_coords: array (poses, atoms, 3) with the coordinates of the fragment in each pose. np.array
+    :param threshold_clash: atoms closer than this distance are clashing. float
+    :return: for each pose, the number of fragment atoms clashing with the atoms of the tree and the minimum distance
+    between them. tuple of np.array
+    """
+    if tree is None:
+        return np.zeros(len(poses_coords), dtype=int), np.full(len(poses_coords), np.inf)
+    distances, indexes = tree.query(poses_coords.reshape(-1, 3))
+    distances = distances.reshape(len(poses_coords), -1)
+    return (distances <= threshold_clash).sum(axis=1), distances.min(axis=1)
+
+
+def scan_rotations(core_coords, fragment_coords, origin, axis, angles, threshold_clash):
+    """
+    It rotates the fragment around the axis by all the angles at once and finds the clashes with the core with a
+    KD-tree of the core atoms.
+    :param core_coords: coordinates of the core atoms that can clash with the fragment. np.array
+    :param fragment_coords: coordinates of the fragment atoms. np.array
+    :param origin: point of the axis of rotation (the core atom bonded to the fragment). np.array
+    :param axis: vector with the direction of the bond between the core and the fragment. np.array
+    :param angles: angles in rads. np.array
+    :param threshold_clash: atoms closer than this distance are clashing. float
+    :return: for each angle, the number of fragment atoms clashing with the core and the minimum distance between
+    them. tuple of np.array
+    """
+    tree = cKDTree(core_coords) if len(core_coords) else None
+    return count_clashes(tree, rotate_around_axis(fragment_coords, origin, axis, angles), threshold_clash)
+
+
+def get_receptor_index(pdb_complex, ligand_chain, ligand_resnum=None):
+    """
+    KD-tree of the receptor atoms of a complex: all its atoms but the ligand (or, in covalent growings, but the residue
+    that holds the core). It is kept with the parsed complex (see parsed_pdb), so the growings of a serie that start
+    from the same complex build it once.
+    :param pdb_complex: PDB file with the complex, or its ParsedPDB.
+    :param ligand_chain: chain of the ligand. str
+    :param ligand_resnum: residue number of the core in covalent growings. None for ligands. int
+    :return: KD-tree of the coordinates of the receptor atoms, or None if the complex has no other atoms. cKDTree
+    """
+    parsed = parsed_pdb.load(pdb_complex)
+    key = ("receptor_index", ligand_chain, ligand_resnum)
+    if key not in parsed.memo:
+        if ligand_resnum is None:
+            selection = "not chain {}".format(ligand_chain)
+        else:
+            selection = "not (chain {} and resnum {})".format(ligand_chain, ligand_resnum)
+        receptor = parsed.get_structure().select(selection)
+        parsed.memo[key] = cKDTree(receptor.getCoords()) if receptor is not None else None
+    return parsed.memo[key]
+
+
+def superimpose_on_atom(coords, reference_coords, anchors, center):
+    """
+    It superimposes coords onto reference_coords by the atoms of anchors (Kabsch), keeping the atom center exactly on
+    its reference position.
+    :param coords: coordinates (atoms, 3) to move. np.array
+    :param reference_coords: reference coordinates (atoms, 3), with the atoms in the same order. np.array
+    :param anchors: indexes of the atoms used to superimpose. list
+    :param center: index of the atom that is placed on its reference. int
+    :return: coordinates moved. np.array
+    """
+    moving = coords[anchors] - coords[center]
+    fixed = reference_coords[anchors] - reference_coords[center]
+    u, s, vt = np.linalg.svd(moving.T.dot(fixed))
+    reflection = np.sign(np.linalg.det(vt.T.dot(u.T)))
+    rotation = vt.T.dot(np.diag([1., 1., reflection])).dot(u.T)
+    return (coords - coords[center]).dot(rotation.T) + reference_coords[center]
+
+
+def get_fragment_conformers(pdb_fragment, fragment_chain, names, reference_coords, attachment_name, number,
+                            seed=c.SEED):
+    """
+    It generates conformers of the fragment with RDKit and superimposes them onto its current pose by the atom bonded
+    to the core and its neighbours, so they share the bond with the core.
+    :param pdb_fragment: PDB file with the fragment. str
+    :param fragment_chain: chain of the fragment. str
+    :param names: PDB atom names of the fragment atoms placed on the core. list
+    :param reference_coords: coordinates (atoms, 3) of these atoms in the current pose. np.array
+    :param attachment_name: PDB atom name of the fragment atom bonded to the core. str
+    :param number: number of conformers. int
+    :param seed: seed of the embedding. int
+    :return: list with the coordinates (atoms, 3) of the atoms of names in each conformer. Empty if RDKit can not
+    embed the fragment. list
+    """
+    from rdkit.Chem import AllChem
+    molecule = rdkit.Chem.MolFromPDBFile(pdb_fragment, removeHs=False)
+    if molecule is None:
+        logger.warning("RDKit can not read {}, the conformers of the fragment are not used".format(pdb_fragment))
+        return []
+    indexes = {}
+    for atom in molecule.GetAtoms():
+        info = atom.GetPDBResidueInfo()
+        if info.GetChainId() == fragment_chain:
+            indexes[info.GetName().strip()] = atom.GetIdx()
+    if any([name not in indexes for name in names]):
+        logger.warning("Atoms of the fragment not found in {}, its conformers are not used".format(pdb_fragment))
+        return []
+    rdkit.Chem.AssignStereochemistryFrom3D(molecule)
+    conformer_ids = AllChem.EmbedMultipleConfs(molecule, numConfs=number, randomSeed=seed)
+    atom_indexes = [indexes[name] for name in names]
+    center = names.index(attachment_name)
+    neighbours = [neighbour.GetIdx() for neighbour in molecule.GetAtomWithIdx(atom_indexes[center]).GetNeighbors()]
+    anchors = [center] + [n for n, index in enumerate(atom_indexes) if index in neighbours]
+    if len(anchors) < 3:  # The orientation is not defined by the neighbours
+        anchors = list(range(len(names)))
+    conformers = []
+    for conformer_id in conformer_ids:
+        coords = molecule.GetConformer(conformer_id).GetPositions()[atom_indexes]
+        conformers.append(superimpose_on_atom(coords, reference_coords, anchors, center))
+    return conformers
+
+
+def find_rotations(merged_structure, bond, threshold_clash, angles=None, receptor=None,
+                   threshold_protein=c.PROTEIN_CLASH_THRESHOLD, conformers=None):
+    """
+    It ranks the poses of the fragment (its rotations around its bond with the core, of the current pose and of each
+    conformer): first the ones without clashes with the core or the receptor (in the order of the angles), then the
+    others, by number of clashes with the core, with the receptor, and distance to them.
+    :param merged_structure: ProDy molecule with the core_structure and the fragment_structure concatenated.
     :param bond: Bio.PDB.Atom list composed by two elements: [heavy atom of the core, heavy atom of the fragment]
-    :param theta: Rotation angle in rads.
-    :param core_bond: Bio.PDB.Atom list with two elements: [heavy atom, hydrogen atom]. These two atoms have to be the
-    ones participating in the bond of the core that we would like to use as linking point between core and fragment.
-    :param list_of_atoms: list_of_atoms: Bio.PDB.Atom list with all the atoms of the fragment. These atoms have to contain
-    coordinates.
-    :param fragment_bond: Bio.PDB.Atom list with two elements: [hydrogen atom, heavy atom]. These two atoms have to be the
-    ones participating in the bond of the fragment that we would like to use as linking point between fragment and core.
-    :param core_structure: ProDy molecule that contain only the core ligand.
-    :param fragment_structure: ProDy molecule that contain only the fragment ligand.
-    :return: ProDy molecule with the core_structure and the fragment_structure rotated around the axis of the bond.
+    :param threshold_clash: atoms closer than this distance are clashing. float
+    :param angles: angles in rads. By default, the ones of get_scan_angles. np.array
+    :param receptor: KD-tree of the receptor atoms (see get_receptor_index). None to only check the core. cKDTree
+    :param threshold_protein: fragment atoms closer than this distance to a receptor atom are clashing. float
+    :param conformers: coordinates of the fragment atoms in other conformers, placed on the same bond (see
+    get_fragment_conformers). list
+    :return: list of Pose sorted from best to worst, and the tuple (origin, axis, fragment mask, coordinates of each
+    conformer) needed to apply them. tuple
     """
-    # Obtain the axis that we want to use as reference for the rotation
-    vector = bond[1].get_vector() - bond[0].get_vector()
-    # Obtain the rotation matrix for the vector (axis) and the angle (theta)
-    rot_mat = bio.rotaxis(theta, vector)
-    for atom in list_of_atoms:
-        # Multiply the matrix of coordinates for the transpose of the rotation matrix to get the coordinates rotated
-        atom.transform(rot_mat, (0, 0, 0))
-        transform_coords_from_bio2prody(fragment_structure, list_of_atoms)
-    rotated_structure = join_structures_to_rotate(core_bond, fragment_bond, list_of_atoms, core_structure, fragment_structure)
-    return rotated_structure
+    if angles is None:
+        angles = get_scan_angles()
+    core_resname = bond[0].get_parent().get_resname()
+    frag_resname = bond[1].get_parent().get_resname()
+    resnames = merged_structure.getResnames()
+    names = merged_structure.getNames()
+    coords = merged_structure.getCoords()
+    is_core = resnames == core_resname
+    is_fragment = resnames == frag_resname
+    bonded_core = is_core & (names == bond[0].name)
+    origin = coords[bonded_core][0]
+    axis = coords[is_fragment & (names == bond[1].name)][0] - origin
+    # The core atom bonded to the fragment is the only one allowed within the threshold
+    core_coords = coords[is_core & ~bonded_core]
+    core_tree = cKDTree(core_coords) if len(core_coords) else None
+    candidates = [coords[is_fragment]] + list(conformers or [])
+    scores = []
+    for fragment_coords in candidates:
+        rotated = rotate_around_axis(fragment_coords, origin, axis, angles)
+        scores.append(count_clashes(core_tree, rotated, threshold_clash) +
+                      count_clashes(receptor, rotated, threshold_protein))
+    # Poses (conformers, angles) flattened angle by angle, so each angle of all the conformers is tried in turn
+    clashes, min_distances, protein_clashes, min_protein_distances = [np.stack(score).T.ravel() for score in
+                                                                      zip(*scores)]
+    order = np.arange(len(clashes))
+    free = (clashes == 0) & (protein_clashes == 0)
+    ranking = np.lexsort((np.where(free, order, -np.minimum(min_distances, min_protein_distances)), protein_clashes,
+                          clashes))
+    poses = [Pose(int(i % len(candidates)), angles[i // len(candidates)], int(clashes[i]), float(min_distances[i]),
+                  int(protein_clashes[i]), float(min_protein_distances[i])) for i in ranking]
+    return poses, (origin, axis, is_fragment, candidates)
+
+
+def select_poses(poses, number, min_angle=math.pi/6):
+    """
+    :param poses: poses sorted from best to worst (see find_rotations). list
+    :param number: maximum number of poses. int
+    :param min_angle: minimum angle (rads) between two selected poses of the same conformer. float
+    :return: the best poses without clashes with the core, different enough to start independent simulations. list
+    """
+    selected = []
+    for pose in poses:
+        if len(selected) >= number or pose.clashes:
+            break
+        if any([previous.conformer == pose.conformer and
+                abs((previous.angle - pose.angle + math.pi) % (2 * math.pi) - math.pi) < min_angle
+                for previous in selected]):
+            continue
+        selected.append(pose)
+    return selected
+
+
+def apply_pose(structure, pose, placement):
+    """
+    :param structure: ProDy molecule with the core and the fragment. Its coordinates are modified.
+    :param pose: pose of the fragment (see find_rotations). Pose
+    :param placement: (origin, axis, fragment mask, coordinates of each conformer) returned by find_rotations. tuple
+    """
+    if not pose.angle and not pose.conformer:  # Current pose
+        return
+    origin, axis, is_fragment, candidates = placement
+    coords = structure.getCoords()
+    coords[is_fragment] = rotate_around_axis(candidates[pose.conformer], origin, axis, [pose.angle])[0]
+    structure.setCoords(coords)
 
 
 def rotate_throught_bond(bond, angle, rotated_atoms, atoms_fixed):
@@ -464,62 +690,71 @@ def rotate_throught_bond(bond, angle, rotated_atoms, atoms_fixed):
     return structure_result
 
 
-def check_collision(merged_structure, bond, theta, theta_interval, core_bond, list_of_atoms, fragment_bond,
-                    core_structure, fragment_structure, pdb_complex, pdb_fragment, chain_complex, chain_fragment,
-                    output_path, threshold_clash=None, only_grow=False, debug=False):
+def place_fragment(merged_structure, bond, threshold_clash=None, angles=None, receptor=None,
+                   threshold_protein=c.PROTEIN_CLASH_THRESHOLD, conformers=None, number_of_poses=1, debug=False):
     """
-    Given a structure composed by a core and a fragment, it checks that there is not collisions between the atoms of
-    both. If it finds a collision, the molecule will be rotated "theta_interval" radians and the checking will be
-    repeated. If it is not possible to find a conformation without atom collisions, it will print a warning.
-    :param merged_structure: ProDy molecule with the core_structure and the fragment_structure concatenated.
+    It places the fragment in the best poses found by find_rotations: without clashes with the core and, if possible,
+    with the receptor.
+    :param merged_structure: ProDy molecule with the core_structure and the fragment_structure concatenated. Its
+    coordinates are modified to the best pose.
     :param bond: Bio.PDB.Atom list composed by two elements: [heavy atom of the core, heavy atom of the fragment]
-    :param theta: Initial rotation angle in rads.
-    :param theta_interval: Rotation angle that will be added to theta.
-    :param core_bond: Bio.PDB.Atom list with two elements: [heavy atom, hydrogen atom]. These two atoms have to be the
-    ones participating in the bond of the core that we would like to use as linking point between core and fragment.
-    :param list_of_atoms: list_of_atoms: Bio.PDB.Atom list with all the atoms of the fragment. These atoms have to contain
-    coordinates.
-    :param fragment_bond: Bio.PDB.Atom list with two elements: [hydrogen atom, heavy atom]. These two atoms have to be the
-    ones participating in the bond of the fragment that we would like to use as linking point between fragment and core.
-    :param core_structure: ProDy molecule that contain only the core ligand.
-    :param fragment_structure: ProDy molecule that contain only the fragment ligand.
-    :return: ProDy molecule with the core_structure and the fragment_structure (rotated and without intra-molecular
-    clashes) around the axis of the bond.
+    :param threshold_clash: atoms closer than this distance are clashing. float
+    :param angles: angles in rads that are tried, in order of preference. By default, the ones of get_scan_angles.
+    :param receptor: KD-tree of the receptor atoms (see get_receptor_index). None to only check the core. cKDTree
+    :param threshold_protein: fragment atoms closer than this distance to a receptor atom are clashing. float
+    :param conformers: coordinates of the fragment atoms in other conformers (see get_fragment_conformers). list
+    :param number_of_poses: maximum number of poses returned. int
+    :return: list of ProDy molecules with the core and the fragment placed, from best to worst: merged_structure and
+    copies of it for the other poses. Empty if all the poses have clashes with the core.
     """
     core_resname = bond[0].get_parent().get_resname()
     frag_resname = bond[1].get_parent().get_resname()
     print(core_resname, frag_resname)
-    if core_resname is frag_resname:
+    if core_resname == frag_resname:
         logger.critical("The resname of the core and the fragment is the same. Please, change one of both")
-    print("resname {} and within {} of resname {}".format(core_resname,
-                                                          threshold_clash,
-                                                          frag_resname))
-    check_possible_collision = merged_structure.select("resname {} and within {} of resname {}".format(core_resname,
-                                                                                                       threshold_clash,
-                                                                                                        frag_resname))
-    # This list only should have the atom of the fragment that will be bonded to the core, so if not we will have to
-    # solve it
-    if len(check_possible_collision.getNames()) > 1 or check_possible_collision.getNames()[0] != bond[0].name:
-        print("We have a collision between atoms of the fragment {} and the core {} within {} A!" 
-              " Rotating the fragment to solve it...".format(frag_resname, core_resname, threshold_clash))
-        theta = theta + theta_interval
-        if theta >= math.pi*2:
-            print("Not possible solution, decreasing the angle of rotation...")
-        else:
-            rotated_structure = rotation_thought_axis(bond, theta, core_bond, list_of_atoms, fragment_bond, core_structure,
-                                                      fragment_structure, pdb_complex, pdb_fragment, chain_complex, chain_fragment,
-                                                      output_path=output_path, only_grow=only_grow)
-            if debug:
-                print(theta)
-                prody.writePDB("testing_{}.pdb".format(theta), rotated_structure[0])
-            recall = check_collision(merged_structure=rotated_structure[0], bond=bond, theta=theta, theta_interval=theta_interval, 
-                                     core_bond=core_bond, list_of_atoms=list_of_atoms, fragment_bond=fragment_bond, core_structure=core_structure,
-                                     fragment_structure=fragment_structure, pdb_complex=pdb_complex, pdb_fragment=pdb_fragment, 
-                                     chain_complex=chain_complex, chain_fragment=chain_fragment,
-                                     output_path=output_path, threshold_clash=threshold_clash, only_grow=only_grow, debug=debug)
-            return recall
-    else:
-        return merged_structure
+    poses, placement = find_rotations(merged_structure, bond, threshold_clash, angles, receptor, threshold_protein,
+                                      conformers)
+    if debug:
+        for pose in poses[:10]:
+            print("Conformer {}, {:.0f} degrees: {} atoms clashing with the core ({:.2f} A), {} with the receptor "
+                  "({:.2f} A)".format(pose.conformer, math.degrees(pose.angle), pose.clashes, pose.min_distance,
+                                      pose.protein_clashes, pose.min_protein_distance))
+    selected = select_poses(poses, number_of_poses)
+    if not selected:
+        print("Not possible solution, all the rotations of the fragment {} have clashes with the core {} within "
+              "{} A".format(frag_resname, core_resname, threshold_clash))
+        return []
+    best = selected[0]
+    if best.protein_clashes:
+        print("All the poses of the fragment {} have clashes with the receptor within {} A. Using the one with less "
+              "clashes ({} atoms)...".format(frag_resname, threshold_protein, best.protein_clashes))
+    if best.angle or best.conformer:
+        print("We have a collision between atoms of the fragment {} and the core {} or the receptor!"
+              " Rotating the fragment {:.0f} degrees (conformer {}) to solve it...".format(
+                  frag_resname, core_resname, math.degrees(best.angle), best.conformer))
+    structures = [merged_structure] + [merged_structure.copy() for pose in selected[1:]]
+    for structure, pose in zip(structures, selected):
+        apply_pose(structure, pose, placement)
+    return structures
+
+
+def check_collision(merged_structure, bond, threshold_clash=None, angles=None, debug=False):
+    """
+    Given a structure composed by a core and a fragment, it checks that there is not collisions between the atoms of
+    both. If there are collisions, the fragment is rotated around its bond with the core by the best angle found by
+    find_rotations. If it is not possible to find a conformation without atom collisions, it will print a warning.
+    :param merged_structure: ProDy molecule with the core_structure and the fragment_structure concatenated. Its
+    coordinates are modified.
+    :param bond: Bio.PDB.Atom list composed by two elements: [heavy atom of the core, heavy atom of the fragment]
+    :param threshold_clash: atoms closer than this distance are clashing. float
+    :param angles: angles in rads that are tried, in order of preference. By default, the ones of get_scan_angles.
+    :return: ProDy molecule with the core_structure and the fragment_structure (rotated and without intra-molecular
+    clashes) around the axis of the bond, or None if all the rotations have clashes.
+    """
+    structures = place_fragment(merged_structure, bond, threshold_clash, angles, debug=debug)
+    if not structures:
+        return None
+    return structures[0]
 
 
 def get_previous_bond(structure, core_atom, core_resname):
@@ -617,7 +852,7 @@ def extract_protein_from_complex(pdb_file):
     :param pdb_file: pdb file with a complex. string.
     :return: ProDy molecule with only the protein.
     """
-    complex = prody.parsePDB(pdb_file)
+    complex = parsed_pdb.load(pdb_file).get_structure()
     protein = complex.select("protein")
     return protein
 
@@ -651,10 +886,9 @@ def get_waters_or_ions_in_pdb(pdb_input):
 
 def get_everything_except_ligand(pdb_input, ligand_chain):
     pdb_content = []
-    with open(pdb_input) as pdb:
-        for line in pdb:
-            if (line.startswith("ATOM") or line.startswith("HETATM") and line[21] != ligand_chain) or line.startswith("TER"):
-                pdb_content.append(line)
+    for line in parsed_pdb.load(pdb_input).lines:
+        if (line.startswith("ATOM") or line.startswith("HETATM") and line[21] != ligand_chain) or line.startswith("TER"):
+            pdb_content.append(line)
     return "".join(pdb_content)
 
 
@@ -685,28 +919,37 @@ def lignames_replacer(pdb_file, original_ligname, new_ligname):
     """
     with open(pdb_file) as pdb:
         content = pdb.readlines()
+    pdb_original = "".join(content)
     for index, line in enumerate(content):
         if line.startswith("HETATM"):
             line = line.replace(original_ligname, new_ligname)
             content[index] = line
     pdb_modified = "".join(content)
+    if pdb_modified == pdb_original:
+        return
     with open(pdb_file, "w") as overwrite_pdb:
         overwrite_pdb.write(pdb_modified)
+    parsed_pdb.forget(pdb_file)
 
 
-def check_and_fix_repeated_lignames(pdb1, pdb2, ligand_chain_1="L", ligand_chain_2="L", resnum_1=None, resnum_2=None):
+def check_and_fix_repeated_lignames(pdb1, pdb2, ligand_chain_1="L", ligand_chain_2="L", resnum_1=None, resnum_2=None,
+                                    structure_1=None, structure_2=None):
     """
     It checks if two pdbs have the same ligand name or if the pdb file 1 has as ligand name "GRW" and it is replaced
     by "LIG".
     :param pdb1: pdb file 1
     :param pdb2: pdb file 2
-    :return:
+    :param structure_1: ProDy molecule already parsed from pdb1. If set, the file is not parsed again.
+    :param structure_2: ProDy molecule already parsed from pdb2. If set, the file is not parsed again.
+    :return: True if the ligand name of pdb1 has been replaced (so it has to be parsed again), False otherwise.
     """
-    name_1 = extract_atoms_pdbs(pdb1, create_file=False, chain=ligand_chain_1, resnum=resnum_1)
-    name_2 = extract_atoms_pdbs(pdb2, create_file=False, chain=ligand_chain_2, resnum=resnum_2)
+    name_1 = extract_atoms_pdbs(pdb1, create_file=False, chain=ligand_chain_1, resnum=resnum_1, structure=structure_1)
+    name_2 = extract_atoms_pdbs(pdb2, create_file=False, chain=ligand_chain_2, resnum=resnum_2, structure=structure_2)
     if name_1 == name_2 or name_1 == "GRW":
         logging.warning("REPEATED NAMES IN LIGANDS FOR THE FILES: '{}' and '{}'. {} replaced by LIG ".format(pdb1, pdb2, name_1))
         lignames_replacer(pdb1, name_1, "LIG")
+        return True
+    return False
 
 
 def check_and_fix_resname(pdb_file, reschain, resnum):
@@ -721,13 +964,104 @@ def check_and_fix_resname(pdb_file, reschain, resnum):
                 line = "".join(line)
         new_pdb.append(line)
     pdb_modified = "".join(new_pdb)
+    if pdb_modified == "".join(content):
+        return
     with open(pdb_file, "w") as overwrite_pdb:
         overwrite_pdb.write(pdb_modified)
+    parsed_pdb.forget(pdb_file)
         
 
+def get_pose_filename(filename, pose):
+    """
+    :param filename: PDB file of the best pose of the fragment. str
+    :param pose: position of the pose (1 for the second best...). int
+    :return: PDB file of the pose. str
+    """
+    base, extension = os.path.splitext(filename)
+    return "{}_{}{}".format(base, pose, extension)
+
+
+def get_number_of_poses(placement_poses, cpus):
+    """
+    :param placement_poses: number of poses of the fragment requested. int
+    :param cpus: cores of the PELE simulations. One of them is the master, the others run one trajectory each. int
+    :return: number of poses that start the growing: at most one per trajectory, and at least one. int
+    """
+    return max(1, min(int(placement_poses), int(cpus) - 1))
+
+
+def get_initialization_pdbs(pdb_initialize, number=None):
+    """
+    :param pdb_initialize: PDB file of the best pose of the fragment, used to initialise the growing. str
+    :param number: maximum number of PDB files returned. By default, all of them. int
+    :return: list with pdb_initialize and the PDB files of the other poses written with it, from best to worst. list
+    """
+    pdbs = [pdb_initialize]
+    while os.path.exists(get_pose_filename(pdb_initialize, len(pdbs))) and (number is None or len(pdbs) < number):
+        pdbs.append(get_pose_filename(pdb_initialize, len(pdbs)))
+    return pdbs
+
+
+def remove_extra_poses(pdb_initialize):
+    """
+    It removes the PDB files of the other poses written by a previous pregrow with pdb_initialize.
+    :param pdb_initialize: PDB file of the best pose of the fragment. str
+    """
+    for pdb in get_initialization_pdbs(pdb_initialize)[1:]:
+        os.remove(pdb)
+
+
+def write_initialization_pdb(structure, frag_residue_name, pdb_atom_fragment_name, core_hydrogen_coords,
+                             fragment_resname, core_residue_name, core_chain, lambda_in, receptor_content,
+                             output_pdb, rename=False):
+    """
+    It reduces the size of the fragment of a pose, joins it with the core in a single molecule and writes it with
+    everything but the ligand of the complex, to initialise PELE simulations.
+    :param structure: ProDy molecule with the core and the fragment placed on it. Its coordinates are modified.
+    :param frag_residue_name: resname of the fragment. str
+    :param pdb_atom_fragment_name: PDB atom name of the fragment atom bonded to the core. str
+    :param core_hydrogen_coords: coordinates of the hydrogen of the core replaced by the fragment. np.array
+    :param fragment_resname: resname of the fragment in its ProDy molecule. str
+    :param core_residue_name: resname of the core. str
+    :param core_chain: chain of the ligand in the complex. str
+    :param lambda_in: proportion of reduction of the size of the fragment (between 0 and 1). float
+    :param receptor_content: PDB lines of everything but the ligand of the complex (see
+    get_everything_except_ligand). str
+    :param output_pdb: PDB file to write. str
+    :param rename: if set, the names of the pdb atom names will be replaced with "G+atom_number_fragment".
+    :return: dictionary with the atom names of the fragment that have been changed. dict
+    """
+    reduce_molecule_size(structure, frag_residue_name, lambda_in)
+    point_reference = structure.select("name {} and resname {}".format(pdb_atom_fragment_name, frag_residue_name))
+    fragment_segment = structure.select("resname {}".format(frag_residue_name))
+    translate_to_position(core_hydrogen_coords, point_reference.getCoords(), fragment_segment)
+
+    # Repeat all the preparation process to finish the writing of the molecule.
+    changing_names = pdb_joiner.extract_and_change_atomnames(structure, fragment_resname, core_residue_name,
+                                                             rename=rename)
+    molecule_names_changed, changing_names_dictionary = changing_names
+    finishing_joining(molecule_names_changed, core_chain)
+    logger.info("The result of core + fragment(small) has been saved in '{}'. This will be used to initialise the growing."
+                .format(output_pdb))
+    # Add the protein to the ligand (written in memory, without its header)
+    ligand_stream = io.StringIO()
+    prody.writePDBStream(ligand_stream, molecule_names_changed)
+    content_lig = "".join(ligand_stream.getvalue().splitlines(True)[1:])
+
+    # Join all parts of the PDB
+    output_file = []
+    output_file.append(receptor_content)
+    output_file.append("{}TER".format(content_lig))
+    out_joined = "".join(output_file)
+    with open(output_pdb, "w") as output:  # Save the file in the pregrow folder
+        output.write(out_joined)
+    return changing_names_dictionary
+
+
 def main(pdb_complex_core, pdb_fragment, pdb_atom_core_name, pdb_atom_fragment_name, lambda_in, core_chain="L",
          fragment_chain="L", output_file_to_tmpl="growing_result.pdb", output_file_to_grow="initialization_grow.pdb",
-         h_core=None, h_frag=None, rename=False, threshold_clash=None, output_path=None, only_grow=False, cov_res=None):
+         h_core=None, h_frag=None, rename=False, threshold_clash=None, output_path=None, only_grow=False, cov_res=None,
+         placement_poses=c.PLACEMENT_POSES, placement_conformers=c.PLACEMENT_CONFORMERS, protein_placement=True):
     """
     From a core (protein + ligand core = core_chain) and fragment (fragment_chain) pdb files, given the heavy atoms
     names that we want to connect, this function add the fragment to the core structure. We will get three PDB files:
@@ -760,6 +1094,11 @@ def main(pdb_complex_core, pdb_fragment, pdb_atom_core_name, pdb_atom_fragment_n
     :param rename: if set, the names of the pdb atom names will be replaced with "G+atom_number_fragment".
     :param threshold_clash: distance that will be used to identity which atoms are doing clashes between atoms of the
     fragment and the core.
+    :param placement_poses: number of poses of the fragment written to initialise PELE simulations. The best one in
+    output_file_to_grow and the others in output_file_to_grow with the suffix _1, _2... (see get_initialization_pdbs).
+    :param placement_conformers: number of conformers of the fragment (generated with RDKit) tried besides its
+    input pose.
+    :param protein_placement: if set, the poses of the fragment are also scored by their clashes with the receptor.
     :returns: [changing_names_dictionary, hydrogen_atoms, "{}.pdb".format(core_residue_name), output_file_to_tmpl,
     output_file_to_grow, core_original_atom, fragment_original_atom]
 
@@ -767,39 +1106,48 @@ def main(pdb_complex_core, pdb_fragment, pdb_atom_core_name, pdb_atom_fragment_n
     WORK_PATH = os.path.join(output_path, c.PRE_WORKING_DIR)
     if not os.path.exists(WORK_PATH):
         os.mkdir(WORK_PATH)
-    # Check that ligand names are not repeated
     if cov_res:
         core_chain, core_res = complex_to_prody.read_residue_string(cov_res)
         check_and_fix_resname(pdb_complex_core, core_chain, core_res)
-        check_and_fix_repeated_lignames(pdb_complex_core, pdb_fragment, core_chain, fragment_chain, core_res)
     else:
-        check_and_fix_repeated_lignames(pdb_complex_core, pdb_fragment, core_chain, fragment_chain)
         core_res = None
     for pdb_file in (pdb_complex_core, pdb_fragment):
         logging.info("Checking {} ...".format(pdb_file))
         checker.check_and_fix_pdbatomnames(pdb_file)
-    # Get the selected chain from the core and the fragment and convert them into ProDy molecules.
+    # Each input is parsed once (after fixing its names) and the whole pregrow works on these structures in memory.
+    # Only the core and the final structures are written. The parsed files are shared with the other stages of the
+    # growing (and with the next growings of a serie), so the pregrow works on copies that it can modify.
+    complex_structure = parsed_pdb.load(pdb_complex_core).get_structure(copy=True)
+    fragment_structure = parsed_pdb.load(pdb_fragment).get_structure(copy=True)
+    # Check that ligand names are not repeated
+    if check_and_fix_repeated_lignames(pdb_complex_core, pdb_fragment, core_chain, fragment_chain, core_res,
+                                       structure_1=complex_structure, structure_2=fragment_structure):
+        complex_structure = parsed_pdb.load(pdb_complex_core).get_structure(copy=True)
+    # Get the selected chain from the core and the fragment as ProDy molecules.
     if cov_res:
-        core = complex_to_prody.pdb_parser_residue(pdb_complex_core, core_chain, core_res)
+        core = complex_to_prody.pdb_parser_residue(pdb_complex_core, core_chain, core_res, structure=complex_structure)
     else:
-        core = complex_to_prody.pdb_parser_ligand(pdb_complex_core, core_chain)
-        # We will check that the structures are protonated. We will also create a new PDB file for each one and we will get
-        # the residue name of each ligand.
-    core_residue_name = extract_atoms_pdbs(pdb_complex_core, True, core_chain, resnum=core_res, output_folder=WORK_PATH)
-    fragment = complex_to_prody.pdb_parser_ligand(pdb_fragment, fragment_chain)
-    frag_residue_name = extract_atoms_pdbs(pdb_fragment, True, fragment_chain, resnum=None, output_folder=WORK_PATH)
-    # We will use the PDBs previously generated to get a list of Bio.PDB.Atoms for each structure
-    bioatoms_core_and_frag = from_pdb_to_bioatomlist([os.path.join(WORK_PATH, core_residue_name),
-                                                     os.path.join(WORK_PATH, frag_residue_name)])
+        core = complex_to_prody.pdb_parser_ligand(pdb_complex_core, core_chain, structure=complex_structure)
+    # We will check that the structures are protonated. We will also create a PDB file for the core (used to create
+    # its template) and we will get the residue name of each ligand.
+    core_residue_name = extract_atoms_pdbs(pdb_complex_core, True, core_chain, resnum=core_res, output_folder=WORK_PATH,
+                                           structure=complex_structure)
+    fragment = complex_to_prody.pdb_parser_ligand(pdb_fragment, fragment_chain, structure=fragment_structure)
+    frag_residue_name = extract_atoms_pdbs(pdb_fragment, False, fragment_chain, resnum=None,
+                                           structure=fragment_structure)
+    # We will use the ProDy molecules to get a list of Bio.PDB.Atoms for each structure
+    bioatoms_core_and_frag = from_prody_to_bioatomlist([core, fragment])
     # Then, we will have to transform the atom names of the core and the fragment to a list object
     # (format required by functions)
     pdb_atom_names = [pdb_atom_core_name, pdb_atom_fragment_name]
     # Using the Bio.PDB.Atoms lists and this names we will get the heavy atoms that we will use later to do the bonding
     heavy_atoms = extract_heavy_atoms(pdb_atom_names, bioatoms_core_and_frag)
     # Once we have the heavy atoms, for each structure we will obtain the hydrogens bonded to each heavy atom.
-    # We will need pdbs because we will use the information of the protein to select the hydrogens properly.
+    # We will need the whole structures because we will use the information of the protein to select the hydrogens
+    # properly (before join_structures, that changes the coordinates of the fragment).
     hydrogen_atoms = extract_hydrogens(pdb_atom_names, bioatoms_core_and_frag, [pdb_complex_core, pdb_fragment], h_core,
-                                       h_frag, core_chain, fragment_chain, core_res, None)
+                                       h_frag, core_chain, fragment_chain, core_res, None,
+                                       structures=[complex_structure, fragment_structure])
     # Create a list with the atoms that form a bond in core and fragment.
     core_bond = [heavy_atoms[0], hydrogen_atoms[0]]
     fragment_bond = [hydrogen_atoms[1], heavy_atoms[1]]  # This has to be in inverted order to do correctly the superimposition
@@ -813,28 +1161,28 @@ def main(pdb_complex_core, pdb_fragment, pdb_atom_core_name, pdb_atom_fragment_n
                                                                                              core_chain, fragment_chain,
                                                                                              output_path=WORK_PATH, only_grow=only_grow,
                                                                                              core_resnum=core_res)
-    prody.writePDB("merged.pdb", merged_structure[0])
     if not threshold_clash:
         clash_threshold = new_dist+0.01
     else:
         clash_threshold = threshold_clash
     if not only_grow:
-        # It is possible to create intramolecular clashes after placing the fragment on the bond of the core, so we will
-        # check if this is happening, and if it is, we will perform rotations of 10º until avoid the clash.
-        check_results = check_collision(merged_structure=merged_structure[0], bond=heavy_atoms, theta=0,
-                                        theta_interval=math.pi/18, core_bond=core_bond, list_of_atoms=bioatoms_core_and_frag[1],
-                                        fragment_bond=fragment_bond, core_structure=core, fragment_structure=fragment,
-                                        pdb_complex=pdb_complex_core, pdb_fragment=pdb_fragment, chain_complex=core_chain,
-                                        chain_fragment=fragment_chain, output_path=WORK_PATH, threshold_clash=clash_threshold,
-                                        only_grow=only_grow, debug=False)
-        # If we do not find a solution in the previous step, we will repeat the rotations applying only increments of 1º
-        if not check_results:
-            check_results = check_collision(merged_structure=merged_structure[0], bond=heavy_atoms, theta=0,
-                                            theta_interval=math.pi/180, core_bond=core_bond, list_of_atoms=bioatoms_core_and_frag[1],
-                                            fragment_bond=fragment_bond, core_structure=core, fragment_structure=fragment,
-                                            pdb_complex=pdb_complex_core, pdb_fragment=pdb_fragment, chain_complex=core_chain,
-                                            chain_fragment=fragment_chain, output_path=WORK_PATH,
-                                            threshold_clash=clash_threshold, only_grow=only_grow, debug=False)
+        # It is possible to create clashes after placing the fragment on the bond of the core, so all its rotations
+        # around the bond (steps of 10º and then of 1º), of the input pose and of each conformer, are scored at once
+        # against the core and the receptor, and the best ones are used.
+        if protein_placement:
+            receptor = get_receptor_index(pdb_complex_core, core_chain, core_res)
+        else:
+            receptor = None
+        conformers = []
+        if placement_conformers and RDKIT:
+            fragment_placed = merged_structure[0].select("resname {}".format(frag_residue_name))
+            conformers = get_fragment_conformers(pdb_fragment, fragment_chain, list(fragment_placed.getNames()),
+                                                 fragment_placed.getCoords(), heavy_atoms[1].name,
+                                                 placement_conformers)
+        structures = place_fragment(merged_structure=merged_structure[0], bond=heavy_atoms,
+                                    threshold_clash=clash_threshold, receptor=receptor, conformers=conformers,
+                                    number_of_poses=max(placement_poses, 1))
+        check_results = structures[0] if structures else None
 
         # Now, we want to extract this structure in a PDB to create the template file after the growing. We will do a copy
         # of the structure because then we will need to resize the fragment part, so be need to keep it as two different
@@ -864,37 +1212,21 @@ We are currently working to fix this automatically")
         prody.writePDB(os.path.join(WORK_PATH, output_file_to_tmpl), molecule_names_changed)
         logger.info("The result of core + fragment has been saved in '{}'. This will be used to create the template file."
                     .format(os.path.join(WORK_PATH, output_file_to_tmpl)))
-        # Now, we will use the original molecule to do the resizing of the fragment.
-        reduce_molecule_size(check_results, frag_residue_name, lambda_in)
-        point_reference = check_results.select("name {} and resname {}".format(pdb_atom_fragment_name, frag_residue_name))
-        fragment_segment = check_results.select("resname {}".format(frag_residue_name))
-        translate_to_position(hydrogen_atoms[0].get_coord(), point_reference.getCoords(), fragment_segment)
-
-        # Repeat all the preparation process to finish the writing of the molecule.
-        changing_names = pdb_joiner.extract_and_change_atomnames(check_results, fragment.getResnames()[0], core_residue_name, rename=rename)
-        molecule_names_changed, changing_names_dictionary = changing_names
-        finishing_joining(molecule_names_changed, core_chain)
-        logger.info("The result of core + fragment(small) has been saved in '{}'. This will be used to initialise the growing."
-                    .format(os.path.join(WORK_PATH, output_file_to_grow)))
-        # Add the protein to the ligand
-        output_ligand_grown_path = os.path.join(WORK_PATH, "ligand_grown.pdb")
-        prody.writePDB(output_ligand_grown_path, molecule_names_changed)
-
-        with open(output_ligand_grown_path) as lig:
-            content_lig = lig.readlines()
-            content_lig = content_lig[1:]
-            content_lig = "".join(content_lig)
-
-        # Join all parts of the PDB
-        output_file = []
-        chain_not_lig = get_everything_except_ligand(pdb_complex_core, core_chain)
-        output_file.append(chain_not_lig)
-        output_file.append("{}TER".format(content_lig))
-        out_joined = "".join(output_file)
-        with open(os.path.join(WORK_PATH, output_file_to_grow), "w") as output: # Save the file in the pregrow folder
-            output.write(out_joined)
-        # Make a copy of output files in the main directory
-        shutil.copy(os.path.join(WORK_PATH, output_file_to_grow), ".")  # We assume that the user will be running FrAG in PELE's main folder...
+        # Now, we will use the original molecule to do the resizing of the fragment, and the other poses (if any) the
+        # same way. Each one is written in its own PDB file to initialise the growing.
+        remove_extra_poses(os.path.join(WORK_PATH, output_file_to_grow))
+        remove_extra_poses(os.path.join(output_path, output_file_to_grow))
+        receptor_content = get_everything_except_ligand(pdb_complex_core, core_chain)
+        for n, structure in enumerate(structures):
+            output_file = output_file_to_grow if n == 0 else get_pose_filename(output_file_to_grow, n)
+            names_dictionary = write_initialization_pdb(structure, frag_residue_name, pdb_atom_fragment_name,
+                                                        hydrogen_atoms[0].get_coord(), fragment.getResnames()[0],
+                                                        core_residue_name, core_chain, lambda_in, receptor_content,
+                                                        os.path.join(WORK_PATH, output_file), rename=rename)
+            if n == 0:
+                changing_names_dictionary = names_dictionary
+            # Make a copy of output files in the working directory
+            shutil.copy(os.path.join(WORK_PATH, output_file), output_path)  # In the working folder, where PELE runs
         # In further steps we will probably need to recover the names of the atoms for the fragment, so for this reason we
         # are returning this dictionary in the function.
         with open(os.path.join(WORK_PATH, "changingatoms.dict"), "wb") as pkl:
@@ -7,7 +7,8 @@ import pandas as pd
 import glob
 import re
 import sys
-import socket
+# Local imports
+import frag_pele.constants as c
 
 """
 
@@ -21,7 +22,6 @@ import socket
    For any problem do not hesitate to contact us through the email address written below.
 
 """
-machine = socket.getfqdn()
 __author__ = "Daniel Soler Viladrich"
 __email__ = "daniel.soler@nostrumbiodiscovery.com"
 
@@ -34,17 +34,22 @@ FREQ = 1
 REPORT = "report"
 TRAJ = "trajectory"
 ACCEPTED_STEPS = 'numberOfAcceptedPeleSteps'
-if "bsccv" in machine:
-    ACCEPTED_STEPS = 'AcceptedSteps'
 DIR = os.path.abspath(os.getcwd())
 
 
+def get_accepted_steps_column():
+    # The host is only looked up when the column is not given
+    if "bsccv" in c.get_machine():
+        return 'AcceptedSteps'
+    return ACCEPTED_STEPS
+
+
 def parse_args():
 
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", type=str, help="Criteria we want to rank and output the strutures for. Must be a clumn of the report. i.e: Binding Energy")
     parser.add_argument("crit", type=str, nargs='+', help="Criteria we want to rank and output the strutures for. Must be a clumn of the report. i.e: Binding Energy")
-    parser.add_argument("--steps", "-as", type=str, help="Name of the accepted steps column in the report files. i.e: numberOfAcceptedPeleSteps", default=ACCEPTED_STEPS)
+    parser.add_argument("--steps", "-as", type=str, help="Name of the accepted steps column in the report files. i.e: numberOfAcceptedPeleSteps", default=None)
     parser.add_argument("--path", type=str, help="Path to Pele's results root folder i.e: path=/Pele/results/", default=DIR)
     parser.add_argument("--nst", "-n", type=int, help="Number of produced structures. i.e: 20" , default=N_STRUCTS)
     parser.add_argument("--sort", "-s", type=str, help="Look for minimum or maximum value --> Options: [min/max]. i.e: max", default=ORDER)
@@ -56,7 +61,7 @@ def parse_args():
     return args.filename, os.path.abspath(args.path), " ".join(args.crit), args.nst, args.sort, args.ofreq, args.out, args.steps, args.numfolders
 
 
-def main(criteria, file_name, path=DIR, n_structs=10, sort_order="min", out_freq=FREQ, output="".join(CRITERIA), steps = ACCEPTED_STEPS, numfolders=False):
+def main(criteria, file_name, path=DIR, n_structs=10, sort_order="min", out_freq=FREQ, output="".join(CRITERIA), steps=None, numfolders=False):
     """
 
       Description: Rank the traj found in the report files under path
@@ -87,6 +92,8 @@ def main(criteria, file_name, path=DIR, n_structs=10, sort_order="min", out_freq
     except IndexError:
         raise IndexError("Not report file found. Check you are in adaptive's or Pele root folder")
 
+    if steps is None:
+        steps = get_accepted_steps_column()
     # Data Mining
     min_values, steps = parse_values(reports, n_structs, criteria, sort_order, steps)
     values = min_values[criteria].tolist()
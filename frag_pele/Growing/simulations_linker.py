@@ -1,11 +1,17 @@
 # General imports
 import os
+import sys
+import time
+import signal
 import shutil
+import asyncio
 import subprocess
 import logging
 
 # Local imports
 import frag_pele.Helpers.templatize as tp
+import frag_pele.Helpers.timings as timings
+import frag_pele.constants as c
 
 # Getting the name of the module for the log system
 logger = logging.getLogger(__name__)
@@ -85,7 +91,107 @@ def control_file_modifier(control_template, pdb, license, working_dir, overlap=0
     return simulation_file
 
 
-def simulation_runner(path_to_pele, control_in, cpus=4, srun=True):
+class PeleBackend(object):
+    """
+    Way of launching PELE. Each backend builds the command line that runs a control file with a number of cores.
+    """
+    name = None
+
+    def __init__(self, path_to_pele=None):
+        self.path_to_pele = path_to_pele
+
+    def get_command(self, control_in, cpus):
+        """
+        :param control_in: control file of the simulation. str
+        :param cpus: cores used by the simulation. int
+        :return: list with the command and its arguments, or None if the simulation can not be run. list
+        """
+        raise NotImplementedError()
+
+
+class SerialBackend(PeleBackend):
+    name = "serial"
+
+    def get_command(self, control_in, cpus=1):
+        logger.info("Starting PELE simulation. You will run serial PELE.")
+        return [self.path_to_pele, control_in]
+
+
+class MpirunBackend(PeleBackend):
+    name = "mpirun"
+    launcher = "mpirun"
+
+    def get_command(self, control_in, cpus=4):
+        cpus = int(cpus)
+        if cpus < 2:
+            logger.critical("Sorry, to run PELE with paralel processors you need at least 2 cores!")
+            return None
+        logger.info("Starting PELE simulation. You will run {} with {} cores.".format(self.launcher, cpus))
+        return [self.launcher, "-n", str(cpus), self.path_to_pele, control_in]
+
+
+class SrunBackend(MpirunBackend):
+    name = "srun"
+    launcher = "srun"
+
+
+class FakePeleBackend(PeleBackend):
+    """
+    Runs frag_pele.Helpers.fake_pele instead of PELE: synthetic reports and trajectories are written, with the same
+    number of trajectories than a real simulation with the same cores (see fake_pele for more information).
+    """
+    name = "fake"
+
+    def __init__(self, path_to_pele=None, step_time=c.FAKE_PELE_STEP_TIME):
+        super(FakePeleBackend, self).__init__(path_to_pele)
+        self.step_time = step_time
+
+    def get_command(self, control_in, cpus=4):
+        logger.info("Starting fake PELE simulation with {} processors.".format(cpus or 1))
+        # Run as a script, so it does not depend on the directory where it is launched
+        fake_pele = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Helpers",
+                                 "fake_pele.py")
+        return [sys.executable, fake_pele, control_in, "--processors", str(cpus or 1),
+                "--step_time", str(self.step_time)]
+
+
+BACKENDS = {backend.name: backend for backend in (SerialBackend, MpirunBackend, SrunBackend, FakePeleBackend)}
+
+
+def get_backend(path_to_pele, backend=None, cpus=4, srun=True):
+    """
+    :param path_to_pele: path to PELE executable. str
+    :param backend: name of the backend (see BACKENDS) or a PeleBackend instance. If None, the backend is chosen as in
+    previous versions: srun or mpirun (depending on srun flag) if cpus is set, serial otherwise.
+    :return: PeleBackend
+    """
+    if isinstance(backend, PeleBackend):
+        return backend
+    if backend is None:
+        if not cpus:
+            backend = SerialBackend.name
+        elif srun:
+            backend = SrunBackend.name
+        else:
+            backend = MpirunBackend.name
+    try:
+        return BACKENDS[backend](path_to_pele)
+    except KeyError:
+        raise ValueError("Unknown PELE backend '{}'. Available: {}".format(backend, ", ".join(sorted(BACKENDS))))
+
+
+def get_simulation_command(path_to_pele, control_in, cpus=4, srun=True, backend=None):
+    """
+    It builds the command line to run PELE with the selected backend (see get_backend).
+    :return: list with the command and its arguments. list
+    """
+    cmd = get_backend(path_to_pele, backend, cpus, srun).get_command(control_in, cpus)
+    if cmd:
+        logger.info("Running {}".format(" ".join(cmd)))
+    return cmd
+
+
+def simulation_runner(path_to_pele, control_in, cpus=4, srun=True, backend=None, cwd=None):
     """
     Runs a PELE simulation with the parameters described in the input control file.
 
@@ -94,24 +200,229 @@ def simulation_runner(path_to_pele, control_in, cpus=4, srun=True):
     path_to_pele --> Complete path to PELE folder
 
     control_in --> Name of the control file with the parameters to run PELE
+
+    backend --> Name of the backend used to launch PELE (srun, mpirun, serial or fake) or PeleBackend
+
+    cwd --> Directory where PELE is run (the working directory of the growing, with its DataLocal folder). By default,
+    the current one
+
+    Output: exit code of PELE (None if it could not be launched)
     """
-    if cpus:
-        cpus = int(cpus)
-        if cpus < 2:
-            logger.critical("Sorry, to run PELE with paralel processors you need at least 2 cores!")
+    cmd = get_simulation_command(path_to_pele, control_in, cpus, srun, backend)
+    if cmd:
+        return_code = subprocess.call(cmd, cwd=cwd)
+        if return_code:
+            logger.error("PELE simulation {} finished with exit code {}".format(control_in, return_code))
+        return return_code
+
+
+class SimulationResult(object):
+    """
+    Result of a PELE simulation launched with run_simulation_async.
+    """
+    def __init__(self, control_file, command, return_code, duration, peak_rss, log_file, timed_out=False):
+        self.control_file = control_file
+        self.command = command
+        self.return_code = return_code
+        self.duration = duration  # seconds
+        self.peak_rss = peak_rss  # kB, of the processes running in this node
+        self.log_file = log_file
+        self.timed_out = timed_out
+
+    @property
+    def succeeded(self):
+        return self.return_code == 0 and not self.timed_out
+
+    def __repr__(self):
+        return "SimulationResult({}: return code {}, {:.1f} s, {} kB{})".format(
+            self.control_file, self.return_code, self.duration, self.peak_rss, ", timed out" if self.timed_out else "")
+
+
+class CoreLimiter(object):
+    """
+    Limits the number of cores used by the simulations running at the same time. Each simulation acquires its cores
+    before starting and releases them when it finishes.
+    """
+    def __init__(self, total_cpus):
+        self.total_cpus = int(total_cpus)
+        self.available = int(total_cpus)
+        self.condition = None
+
+    def get_condition(self):
+        # Created lazily so it belongs to the running event loop
+        if self.condition is None:
+            self.condition = asyncio.Condition()
+        return self.condition
+
+    async def acquire(self, cpus):
+        cpus = min(max(int(cpus), 1), self.total_cpus)
+        condition = self.get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self.available >= cpus)
+            self.available -= cpus
+        return cpus
+
+    async def release(self, cpus):
+        condition = self.get_condition()
+        async with condition:
+            self.available += cpus
+            condition.notify_all()
+
+
+def get_process_tree_rss(pid):
+    """
+    :param pid: process id. int
+    :return: resident memory (kB) of the process and all its descendants, read from /proc, or None if there is no
+    /proc (p.ex. macOS). int
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    rss = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/{}/status".format(entry)) as status:
+                fields = dict([line.split(":", 1) for line in status if ":" in line])
+        except (IOError, OSError):
+            continue  # The process finished while reading
+        children.setdefault(int(fields["PPid"]), []).append(int(entry))
+        rss[int(entry)] = int(fields["VmRSS"].split()[0]) if "VmRSS" in fields else 0
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += rss.get(current, 0)
+        pending.extend(children.get(current, []))
+    return total
+
+
+async def sample_peak_rss(pid, interval):
+    """
+    :return: peak resident memory (kB) of the process tree until the task is cancelled, or None if it can not be read
+    from /proc. int
+    """
+    peak = 0
+    try:
+        while True:
+            rss = get_process_tree_rss(pid)
+            if rss is None:
+                return None
+            peak = max(peak, rss)
+            await asyncio.sleep(interval)
+    except asyncio.CancelledError:
+        return peak
+
+
+def get_sampled_rss(sampler, control_in):
+    """
+    :param sampler: finished task of sample_peak_rss.
+    :param control_in: control file of the simulation. str
+    :return: peak resident memory (kB) of the simulation. Without /proc, or if the sampling failed, the peak of the
+    biggest finished child of this process. int
+    """
+    peak_rss = None
+    if not sampler.cancelled():
+        if sampler.exception() is not None:
+            logger.warning("The memory used by {} could not be sampled: {}".format(control_in, sampler.exception()))
         else:
-            if srun:
-                logger.info("Starting PELE simulation. You will run srun with {} cores.".format(cpus))
-                cmd = "srun -n {} {} {}".format(cpus, path_to_pele, control_in)
-                logger.info("Running {}".format(cmd))
-                subprocess.call(cmd.split())
-            else:
-                logger.info("Starting PELE simulation. You will run mpirun with {} cores.".format(cpus))
-                cmd = "mpirun -n {} {} {}".format(cpus, path_to_pele, control_in)
-                logger.info("Running {}".format(cmd))
-                subprocess.call(cmd.split())
+            peak_rss = sampler.result()
+    if peak_rss is None:
+        peak_rss = timings.get_peak_rss()[1]
+    return peak_rss
+
+
+async def run_simulation_async(path_to_pele, control_in, cpus=4, srun=True, limiter=None, log_file=None, timeout=None,
+                               cwd=None, sampling_interval=1.0, backend=None):
+    """
+    Launches a PELE simulation as an asyncio subprocess without blocking the event loop.
+    :param path_to_pele: path to PELE executable. str
+    :param control_in: control file of the simulation. str
+    :param cpus: cores used by the simulation. int
+    :param srun: if set, PELE is launched with srun, otherwise with mpirun. bool
+    :param limiter: CoreLimiter shared by the simulations. The simulation waits until its cores are available.
+    :param log_file: file where the stdout and stderr of PELE are written. By default, the control file with ".log"
+    extension. str
+    :param timeout: maximum wall-clock seconds of the simulation. When reached, the simulation is terminated. float
+    :param cwd: directory where the simulation is run. str
+    :param sampling_interval: seconds between each measure of the memory used. float
+    :param backend: name of the backend used to launch PELE or PeleBackend (see get_backend).
+    :return: SimulationResult
+    """
+    cmd = get_simulation_command(path_to_pele, control_in, cpus, srun, backend)
+    if log_file is None:
+        log_file = "{}.log".format(os.path.splitext(control_in)[0])
+    if not cmd:
+        return SimulationResult(control_in, cmd, None, 0., 0, log_file)
+    acquired = 0
+    if limiter is not None:
+        acquired = await limiter.acquire(cpus or 1)
+    try:
+        start_time = time.time()
+        timed_out = False
+        with open(log_file, "w") as log:
+            process = await asyncio.create_subprocess_exec(*cmd, stdout=log, stderr=asyncio.subprocess.STDOUT,
+                                                           cwd=cwd, start_new_session=True)
+            sampler = asyncio.ensure_future(sample_peak_rss(process.pid, sampling_interval))
+            try:
+                return_code = await asyncio.wait_for(process.wait(), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                logger.error("PELE simulation {} exceeded the time limit of {} s. Terminating it.".format(control_in,
+                                                                                                         timeout))
+                terminate_process_group(process.pid, signal.SIGTERM)
+                try:
+                    return_code = await asyncio.wait_for(process.wait(), 30)
+                except asyncio.TimeoutError:
+                    terminate_process_group(process.pid, signal.SIGKILL)
+                    return_code = await process.wait()
+            sampler.cancel()
+            await asyncio.wait([sampler])
+            peak_rss = get_sampled_rss(sampler, control_in)
+        result = SimulationResult(control_in, cmd, return_code, time.time() - start_time, peak_rss, log_file,
+                                  timed_out)
+    finally:
+        if acquired:
+            await limiter.release(acquired)
+    if not result.succeeded:
+        logger.error("PELE simulation failed: {}. Check {}".format(result, log_file))
     else:
-        logger.info("Starting PELE simulation. You will run serial PELE.")
-        cmd = "{} {}".format(path_to_pele, control_in)
-        logger.info("Running {}".format(cmd))
-        subprocess.call(cmd.split())
+        logger.info("PELE simulation finished: {}".format(result))
+    return result
+
+
+def terminate_process_group(pid, signal_number):
+    try:
+        os.killpg(os.getpgid(pid), signal_number)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def run_simulations_async(simulations, total_cpus=None, timeout=None, srun=True, backend=None):
+    """
+    Runs several PELE simulations at the same time, without using more than total_cpus cores.
+    :param simulations: list of dictionaries with the arguments of run_simulation_async (path_to_pele, control_in,
+    cpus and, optionally, log_file, timeout and cwd). list
+    :param total_cpus: cores that can be used at the same time. By default, all the cores of the node. int
+    :param timeout: default wall-clock limit (seconds) of each simulation. float
+    :param srun: default launcher of the simulations. bool
+    :param backend: default backend of the simulations. str
+    :return: list of SimulationResult, in the same order than simulations.
+    """
+    limiter = CoreLimiter(total_cpus or os.cpu_count() or 1)
+    tasks = []
+    for simulation in simulations:
+        simulation = dict(simulation)
+        simulation.setdefault("timeout", timeout)
+        simulation.setdefault("srun", srun)
+        simulation.setdefault("backend", backend)
+        tasks.append(run_simulation_async(limiter=limiter, **simulation))
+    return await asyncio.gather(*tasks)
+
+
+def run_simulations(simulations, total_cpus=None, timeout=None, srun=True, backend=None):
+    """
+    Blocking version of run_simulations_async, to be called from synchronous code.
+    """
+    return asyncio.run(run_simulations_async(simulations, total_cpus, timeout, srun, backend))
@@ -0,0 +1,272 @@
+import logging
+import numpy as np
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+# Columns of TemplateArrays.nbon, in the order of the NBON section
+NBON_PARAMETERS = ("sigma", "epsilon", "charge", "radnpSGB", "radnpType", "sgbnpGamma", "sgbnpType")
+SIGMA, EPSILON, CHARGE, RADNPSGB, RADNPTYPE, SGBNPGAMMA, SGBNPTYPE = range(len(NBON_PARAMETERS))
+# Columns scaled by the growing protocols, in the order they were modified one by one
+SCALED_NBON = [EPSILON, SIGMA, CHARGE, SGBNPGAMMA, SGBNPTYPE, RADNPSGB, RADNPTYPE]
+
+
+class TemplateArrays(object):
+    """
+    Columnar representation of a template_fragmenter.TemplateImpact: the NBON parameters, bonds, angles and dihedrals
+    are NumPy arrays (one row per atom, bond, angle or dihedral, in the order of the template) with boolean masks of
+    the fragment and linker atoms and bonds. The growing protocols scale whole columns at once instead of looping over
+    the Atom, Bond, Theta and Phi objects. The values are read from a TemplateImpact and written back to it with
+    to_template, so it keeps writing the same files.
+    """
+    def __init__(self, template):
+        """
+        :param template: template with the is_fragment and is_linker flags already set. TemplateImpact
+        """
+        self.template = template
+        atoms = list(template.list_of_atoms.values())
+        self.atom_ids = np.array([atom.atom_id for atom in atoms], dtype=int)
+        self.atom_names = [atom.pdb_atom_name for atom in atoms]
+        self.atom_rows = {atom_id: row for row, atom_id in enumerate(self.atom_ids)}
+        self.nbon = np.array([[getattr(atom, parameter) for parameter in NBON_PARAMETERS] for atom in atoms],
+                             dtype=float).reshape(-1, len(NBON_PARAMETERS))
+        self.is_fragment = np.array([atom.is_fragment for atom in atoms], dtype=bool)
+        self.is_linker = np.array([atom.is_linker for atom in atoms], dtype=bool)
+        bonds = list(template.list_of_bonds.values())
+        self.bond_atoms = np.array([[bond.atom1, bond.atom2] for bond in bonds], dtype=int).reshape(-1, 2)
+        self.bond_spring = np.array([bond.spring for bond in bonds], dtype=float)
+        self.bond_eq_dist = np.array([bond.eq_dist for bond in bonds], dtype=float)
+        self.bond_is_fragment = np.array([bond.is_fragment for bond in bonds], dtype=bool)
+        self.bond_is_linker = np.array([bond.is_linker for bond in bonds], dtype=bool)
+        thetas = list(template.list_of_thetas.values())
+        self.theta_atoms = np.array([[theta.atom1, theta.atom2, theta.atom3] for theta in thetas],
+                                    dtype=int).reshape(-1, 3)
+        self.theta_spring = np.array([theta.spring for theta in thetas], dtype=float)
+        self.theta_eq_angle = np.array([theta.eq_angle for theta in thetas], dtype=float)
+        # The atoms of the dihedrals keep their sign (negative ids are used by PELE)
+        self.phi_atoms = np.array([[phi.atom1, phi.atom2, phi.atom3, phi.atom4] for phi in template.list_of_phis],
+                                  dtype=int).reshape(-1, 4)
+        self.phi_constant = np.array([phi.constant for phi in template.list_of_phis], dtype=float)
+        self.phi_nterm = np.array([phi.nterm for phi in template.list_of_phis], dtype=float)
+        self.iphi_atoms = np.array([[phi.atom1, phi.atom2, phi.atom3, phi.atom4] for phi in template.list_of_iphis],
+                                   dtype=int).reshape(-1, 4)
+        self.iphi_constant = np.array([phi.constant for phi in template.list_of_iphis], dtype=float)
+
+    def copy(self):
+        """
+        :return: arrays with copies of the values, linked to the same template. TemplateArrays
+        """
+        arrays = TemplateArrays.__new__(TemplateArrays)
+        for attribute, value in self.__dict__.items():
+            setattr(arrays, attribute, value.copy() if isinstance(value, np.ndarray) else value)
+        return arrays
+
+    def check_values(self):
+        """
+        :return: list with the names of the parameters with non finite values (nan or inf). list
+        """
+        wrong = [NBON_PARAMETERS[column] for column in range(self.nbon.shape[1])
+                 if not np.all(np.isfinite(self.nbon[:, column]))]
+        for name in ("bond_spring", "bond_eq_dist", "theta_spring", "theta_eq_angle", "phi_constant",
+                     "iphi_constant"):
+            if not np.all(np.isfinite(getattr(self, name))):
+                wrong.append(name)
+        return wrong
+
+    def get_names(self, atom_ids):
+        """
+        :param atom_ids: array of atom ids (of bonds, angles or dihedrals). np.array
+        :return: PDB atom names of each row, sorted, to find the same term in another template. list of tuples
+        """
+        return [tuple(sorted([self.atom_names[self.atom_rows[abs(int(atom_id))]] for atom_id in row]))
+                for row in atom_ids]
+
+    def to_template(self, template=None):
+        """
+        It writes the values of the arrays back to the objects of the template.
+        :param template: template to update. By default, the one the arrays were read from. TemplateImpact
+        :return: the template. TemplateImpact
+        """
+        template = template or self.template
+        for atom, values, is_fragment, is_linker in zip(template.list_of_atoms.values(), self.nbon.tolist(),
+                                                        self.is_fragment.tolist(), self.is_linker.tolist()):
+            for parameter, value in zip(NBON_PARAMETERS, values):
+                setattr(atom, parameter, value)
+            atom.is_fragment, atom.is_linker = is_fragment, is_linker
+        for bond, spring, eq_dist, is_fragment, is_linker in zip(template.list_of_bonds.values(),
+                                                                 self.bond_spring.tolist(),
+                                                                 self.bond_eq_dist.tolist(),
+                                                                 self.bond_is_fragment.tolist(),
+                                                                 self.bond_is_linker.tolist()):
+            bond.spring, bond.eq_dist, bond.is_fragment, bond.is_linker = spring, eq_dist, is_fragment, is_linker
+        for theta, spring, eq_angle in zip(template.list_of_thetas.values(), self.theta_spring.tolist(),
+                                           self.theta_eq_angle.tolist()):
+            theta.spring, theta.eq_angle = spring, eq_angle
+        for phi, constant in zip(template.list_of_phis, self.phi_constant.tolist()):
+            phi.constant = constant
+        for phi, constant in zip(template.list_of_iphis, self.iphi_constant.tolist()):
+            phi.constant = constant
+        return template
+
+
+def get_matches(keys_grown, keys_core, selected=None):
+    """
+    Pairs each row of the grown template with the rows of the core template that have the same key (p.ex. the sorted
+    PDB atom names of a bond). As the original loops, when several core rows match the same grown row they are applied
+    one after the other, so the pairs are split in passes with at most one core row per grown row.
+    :param keys_grown: key of each row of the grown template. list
+    :param keys_core: key of each row of the core template. list
+    :param selected: mask of the grown rows that can be modified. np.array
+    :return: list of (grown rows, core rows) arrays, one for each pass. list
+    """
+    core_rows = {}
+    for row, key in enumerate(keys_core):
+        core_rows.setdefault(key, []).append(row)
+    matches = [(row, core_rows.get(key, [])) for row, key in enumerate(keys_grown)
+               if selected is None or selected[row]]
+    passes = []
+    for n in range(max([len(rows) for row, rows in matches] + [0])):
+        pairs = [(row, rows[n]) for row, rows in matches if len(rows) > n]
+        passes.append((np.array([row for row, _ in pairs], dtype=int), np.array([row for _, row in pairs], dtype=int)))
+    return passes
+
+
+def interpolate(values_core, values_grown, lambda_to_reduce):
+    """
+    Same operations as ReduceLinearly.reduce_value_from_diference, so the results are identical.
+    """
+    return ((values_grown - values_core) * lambda_to_reduce) + values_core
+
+
+def modify_core_parameters(grown, core, lambda_to_reduce, exp_charges=False):
+    """
+    Vectorized modify_core_parameters_linearly: the parameters of the core atoms, bonds, angles and dihedrals of the
+    grown template are interpolated from the ones of the core template.
+    :param grown: arrays of the grown template. TemplateArrays
+    :param core: arrays of the core template. TemplateArrays
+    :param lambda_to_reduce: lambda of the growing step. float
+    :param exp_charges: if set, the charges are interpolated with lambda ** 2. bool
+    """
+    charges_lambda = lambda_to_reduce ** 2 if exp_charges else lambda_to_reduce
+    for rows_g, rows_c in get_matches(grown.atom_names, core.atom_names, ~grown.is_fragment):
+        in_core = ~core.is_fragment[rows_c]  # Only the core atoms of the initial template
+        rows_g, rows_c = rows_g[in_core], rows_c[in_core]
+        for column in SCALED_NBON:
+            grown.nbon[rows_g, column] = interpolate(core.nbon[rows_c, column], grown.nbon[rows_g, column],
+                                                     charges_lambda if column == CHARGE else lambda_to_reduce)
+    for rows_g, rows_c in get_matches(grown.get_names(grown.bond_atoms), core.get_names(core.bond_atoms),
+                                      ~grown.bond_is_linker):
+        grown.bond_eq_dist[rows_g] = interpolate(core.bond_eq_dist[rows_c], grown.bond_eq_dist[rows_g],
+                                                 lambda_to_reduce)
+    for rows_g, rows_c in get_matches(grown.get_names(grown.theta_atoms), core.get_names(core.theta_atoms)):
+        grown.theta_spring[rows_g] = interpolate(core.theta_spring[rows_c], grown.theta_spring[rows_g],
+                                                 lambda_to_reduce)
+        grown.theta_eq_angle[rows_g] = interpolate(core.theta_eq_angle[rows_c], grown.theta_eq_angle[rows_g],
+                                                   lambda_to_reduce)
+    phi_keys_grown = list(zip(grown.get_names(grown.phi_atoms), grown.phi_nterm.tolist()))
+    phi_keys_core = list(zip(core.get_names(core.phi_atoms), core.phi_nterm.tolist()))
+    for rows_g, rows_c in get_matches(phi_keys_grown, phi_keys_core):
+        grown.phi_constant[rows_g] = interpolate(core.phi_constant[rows_c], grown.phi_constant[rows_g],
+                                                 lambda_to_reduce)
+
+
+def reduce_fragment_parameters(grown, lambda_to_reduce, exp_charges=False, null_charges=False, columns=SCALED_NBON):
+    """
+    Vectorized reduce_fragment_parameters_linearly: the NBON parameters and bond lengths of the fragment are scaled by
+    lambda.
+    :param grown: arrays of the grown template. TemplateArrays
+    :param lambda_to_reduce: lambda of the growing step. float
+    :param exp_charges: if set, the charges are scaled by lambda ** 2. bool
+    :param null_charges: if set, the charges of the fragment are 0. bool
+    :param columns: NBON parameters scaled. list
+    """
+    fragment = grown.is_fragment
+    for column in columns:
+        if column == CHARGE and null_charges:
+            grown.nbon[fragment, column] = 0.000
+        elif column == CHARGE and exp_charges:
+            grown.nbon[fragment, column] = grown.nbon[fragment, column] * (lambda_to_reduce ** 2)
+        else:
+            grown.nbon[fragment, column] = grown.nbon[fragment, column] * lambda_to_reduce
+    grown.bond_eq_dist[grown.bond_is_fragment] = grown.bond_eq_dist[grown.bond_is_fragment] * lambda_to_reduce
+
+
+def modify_linker_bonds(grown, core, lambda_to_reduce, atom_to_replace):
+    """
+    Vectorized modify_linkers_parameters_linearly: the length of the bond between the core and the fragment is
+    interpolated from the bond of the core with the hydrogen replaced by the fragment.
+    :param grown: arrays of the grown template. TemplateArrays
+    :param core: arrays of the core template. TemplateArrays
+    :param lambda_to_reduce: lambda of the growing step. float
+    :param atom_to_replace: PDB atom name (without "_") of the hydrogen of the core replaced by the fragment. str
+    """
+    core_names = [[core.atom_names[core.atom_rows[atom_id]] for atom_id in row] for row in core.bond_atoms.tolist()]
+    with_hydrogen = np.array([atom_to_replace in [name.strip("_") for name in names] for names in core_names],
+                             dtype=bool)
+    for row in np.nonzero(grown.bond_is_linker)[0]:
+        names_g = [grown.atom_names[grown.atom_rows[atom_id]] for atom_id in grown.bond_atoms[row].tolist()]
+        # Each core bond is applied once for each of its atoms that is also in the linker bond
+        times = np.array([len([name for name in names if name in names_g]) for names in core_names], dtype=int)
+        for core_row in np.repeat(np.arange(len(core_names)), times * with_hydrogen).tolist():
+            grown.bond_eq_dist[row] = interpolate(core.bond_eq_dist[core_row], grown.bond_eq_dist[row],
+                                                  lambda_to_reduce)
+
+
+def spread_hydrogen_charge(grown, core, lambda_to_reduce, hydrogen, n_GS):
+    """
+    Vectorized reduce_fragment_parameters_spreading_H: the charge of the replaced hydrogen is spread over the atoms of
+    the fragment, its sigmas are scaled by lambda and the linker bond starts from the length of the hydrogen bond.
+    :param grown: arrays of the grown template. TemplateArrays
+    :param core: arrays of the core template. TemplateArrays
+    :param lambda_to_reduce: lambda of the growing step. float
+    :param hydrogen: PDB atom name (without "_") of the hydrogen of the core replaced by the fragment. str
+    :param n_GS: number of growing steps. int
+    """
+    hydrogen_rows = [row for row, name in enumerate(core.atom_names)
+                     if name.strip("_") == hydrogen and not core.is_fragment[row]]
+    hydrogen_bonds = [row for row, (atom1, atom2) in enumerate(core.bond_atoms.tolist())
+                      if hydrogen in (core.atom_names[core.atom_rows[atom1]].strip("_"),
+                                      core.atom_names[core.atom_rows[atom2]].strip("_"))]
+    if not hydrogen_rows or not hydrogen_bonds:
+        raise ValueError("Hydrogen {} not found in the core template {}".format(hydrogen,
+                                                                               core.template.path_to_template))
+    h_charge = core.nbon[hydrogen_rows[-1], CHARGE]
+    h_bond_dist = core.bond_eq_dist[hydrogen_bonds[-1]]
+    fragment = grown.is_fragment
+    grown.nbon[fragment, SIGMA] = grown.nbon[fragment, SIGMA] * lambda_to_reduce
+    grown.nbon[fragment, CHARGE] = h_charge / ((n_GS + 1) * int(fragment.sum()))
+    linker, bond_fragment = grown.bond_is_linker, grown.bond_is_fragment & ~grown.bond_is_linker
+    grown.bond_eq_dist[linker] = h_bond_dist + ((grown.bond_eq_dist[linker] - h_bond_dist) / (n_GS + 1))
+    grown.bond_eq_dist[bond_fragment] = grown.bond_eq_dist[bond_fragment] * lambda_to_reduce
+
+
+def apply_growing_protocol(grown, core, lambda_to_reduce, growing_mode, step, total_steps, hydrogen_to_replace,
+                           null_charges=True):
+    """
+    It modifies the grown template for a growing step following the growing protocol, the same way as the functions of
+    template_fragmenter but with array operations.
+    :param grown: arrays of the grown template. TemplateArrays
+    :param core: arrays of the core template. TemplateArrays
+    :param lambda_to_reduce: lambda of the growing step. float
+    :param growing_mode: "SoftcoreLike", "AllLinear" or "SpreadHcharge". str
+    :param step: current growing step. int
+    :param total_steps: total number of growing steps. int
+    :param hydrogen_to_replace: PDB atom name of the hydrogen replaced by the fragment. str
+    :param null_charges: if set, the charges of the fragment are 0 in SoftcoreLike. bool
+    """
+    if growing_mode == "SoftcoreLike":
+        modify_core_parameters(grown, core, lambda_to_reduce, exp_charges=True)
+        reduce_fragment_parameters(grown, lambda_to_reduce, exp_charges=True, null_charges=null_charges)
+        modify_linker_bonds(grown, core, lambda_to_reduce, hydrogen_to_replace)
+    elif growing_mode == "AllLinear":
+        modify_core_parameters(grown, core, lambda_to_reduce, exp_charges=False)
+        reduce_fragment_parameters(grown, lambda_to_reduce, exp_charges=False, null_charges=False)
+        modify_linker_bonds(grown, core, lambda_to_reduce, hydrogen_to_replace)
+    elif growing_mode == "SpreadHcharge":
+        if step > 1:
+            reduce_fragment_parameters(grown, lambda_to_reduce, columns=[SIGMA, CHARGE])
+            modify_linker_bonds(grown, core, lambda_to_reduce, hydrogen_to_replace)
+        else:
+            spread_hydrogen_charge(grown, core, lambda_to_reduce, hydrogen_to_replace, total_steps)
+    else:
+        raise ValueError("Growing mode Not valid. Choose between: 'SoftcoreLike', 'SpreadHcharge', 'AllLinear'.")
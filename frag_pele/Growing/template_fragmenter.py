@@ -1,4 +1,10 @@
+import os
+import pickle
+import hashlib
 import logging
+import collections
+# Local imports
+from frag_pele.Growing import template_arrays
 
 # Getting the name of the module for the log system
 logger = logging.getLogger(__name__)
@@ -12,11 +18,30 @@ PATTERN_OPLS2005_BOND = " {:5d} {:5d} {:>9.3f} {:>6.3f}\n"
 PATTERN_OPLS2005_THETA = " {:5d} {:5d} {:5d} {:>11.5f}{: >11.5f}\n"
 PATTERN_OPLS2005_PHI = " {:5d} {:5d} {: 5d} {:5d} {:>9.5f} {: >4.1f} {: >3.1f}\n"
 PATTERN_OPLS2005_IPHI = " {:5d} {:5d} {: 5d} {:5d} {:>9.5f} {: >4.1f} {: >3.1f}\n"
+# Sections of the template, each one followed by the header of the next section
+NEXT_TEMPLATE_SECTION = {"RESX": "NBON", "NBON": "BOND", "BOND": "THET", "THET": "PHI", "PHI": "IPHI", "IPHI": "END"}
+# Version of the binary serialization of the templates. Increase it when TemplateImpact or its terms change
+TEMPLATE_SERIALIZATION_VERSION = 2
+# Number of parsed templates kept in memory by load_template
+TEMPLATE_MEMO_SIZE = 32
+_parsed_templates = collections.OrderedDict()
+# Float objects shared by the dihedrals (their prefactors and nterms only take a few values)
+_shared_floats = {}
+
+
+def get_shared_float(value):
+    value = float(value)
+    return _shared_floats.setdefault(value, value)
 
 
 class Atom:
     """A class which contains all the information and properties of an Atom, and several methods to build templates from
     this data (currently only in OPLS2005)."""
+    # Fixed attributes, without a __dict__ per object: templates have thousands of atoms, bonds, angles and dihedrals
+    __slots__ = ("atom_id", "parent_id", "location", "atom_type", "pdb_atom_name", "unknown", "x_zmatrix", "y_zmatrix",
+                 "z_zmatrix", "sigma", "epsilon", "charge", "radnpSGB", "radnpType", "sgbnpGamma", "sgbnpType",
+                 "bonds", "thetas", "phis", "iphis", "is_fragment", "is_linker")
+
     def __init__(self, atom_id, parent_id, location, atom_type, pdb_atom_name, unknown, x_zmatrix=0, y_zmatrix=0,
                  z_zmatrix=0, sigma=0, epsilon=0, charge=0, radnpSGB=0, radnpType=0, sgbnpGamma=0, sgbnpType=0,
                  is_linker=False, is_fragment=False):
@@ -96,6 +121,8 @@ class Atom:
 
 
 class Bond:
+    __slots__ = ("atom1", "atom2", "spring", "eq_dist", "is_fragment", "is_linker")
+
     def __init__(self, atom1, atom2, spring, eq_dist, is_fragment=False, is_linker=False):
         self.atom1 = int(atom1)
         self.atom2 = int(atom2)
@@ -109,6 +136,8 @@ class Bond:
 
 
 class Theta:
+    __slots__ = ("atom1", "atom2", "atom3", "spring", "eq_angle", "is_fragment")
+
     def __init__(self, atom1, atom2, atom3, spring, eq_angle, is_fragment=False):
         self.atom1 = int(atom1)
         self.atom2 = int(atom2)
@@ -122,14 +151,16 @@ class Theta:
 
 
 class Phi:
+    __slots__ = ("atom1", "atom2", "atom3", "atom4", "constant", "prefactor", "nterm", "improper", "is_fragment")
+
     def __init__(self, atom1, atom2, atom3, atom4, constant, prefactor, nterm, improper, is_fragment=False):
         self.atom1 = int(atom1)
         self.atom2 = int(atom2)
         self.atom3 = int(atom3)
         self.atom4 = int(atom4)
         self.constant = float(constant)
-        self.prefactor = float(prefactor)
-        self.nterm = float(nterm)
+        self.prefactor = get_shared_float(prefactor)
+        self.nterm = get_shared_float(nterm)
         self.improper = bool(improper)
         self.is_fragment = bool(is_fragment)
 
@@ -159,157 +190,115 @@ class TemplateImpact:
         self.list_of_phis = []
         self.list_of_iphis = []
         self.unique_atoms = []
+        self.unique_atoms_set = set()
+        self.section_offsets = {}
+        # Incidence indexes {"bonds"/"thetas"/"phis"/"iphis": {atom id: {key of the term: term}}}, built on demand
+        self.atom_indexes = None
+        self.atoms_by_name = {}
         self.read_template()
 
-    def read_template(self):
-        template = file_to_list_of_lines(self.path_to_template)
-        for line in template[0:1]:
-            self.template_name = line.split()[0]
-            self.num_nbon_params = int(line.split()[1])
-            self.num_bond_params = int(line.split()[2])
-            self.num_angle_params = int(line.split()[3])
-            self.num_dihedr_params = int(line.split()[4])
-            self.num_nonnull = int(line.split()[5])
-        for line in template[1:]:
-            if line.startswith("NBON"):
-                index = template.index(line)
-                break
-            if all(x.isdigit() for x in line.split()): #Avoiding conection matrix
-                continue
-            try:
-                atom_id, parent_id, location, atom_type, pdb_atom_name, unknown, \
-                x_zmatrix, y_zmatrix , z_zmatrix = line.split()
-               # atom_id = get_string_from_line(line=line, index_initial=0, index_final=6)
-               # parent_id = get_string_from_line(line=line, index_initial=6, index_final=11)
-               # location = get_string_from_line(line=line, index_initial=12, index_final=13)
-               # atom_type = get_string_from_line(line=line, index_initial=15, index_final=20)
-               # pdb_atom_name = get_string_from_line(line=line, index_initial=21, index_final=25)
-               # unknown = get_string_from_line(line=line, index_initial=26, index_final=31)
-               # x_zmatrix = get_string_from_line(line=line, index_initial=32, index_final=43)
-               # y_zmatrix = get_string_from_line(line=line, index_initial=44, index_final=55)
-               # z_zmatrix = get_string_from_line(line=line, index_initial=56, index_final=67)
-                atom = Atom(atom_id=atom_id, parent_id=parent_id, location=location, atom_type=atom_type,
-                            pdb_atom_name=pdb_atom_name, unknown=unknown, x_zmatrix=x_zmatrix, y_zmatrix=y_zmatrix,
-                            z_zmatrix=z_zmatrix)
-                self.list_of_atoms.setdefault(atom.atom_id, atom)
-                if pdb_atom_name not in self.unique_atoms:
-                    self.unique_atoms.append(pdb_atom_name)
-                else:
-                    raise ValueError("ERROR: PDB ATOM NAME {} ALREADY EXISTS in the template {}!".format(pdb_atom_name,
-                                                                                              self.path_to_template))
-            except ValueError:
-                raise ValueError(
-                     "Unexpected type in line {} of {}\n{}".format(template.index(line), self.path_to_template, line))
-
-        for line in template[index + 1:]:
-            if line.startswith("BOND"):
-                index = template.index(line)
-                break
-            try:
-                id, sigma, epsilon, charge, radnpSGB, radnpType, sgbnpGamma, sgbnpType = line.split()
-                self.list_of_atoms[int(id)].sigma = float(sigma)
-                self.list_of_atoms[int(id)].epsilon = float(epsilon)
-                self.list_of_atoms[int(id)].charge = float(charge)
-                self.list_of_atoms[int(id)].radnpSGB = float(radnpSGB)
-                self.list_of_atoms[int(id)].radnpType = float(radnpType)
-                self.list_of_atoms[int(id)].sgbnpGamma = float(sgbnpGamma)
-                self.list_of_atoms[int(id)].sgbnpType = float(sgbnpType)
-                #id = int(get_string_from_line(line=line, index_initial=0, index_final=7))
-                #self.list_of_atoms[id].sigma = float(get_string_from_line(line=line, index_initial=8, index_final=14))
-                #self.list_of_atoms[id].epsilon = float(get_string_from_line(line=line, index_initial=15, index_final=23))
-                #self.list_of_atoms[id].charge = float(get_string_from_line(line=line, index_initial=24, index_final=34))
-                #self.list_of_atoms[id].radnpSGB = float(get_string_from_line(line=line, index_initial=35, index_final=43))
-                #self.list_of_atoms[id].radnpType = float(get_string_from_line(line=line, index_initial=44, index_final=52))
-                #self.list_of_atoms[id].sgbnpGamma = float(get_string_from_line(line=line, index_initial=53,
-                #                                                               index_final=66))
-                #self.list_of_atoms[id].sgbnpType = float(get_string_from_line(line=line, index_initial=67, index_final=80))
-            except ValueError:
-                raise ValueError(
-                    "Unexpected type in line {} of {}\n{}".format(template.index(line), self.path_to_template, line))
-
-        for line in template[index + 1:]:
-            if line.startswith("THET"):
-                index = template.index(line)
-                break
-            try:
-                id_atom1, id_atom2, spring, eq_dist = line.split()
-                #id_atom1 = int(get_string_from_line(line=line, index_initial=0, index_final=7))
-                #id_atom2 = int(get_string_from_line(line=line, index_initial=8, index_final=12))
-                #spring = get_string_from_line(line=line, index_initial=13, index_final=21)
-                #eq_dist = get_string_from_line(line=line, index_initial=23, index_final=29)
-                # Create bond instance
-                bond = Bond(atom1=int(id_atom1), atom2=int(id_atom2), spring=float(spring), eq_dist=float(eq_dist))
-                self.list_of_bonds.setdefault((int(id_atom1), int(id_atom2)), bond)
-                # Set which atom is bonded with
-                self.list_of_atoms[int(id_atom1)].bonds.append(bond)
-
-            except ValueError:
-                raise ValueError(
-                    "Unexpected type in line {} of {}\n{}".format(template.index(line), self.path_to_template, line))
-        for line in template[index + 1:]:
-            if line.startswith("PHI"):
-                index = template.index(line)
-                break
-            try:
-                id_atom1, id_atom2, id_atom3, spring, eq_angle = line.split()
-                #id_atom1 = int(get_string_from_line(line=line, index_initial=0, index_final=7))
-                #id_atom2 = int(get_string_from_line(line=line, index_initial=8, index_final=12))
-                #id_atom3 = int(get_string_from_line(line=line, index_initial=13, index_final=18))
-                #spring = get_string_from_line(line=line, index_initial=19, index_final=29)
-                #eq_angle = get_string_from_line(line=line, index_initial=31, index_final=40)
-                # Create bond instance
-                theta = Theta(atom1=int(id_atom1), atom2=int(id_atom2), atom3=int(id_atom3), 
-                              spring=float(spring), eq_angle=float(eq_angle))
-                self.list_of_thetas.setdefault((int(id_atom1), int(id_atom2), int(id_atom3)), theta)
-                self.list_of_atoms[int(id_atom1)].thetas.append(theta)
-
-            except ValueError:
-                raise ValueError(
-                    "Unexpected type in line {} of {}\n{}".format(template.index(line), self.path_to_template,
-                                                                  line))
-        for line in template[index + 1:]:
-            if line.startswith("IPHI"):
-                index = template.index(line)
-                break
-            try:
-                id_atom1, id_atom2, id_atom3, id_atom4, constant, preafactor, nterm = line.split()
-                #id_atom1 = int(get_string_from_line(line=line, index_initial=0, index_final=7))
-                #id_atom2 = int(get_string_from_line(line=line, index_initial=8, index_final=11))
-                #id_atom3 = int(get_string_from_line(line=line, index_initial=12, index_final=17))
-                #id_atom4 = int(get_string_from_line(line=line, index_initial=18, index_final=23))
-                #constant = get_string_from_line(line=line, index_initial=25, index_final=32)
-                #preafactor = get_string_from_line(line=line, index_initial=33, index_final=38)
-                #nterm = get_string_from_line(line=line, index_initial=39, index_final=42)
-                # Create bond instance
-                phi = Phi(atom1=int(id_atom1), atom2=int(id_atom2), atom3=int(id_atom3), atom4=int(id_atom4), 
-                          constant=constant, prefactor=preafactor, nterm=nterm, improper=False)
-                self.list_of_phis.append(phi)
+    def __getstate__(self):
+        # The indexes of the phis use the ids of the objects, so they are rebuilt when needed after unpickling
+        state = self.__dict__.copy()
+        state["atom_indexes"] = None
+        state["atoms_by_name"] = {}
+        return state
 
-            except ValueError:
-                raise ValueError(
-                    "Unexpected type in line {} of {}\n{}".format(template.index(line), self.path_to_template,
-                                                                  line))
-        for line in template[index + 1:]:
-            if line.startswith("END"):
-                break
-            try:
-                id_atom1, id_atom2, id_atom3, id_atom4, constant, preafactor, nterm = line.split()
-                #id_atom1 = int(get_string_from_line(line=line, index_initial=0, index_final=7))
-                #id_atom2 = int(get_string_from_line(line=line, index_initial=8, index_final=12))
-                #id_atom3 = int(get_string_from_line(line=line, index_initial=13, index_final=18))
-                #id_atom4 = int(get_string_from_line(line=line, index_initial=19, index_final=24))
-                #constant = get_string_from_line(line=line, index_initial=26, index_final=33)
-                #preafactor = get_string_from_line(line=line, index_initial=34, index_final=39)
-                #nterm = get_string_from_line(line=line, index_initial=40, index_final=43)
-                # Create bond instance
-                phi = Phi(atom1=int(id_atom1), atom2=int(id_atom2), atom3=int(id_atom3), atom4=int(id_atom4), 
-                          constant=constant, prefactor=preafactor, nterm=nterm, improper=True)
-                self.list_of_iphis.append(phi)
-
-            except ValueError:
-                raise ValueError(
-                    "Unexpected type in line {} of {}\n{}".format(template.index(line), self.path_to_template,
-                                                                  line))
+    def read_template(self):
+        """
+        It reads the template in a single pass over the file, line by line, so the whole file is never kept in memory.
+        The line where each section starts (NBON, BOND, THET, PHI, IPHI and END) is stored in self.section_offsets.
+        """
+        self.section_offsets = {}
+        section = None
+        with open(self.path_to_template, "r") as template:
+            # The lines are numbered skipping the comments, as the error messages always did
+            for index, line in enumerate(line for line in template if not line.startswith("*")):
+                if section is None:
+                    self.read_header(line)
+                    section = "RESX"
+                    continue
+                if line.startswith(NEXT_TEMPLATE_SECTION[section]):
+                    section = NEXT_TEMPLATE_SECTION[section]
+                    self.section_offsets[section] = index
+                    if section == "END":
+                        break
+                    continue
+                try:
+                    if section == "RESX":
+                        self.read_resx_line(line)
+                    elif section == "NBON":
+                        self.read_nbon_line(line)
+                    elif section == "BOND":
+                        self.read_bond_line(line)
+                    elif section == "THET":
+                        self.read_theta_line(line)
+                    elif section in ("PHI", "IPHI"):
+                        self.read_phi_line(line, improper=section == "IPHI")
+                except ValueError:
+                    raise ValueError(
+                        "Unexpected type in line {} of {}\n{}".format(index, self.path_to_template, line))
+        if section not in ("IPHI", "END"):
+            raise ValueError("Section {} not found in the template {}".format(NEXT_TEMPLATE_SECTION.get(section, "RESX"),
+                                                                              self.path_to_template))
+
+    def read_header(self, line):
+        fields = line.split()
+        self.template_name = fields[0]
+        self.num_nbon_params = int(fields[1])
+        self.num_bond_params = int(fields[2])
+        self.num_angle_params = int(fields[3])
+        self.num_dihedr_params = int(fields[4])
+        self.num_nonnull = int(fields[5])
+
+    def read_resx_line(self, line):
+        fields = line.split()
+        if all(x.isdigit() for x in fields):  # Avoiding conection matrix
+            return
+        atom_id, parent_id, location, atom_type, pdb_atom_name, unknown, x_zmatrix, y_zmatrix, z_zmatrix = fields
+        atom = Atom(atom_id=atom_id, parent_id=parent_id, location=location, atom_type=atom_type,
+                    pdb_atom_name=pdb_atom_name, unknown=unknown, x_zmatrix=x_zmatrix, y_zmatrix=y_zmatrix,
+                    z_zmatrix=z_zmatrix)
+        self.list_of_atoms.setdefault(atom.atom_id, atom)
+        if pdb_atom_name in self.unique_atoms_set:
+            raise ValueError("ERROR: PDB ATOM NAME {} ALREADY EXISTS in the template {}!".format(pdb_atom_name,
+                                                                                               self.path_to_template))
+        self.unique_atoms_set.add(pdb_atom_name)
+        self.unique_atoms.append(pdb_atom_name)
+
+    def read_nbon_line(self, line):
+        id, sigma, epsilon, charge, radnpSGB, radnpType, sgbnpGamma, sgbnpType = line.split()
+        atom = self.list_of_atoms[int(id)]
+        atom.sigma = float(sigma)
+        atom.epsilon = float(epsilon)
+        atom.charge = float(charge)
+        atom.radnpSGB = float(radnpSGB)
+        atom.radnpType = float(radnpType)
+        atom.sgbnpGamma = float(sgbnpGamma)
+        atom.sgbnpType = float(sgbnpType)
+
+    def read_bond_line(self, line):
+        id_atom1, id_atom2, spring, eq_dist = line.split()
+        bond = Bond(atom1=int(id_atom1), atom2=int(id_atom2), spring=float(spring), eq_dist=float(eq_dist))
+        self.list_of_bonds.setdefault((int(id_atom1), int(id_atom2)), bond)
+        # Set which atom is bonded with
+        self.list_of_atoms[int(id_atom1)].bonds.append(bond)
+
+    def read_theta_line(self, line):
+        id_atom1, id_atom2, id_atom3, spring, eq_angle = line.split()
+        theta = Theta(atom1=int(id_atom1), atom2=int(id_atom2), atom3=int(id_atom3),
+                      spring=float(spring), eq_angle=float(eq_angle))
+        self.list_of_thetas.setdefault((int(id_atom1), int(id_atom2), int(id_atom3)), theta)
+        self.list_of_atoms[int(id_atom1)].thetas.append(theta)
+
+    def read_phi_line(self, line, improper=False):
+        id_atom1, id_atom2, id_atom3, id_atom4, constant, preafactor, nterm = line.split()
+        phi = Phi(atom1=int(id_atom1), atom2=int(id_atom2), atom3=int(id_atom3), atom4=int(id_atom4),
+                  constant=constant, prefactor=preafactor, nterm=nterm, improper=improper)
+        if improper:
+            self.list_of_iphis.append(phi)
+        else:
+            self.list_of_phis.append(phi)
 
     def write_header(self):
         return HEADER_OPLS2005+PATTERN_OPLS2005_RESX_HEADER.format(self.template_name, self.num_nbon_params,
@@ -426,87 +415,130 @@ class TemplateImpact:
         return iphis
 
     def find_index_of_atom_name(self, pdb_atom_name):
+        # The index of names is checked before using it, as atoms can be replaced or renamed from outside
+        index = self.atoms_by_name.get(pdb_atom_name)
+        atom = self.list_of_atoms.get(index)
+        if atom is not None and atom.pdb_atom_name == pdb_atom_name:
+            return index
+        self.atoms_by_name = {}
         for index, atom in self.list_of_atoms.items():
-            if atom.pdb_atom_name == pdb_atom_name:
-                return index
+            self.atoms_by_name.setdefault(atom.pdb_atom_name, index)
+        return self.atoms_by_name.get(pdb_atom_name)
 
-    def find_bond_from_atom(self, index_atom):
-        indexes = []
+    def build_indexes(self):
+        """
+        It (re)builds the indexes of the bonds, thetas, phis and iphis of each atom. They are built the first time
+        they are used, and the add, delete and replace methods keep them updated, so it is only needed if the lists are
+        modified directly.
+        """
+        self.atom_indexes = {"bonds": {}, "thetas": {}, "phis": {}, "iphis": {}}
         for index, bond in self.list_of_bonds.items():
-            if bond.atom1 == index_atom or bond.atom2 == index_atom:
-                indexes.append(index)
-        return indexes
+            self.index_term("bonds", index, bond)
+        for index, theta in self.list_of_thetas.items():
+            self.index_term("thetas", index, theta)
+        for phi in self.list_of_phis:
+            self.index_term("phis", phi)
+        for iphi in self.list_of_iphis:
+            self.index_term("iphis", iphi)
+
+    def get_terms_of_atom(self, kind, index_atom):
+        if self.atom_indexes is None:
+            self.build_indexes()
+        return self.atom_indexes[kind].get(index_atom, {})
+
+    def index_term(self, kind, term, value=None):
+        """
+        :param kind: "bonds", "thetas", "phis" or "iphis". str
+        :param term: key of the bond or theta (tuple of atom ids) or Phi object.
+        """
+        if self.atom_indexes is None:  # Not built yet, the lists are used when they are built
+            return
+        if kind in ("phis", "iphis"):
+            atoms, key, value = (term.atom1, term.atom2, term.atom3, term.atom4), id(term), term
+        else:
+            atoms, key = term, term
+        for atom in atoms:
+            self.atom_indexes[kind].setdefault(atom, {})[key] = value
+
+    def unindex_term(self, kind, term):
+        if self.atom_indexes is None:
+            return
+        if kind in ("phis", "iphis"):
+            atoms, key = (term.atom1, term.atom2, term.atom3, term.atom4), id(term)
+        else:
+            atoms, key = term, term
+        for atom in atoms:
+            self.atom_indexes[kind].get(atom, {}).pop(key, None)
+
+    def find_bond_from_atom(self, index_atom):
+        return list(self.get_terms_of_atom("bonds", index_atom))
 
     def find_theta_from_atom(self, index_atom):
-        indexes = []
-        for index, theta in self.list_of_thetas.items():
-            if theta.atom1 == index_atom or theta.atom2 == index_atom or theta.atom3 == index_atom:
-                indexes.append(index)
-        return indexes
+        return list(self.get_terms_of_atom("thetas", index_atom))
 
     def find_phi_from_atom(self, index_atom):
-        phis = []
-        for phi in self.list_of_phis:
-            if phi.atom1 == index_atom or phi.atom2 == index_atom or phi.atom3 == index_atom or phi.atom4 == index_atom:
-                phis.append(phi)
-        return phis
+        return list(self.get_terms_of_atom("phis", index_atom).values())
 
     def find_iphi_from_atom(self, index_atom):
-        iphis = []
-        for iphi in self.list_of_iphis:
-            if iphi.atom1 == index_atom or iphi.atom2 == index_atom or iphi.atom3 == index_atom or iphi.atom4 == index_atom:
-                iphis.append(iphi)
-        return iphis
-    
+        return list(self.get_terms_of_atom("iphis", index_atom).values())
+
+    def add_bond(self, bond):
+        index = (bond.atom1, bond.atom2)
+        self.list_of_bonds[index] = bond
+        self.index_term("bonds", index, bond)
+
+    def add_theta(self, theta):
+        index = (theta.atom1, theta.atom2, theta.atom3)
+        self.list_of_thetas[index] = theta
+        self.index_term("thetas", index, theta)
+
+    def add_phi(self, phi):
+        if phi.improper:
+            self.list_of_iphis.append(phi)
+            self.index_term("iphis", phi)
+        else:
+            self.list_of_phis.append(phi)
+            self.index_term("phis", phi)
+
     def delete_atom(self, index_to_del):
-        for index, atom in self.list_of_atoms.items():
-            if index == index_to_del:
-                del self.list_of_atoms[index]
-                print("Atom {} with index {} has been deleted".format(atom.pdb_atom_name,
-                                                                      index))
-                break
+        atom = self.list_of_atoms.pop(index_to_del, None)
+        if atom is not None:
+            print("Atom {} with index {} has been deleted".format(atom.pdb_atom_name,
+                                                                  index_to_del))
 
     def delete_bond(self, indexes_to_del):
-        for ind_to_del in indexes_to_del: 
-            for index, bond in self.list_of_bonds.items():
-                if index == ind_to_del:
-                    del self.list_of_bonds[index]
-                    print("Bond between {} and {} has been deleted".format(bond.atom1,
-                                                                           bond.atom2))
-                    break    
-   
+        for ind_to_del in indexes_to_del:
+            bond = self.list_of_bonds.pop(ind_to_del, None)
+            if bond is not None:
+                self.unindex_term("bonds", ind_to_del)
+                print("Bond between {} and {} has been deleted".format(bond.atom1,
+                                                                       bond.atom2))
+
     def delete_theta(self, indexes_to_del):
         for ind_to_del in indexes_to_del:
-            for index, theta in self.list_of_thetas.items():
-                if index == ind_to_del:
-                    del self.list_of_thetas[index]
-                    print("Theta between {}, {} and {} has been deleted".format(theta.atom1,
-                                                                                theta.atom2,
-                                                                                theta.atom3))
-                    break
+            theta = self.list_of_thetas.pop(ind_to_del, None)
+            if theta is not None:
+                self.unindex_term("thetas", ind_to_del)
+                print("Theta between {}, {} and {} has been deleted".format(theta.atom1,
+                                                                            theta.atom2,
+                                                                            theta.atom3))
+
+    def delete_phis_from_list(self, list_of_phis, kind, phis_to_del, name):
+        for phi in phis_to_del:
+            try:
+                list_of_phis.remove(phi)  # Phis are compared by identity
+            except ValueError:
+                continue
+            self.unindex_term(kind, phi)
+            print("{} between {}, {}, {} and {} has been deleted".format(name, phi.atom1, phi.atom2, phi.atom3,
+                                                                         phi.atom4))
 
     def delete_phi(self, phis_to_del):
-        for phi_del in phis_to_del:
-            for phi in self.list_of_phis:
-                if phi == phi_del:
-                    self.list_of_phis.remove(phi)
-                    print("Phi between {}, {}, {} and {} has been deleted".format(phi.atom1,
-                                                                                  phi.atom2,
-                                                                                  phi.atom3,
-                                                                                  phi.atom4))
-                    break
+        self.delete_phis_from_list(self.list_of_phis, "phis", phis_to_del, "Phi")
 
     def delete_iphi(self, iphis_to_del):
-        for iphi_del in iphis_to_del:
-            for iphi in self.list_of_iphis:
-                if iphi == iphi_del:
-                    self.list_of_iphis.remove(iphi)
-                    print("IPhi between {}, {}, {} and {} has been deleted".format(iphi.atom1,
-                                                                                   iphi.atom2,
-                                                                                   iphi.atom3,
-                                                                                   iphi.atom4))
-                    break
- 
+        self.delete_phis_from_list(self.list_of_iphis, "iphis", iphis_to_del, "IPhi")
+
     def erease_atom_from_template(self, pdb_atom_name):
         index_to_del = self.find_index_of_atom_name(pdb_atom_name)
         self.delete_atom(index_to_del)
@@ -525,6 +557,8 @@ class TemplateImpact:
 
     def replace_atom(self, atom_index, new_atom, keep_head=True):
         new_atom.atom_id = atom_index
+        # The new name can precede a repeated one, so the index of names is built again when it is used
+        self.atoms_by_name = {}
         if keep_head:
             old_parent_id = self.list_of_atoms[atom_index].parent_id
             old_x_zmatrix = self.list_of_atoms[atom_index].x_zmatrix
@@ -539,14 +573,77 @@ class TemplateImpact:
             self.list_of_atoms[atom_index] = new_atom
 
     def replace_bond(self, bond_index, new_bond):
-        self.list_of_bonds[bond_index] = new_bond 
-        
+        self.list_of_bonds[bond_index] = new_bond
+        self.index_term("bonds", bond_index, new_bond)
+
     def replace_theta(self, theta_index, new_theta):
         self.list_of_thetas[theta_index] = new_theta
+        self.index_term("thetas", theta_index, new_theta)
 
     def replace_phi(self, old_phi, new_phi):
         index = self.list_of_phis.index(old_phi)
         self.list_of_phis[index] = new_phi
+        self.unindex_term("phis", old_phi)
+        self.index_term("phis", new_phi)
+
+
+def get_template_checksum(path_to_template):
+    """
+    :param path_to_template: path to the template. str
+    :return: sha256 of the content of the template. str
+    """
+    with open(path_to_template, "rb") as template:
+        return hashlib.sha256(template.read()).hexdigest()
+
+
+def serialize_template(template, checksum):
+    """
+    Binary serialization of a parsed template, with the version of the format and the checksum of its source file.
+    :param template: parsed template. TemplateImpact
+    :param checksum: checksum of the file the template was read from (see get_template_checksum). str
+    :return: serialized template. bytes
+    """
+    return pickle.dumps((TEMPLATE_SERIALIZATION_VERSION, checksum, template), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize_template(data, checksum=None):
+    """
+    :param data: template serialized with serialize_template. bytes
+    :param checksum: if set, checksum that the source file of the template must have. str
+    :return: new TemplateImpact object. TemplateImpact
+    """
+    version, source_checksum, template = pickle.loads(data)
+    if version != TEMPLATE_SERIALIZATION_VERSION:
+        raise ValueError("Template serialized with version {} instead of {}".format(version,
+                                                                                 TEMPLATE_SERIALIZATION_VERSION))
+    if checksum is not None and checksum != source_checksum:
+        raise ValueError("The template {} has changed since it was serialized".format(template.path_to_template))
+    return template
+
+
+def load_template(path_to_template):
+    """
+    It returns a parsed template, reading it only if its content has changed since it was last loaded in the process.
+    Each call returns a new object (the templates are modified in place by the growing protocols), deserialized from
+    the one kept in memory.
+    :param path_to_template: path to the template. str
+    :return: parsed template. TemplateImpact
+    """
+    key = os.path.realpath(path_to_template)
+    checksum = get_template_checksum(path_to_template)
+    if key in _parsed_templates:
+        try:
+            template = deserialize_template(_parsed_templates[key], checksum)
+            _parsed_templates.move_to_end(key)
+            template.path_to_template = path_to_template
+            return template
+        except ValueError:  # The file has changed
+            del _parsed_templates[key]
+    template = TemplateImpact(path_to_template)
+    _parsed_templates[key] = serialize_template(template, checksum)
+    while len(_parsed_templates) > TEMPLATE_MEMO_SIZE:
+        _parsed_templates.popitem(last=False)
+    return template
 
 
 class ReduceProperty:
@@ -1010,6 +1107,69 @@ def modify_linkers_parameters_linearly(template_grow, lambda_to_reduce, template
     reductor = ReduceLinearly(template_grow, lambda_to_reduce, template_core, atom_to_replace)
     reductor.modify_linker_bond_eq_dist(reductor.reduce_value_from_diference)
 
+def prepare_templates(template_initial_path, template_grown_path, hydrogen_to_replace, core_atom_linker):
+    """
+    It reads the initial and grown templates and detects the atoms and bonds of the fragment and the linker.
+    :return: initial template, grown template (with the fragment and linker flags set), list of fragment atoms and
+    list of core atoms of the grown template. tuple
+    """
+    templ_ini = load_template(template_initial_path)
+    templ_grw = load_template(template_grown_path)
+    fragment_atoms, core_atoms_in, core_atoms_grown = detect_atoms(template_initial=templ_ini,
+                                                                   template_grown=templ_grw,
+                                                                   hydrogen_to_replace=hydrogen_to_replace)
+    set_fragment_atoms(list_of_fragment_atoms=fragment_atoms)
+    set_connecting_atom(template_grown=templ_grw, pdb_atom_name=core_atom_linker)
+    fragment_bonds = detect_fragment_bonds(list_of_fragment_atoms=fragment_atoms, template_grown=templ_grw)
+    set_fragment_bonds(list_of_fragment_bonds=fragment_bonds)
+    set_linker_bond(templ_grw)
+    return templ_ini, templ_grw, fragment_atoms, core_atoms_grown
+
+
+def create_templates_schedule(template_initial_path, template_grown_path, total_steps, hydrogen_to_replace,
+                              core_atom_linker, tmpl_out_path, initial_step=1, growing_mode="SoftcoreLike"):
+    """
+    It writes the templates of all the growing steps at once ({tmpl_out_path}_0 ... {tmpl_out_path}_{total_steps}),
+    reading and analysing the initial and grown templates only once. The template of the step n is the one written
+    by main with step=initial_step for n=0 and step=n+1 otherwise, as grow_fragment uses them. All the templates are
+    checked (finite parameters) before any simulation is run.
+    :param template_initial_path: Path to an OPLS2005 template of the core ligand.
+    :type template_initial_path: str
+    :param template_grown_path: Path to an OPLS2005 template of the ligand with the fragment added to the core.
+    :type template_grown_path: str
+    :param total_steps: Total number of steps.
+    :type total_steps: int
+    :param hydrogen_to_replace: PDB atom name of the hydrogen that will be replaced for the linking atom of the fragment.
+    :type hydrogen_to_replace: str
+    :param core_atom_linker: PDB atom name of the core that is linking the fragment.
+    :type core_atom_linker: str
+    :param tmpl_out_path: Prefix of the output paths of the templates.
+    :type tmpl_out_path: str
+    :param initial_step: step used for the first template (when the growing does not start from the beginning).
+    :type initial_step: int
+    :return: list of fragment atoms, list of core atoms and paths to the templates of each step. tuple
+    """
+    templ_ini, templ_grw, fragment_atoms, core_atoms_grown = prepare_templates(template_initial_path,
+                                                                               template_grown_path,
+                                                                               hydrogen_to_replace, core_atom_linker)
+    arrays_ini = template_arrays.TemplateArrays(templ_ini)
+    arrays_grw = template_arrays.TemplateArrays(templ_grw)
+    templates = []
+    for n in range(0, total_steps + 1):
+        step = initial_step if n == 0 else n + 1
+        arrays_step = arrays_grw.copy()
+        template_arrays.apply_growing_protocol(arrays_step, arrays_ini, float(step/(total_steps+1)), growing_mode,
+                                               step, total_steps, hydrogen_to_replace)
+        wrong_values = arrays_step.check_values()
+        if wrong_values:
+            raise ValueError("Template of the growing step {} has non finite values in {}".format(n, wrong_values))
+        arrays_step.to_template()
+        templates.append("{}_{}".format(tmpl_out_path, n))
+        templ_grw.write_template_to_file(template_new_name=templates[-1])
+    return [atom.pdb_atom_name for atom in fragment_atoms], \
+           [atom.pdb_atom_name for atom in core_atoms_grown], templates
+
+
 def main(template_initial_path, template_grown_path, step, total_steps, hydrogen_to_replace, core_atom_linker,
          tmpl_out_path, null_charges=False, growing_mode="SoftcoreLike"):
     """
@@ -1036,39 +1196,14 @@ def main(template_initial_path, template_grown_path, step, total_steps, hydrogen
     :return: None
     """
     lambda_to_reduce = float(step/(total_steps+1))
-    templ_ini = TemplateImpact(template_initial_path)
-    
-    for bond in templ_ini.list_of_bonds:
-        key, bond_cont = bond
-    templ_grw = TemplateImpact(template_grown_path)
-    fragment_atoms, core_atoms_in, core_atoms_grown = detect_atoms(template_initial=templ_ini, 
-                                                                   template_grown=templ_grw,
-                                                                   hydrogen_to_replace=hydrogen_to_replace)
-    set_fragment_atoms(list_of_fragment_atoms=fragment_atoms)
-    set_connecting_atom(template_grown=templ_grw, pdb_atom_name=core_atom_linker)
-    fragment_bonds = detect_fragment_bonds(list_of_fragment_atoms=fragment_atoms, template_grown=templ_grw)
-    set_fragment_bonds(list_of_fragment_bonds=fragment_bonds)
-    set_linker_bond(templ_grw)
-    if growing_mode == "SoftcoreLike":
-        modify_core_parameters_linearly(templ_grw, lambda_to_reduce, templ_ini, exp_charges=True)
-        reduce_fragment_parameters_linearly(templ_grw, lambda_to_reduce, exp_charges=True, 
-                                            null_charges=True)
-        modify_linkers_parameters_linearly(templ_grw, lambda_to_reduce, templ_ini, hydrogen_to_replace)
-    elif growing_mode == "AllLinear":
-        modify_core_parameters_linearly(templ_grw, lambda_to_reduce, templ_ini, exp_charges=False)
-        reduce_fragment_parameters_linearly(templ_grw, lambda_to_reduce, exp_charges=False,
-                                            null_charges=False)
-        modify_linkers_parameters_linearly(templ_grw, lambda_to_reduce, templ_ini, hydrogen_to_replace)
-    elif growing_mode == "SpreadHcharge":
-        if step > 1:
-            reduce_fragment_parameters_originaly(templ_grw, templ_ini, lambda_to_reduce, 
-                                                  hydrogen=hydrogen_to_replace, n_GS=total_steps)
-            modify_linkers_parameters_linearly(templ_grw, lambda_to_reduce, templ_ini, hydrogen_to_replace)
-        else:
-            reduce_fragment_parameters_spreading_H(templ_grw, templ_ini, lambda_to_reduce, 
-                                                   hydrogen=hydrogen_to_replace, n_GS=total_steps)
-    else:
-        raise ValueError("Growing mode Not valid. Choose between: 'SoftcoreLike', 'SpreadHcharge', 'AllLinear'.")
+    templ_ini, templ_grw, fragment_atoms, core_atoms_grown = prepare_templates(template_initial_path,
+                                                                               template_grown_path,
+                                                                               hydrogen_to_replace, core_atom_linker)
+    # The parameters are modified as arrays and written back to the template objects
+    arrays_grw = template_arrays.TemplateArrays(templ_grw)
+    template_arrays.apply_growing_protocol(arrays_grw, template_arrays.TemplateArrays(templ_ini), lambda_to_reduce,
+                                           growing_mode, step, total_steps, hydrogen_to_replace)
+    arrays_grw.to_template()
     templ_grw.write_template_to_file(template_new_name=tmpl_out_path)
     return [atom.pdb_atom_name for atom in fragment_atoms], \
             [atom.pdb_atom_name for atom in core_atoms_grown]
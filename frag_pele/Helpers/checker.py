@@ -3,6 +3,7 @@ import logging
 import glob
 import prody
 import frag_pele.Growing.add_fragment_from_pdbs as addfr
+from frag_pele.Helpers import parsed_pdb, fragment_index
 
 
 # Getting the name of the module for the log system
@@ -36,22 +37,25 @@ def check_and_fix_pdbatomnames(pdb_file):
     :param pdb_file: PDB file. str
     :return: it rewrites the PDB file applying the modifications.
     """
-    with open(pdb_file) as pdb:
-        content = pdb.readlines()
-        check_duplicated_pdbatomnames(content)
-        for i, line in enumerate(content):
-            if line.startswith("HETATM") and line[21:22] == "L":
-                atom_name = line[12:16]
-                if atom_name.strip().startswith("G"):
-                    new_atom_name = line[77:78] + atom_name.strip()
-                    line_to_list = list(line)
-                    line_to_list[12:16] = new_atom_name + " " * (4-len(new_atom_name))
-                    line_to_list = "".join(line_to_list)
-                    content[i] = line_to_list
-        check_duplicated_pdbatomnames(content)
-        new_pdb = "".join(content)
+    content = list(parsed_pdb.load(pdb_file).lines)  # The parsed lines are shared, they are modified in a copy
+    original_pdb = "".join(content)
+    check_duplicated_pdbatomnames(content)
+    for i, line in enumerate(content):
+        if line.startswith("HETATM") and line[21:22] == "L":
+            atom_name = line[12:16]
+            if atom_name.strip().startswith("G"):
+                new_atom_name = line[77:78] + atom_name.strip()
+                line_to_list = list(line)
+                line_to_list[12:16] = new_atom_name + " " * (4-len(new_atom_name))
+                line_to_list = "".join(line_to_list)
+                content[i] = line_to_list
+    check_duplicated_pdbatomnames(content)
+    new_pdb = "".join(content)
+    if new_pdb == original_pdb:  # Do not rewrite the file if nothing changed, it can be read by other growings
+        return
     with open(pdb_file, "w") as writepdb:
         writepdb.write("{}".format(new_pdb))
+    parsed_pdb.forget(pdb_file)
 
 
 def check_if_atom_exists_in_ligand(pdb_file, atom_name, ligand_chain="L"):
@@ -61,6 +65,12 @@ def check_if_atom_exists_in_ligand(pdb_file, atom_name, ligand_chain="L"):
     :param atom_name: PDB atom name. str(len <= 4)
     :return: if the atom is found it prints a text and if not raise an exception.
     """
+    entry = fragment_index.get_fragment_entry(pdb_file, ligand_chain)
+    if entry is not None:  # Fragment of an indexed library
+        if atom_name not in entry["atoms"]:
+            sys.exit("Check if the selected atom '{}' exists in '{}'".format(atom_name, pdb_file))
+        print("PDB ATOM NAME selected: {} in {}.".format([atom_name], pdb_file))
+        return
     try:
         ligand = addfr.extract_atoms_pdbs(pdb_file, create_file=False, chain=ligand_chain, get_atoms=True)
     except OSError:
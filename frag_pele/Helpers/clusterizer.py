@@ -1,9 +1,5 @@
 import sys
 import mdtraj as md
-from AdaptivePELE.clustering import clustering, thresholdcalculator
-from AdaptivePELE.spawning import spawning, densitycalculator
-from AdaptivePELE.constants import constants
-from AdaptivePELE.utilities import utilities
 import pandas as pd
 import glob
 import os
@@ -12,6 +8,11 @@ import os
 def cluster_traject(resname, trajToDistribute, columnToChoose, distance_contact, clusterThreshold, path_to_cluster,
                     output_path, mapping_out, epsilon=0.5, report_basename="report", condition="min",
                     metricweights="linear", nclusters=5):
+    # AdaptivePELE is only imported when clustering, it is slow to load
+    from AdaptivePELE.clustering import clustering, thresholdcalculator
+    from AdaptivePELE.spawning import spawning, densitycalculator
+    from AdaptivePELE.constants import constants
+    from AdaptivePELE.utilities import utilities
 
     outputPathConst = constants.OutputPathConstants(output_path)
     outputPathConst.tmpFolder = output_path
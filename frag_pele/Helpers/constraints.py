@@ -1,6 +1,8 @@
 import sys
 import os
 import argparse
+# Local imports
+from frag_pele.Helpers import parsed_pdb
 
 AMINOACIDS = ["VAL", "ASN", "GLY", "LEU", "ILE",
               "SER", "ASP", "LYS", "MET", "GLN",
@@ -31,25 +33,24 @@ class ConstraintBuilder(object):
     def parse_atoms(self, interval=10):
         residues = {}
         initial_res = None
-        with open(self.pdb, "r") as pdb:
-            for line in pdb:
-                resname = line[16:21].strip()
-                atomtype = line[11:16].strip()
-                resnum = line[22:26].strip()
-                chain = line[20:23].strip()
-                if line.startswith("ATOM") and resname in AMINOACIDS and atomtype == "CA":
-                    try:
-                        if not initial_res:
-                            residues["initial"] = [chain, line[22:26].strip()]
-                            initial_res = True
-                            continue
-                        # Apply constraint every 10 residues
-                        elif int(resnum) % interval != 1:
-                            residues["terminal"] = [chain, line[22:26].strip()]
-                        elif int(resnum) % interval == 1 and line.startswith("ATOM") and resname in AMINOACIDS and atomtype == "CA":
-                            residues[resnum] = chain
-                    except ValueError:
+        for line in parsed_pdb.load(self.pdb).lines:
+            resname = line[16:21].strip()
+            atomtype = line[11:16].strip()
+            resnum = line[22:26].strip()
+            chain = line[20:23].strip()
+            if line.startswith("ATOM") and resname in AMINOACIDS and atomtype == "CA":
+                try:
+                    if not initial_res:
+                        residues["initial"] = [chain, line[22:26].strip()]
+                        initial_res = True
                         continue
+                    # Apply constraint every 10 residues
+                    elif int(resnum) % interval != 1:
+                        residues["terminal"] = [chain, line[22:26].strip()]
+                    elif int(resnum) % interval == 1 and line.startswith("ATOM") and resname in AMINOACIDS and atomtype == "CA":
+                        residues[resnum] = chain
+                except ValueError:
+                    continue
         return residues
 
 
@@ -0,0 +1,106 @@
+import os
+import shutil
+import logging
+# Local imports
+import frag_pele.constants as c
+from frag_pele.Helpers import manifest, timings
+from frag_pele.Helpers.lazy_modules import lazy_import
+create_templates = lazy_import("frag_pele.Helpers.create_templates")
+add_fragment_from_pdbs = lazy_import("frag_pele.Growing.add_fragment_from_pdbs")
+complex_to_prody = lazy_import("frag_pele.Growing.AddingFragHelpers.complex_to_prody")
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+
+def get_template_files(outdir, template_name, force_field, aminoacid):
+    """
+    :return: paths of the template and the rotamer library of template_name created by create_templates.get_datalocal
+    in outdir. tuple
+    """
+    template_path = create_templates.create_template_path(outdir, template_name, force_field, aminoacid, True)
+    rot_path = os.path.join(outdir, c.ROTAMERS_PATH, "{}.rot.assign".format(template_name.upper()))
+    return template_path, rot_path
+
+
+def prepare_shared_core(complex_pdb, execution_dir, c_chain="L", cov_res=None, force_field="OPLS2005", rotamers=30,
+                        sch_path=c.SCHRODINGER, template_cache=c.TEMPLATE_CACHE,
+                        preparation_cache=c.PREPARATION_CACHE):
+    """
+    Serie-level preparation: the core of complex_pdb is extracted and its template and rotamer library are created
+    once, so all the growings that start from this core copy them instead of running the Schrodinger preparation and
+    the parameterization again. The preparation is recorded in a stage manifest with the hash of complex_pdb, so it is
+    reused by later runs and done again when the complex changes.
+    :param complex_pdb: PDB file with the complex that contains the core. str
+    :param execution_dir: directory where the folder of the shared core is created. str
+    :param c_chain: chain of the core. str
+    :param cov_res: residue selection (chain:resnum) if the growing is done onto a protein residue. str
+    :param force_field: OPLS2005 or OFF. str
+    :param rotamers: rotamer resolution. int
+    :param sch_path: path to Schrodinger. str
+    :param template_cache: folder of the cache of templates shared across runs. None to disable it. str
+    :param preparation_cache: folder of the cache of structures prepared by prepwizard. None to disable it. str
+    :return: dictionary with "complex", "pdb" (PDB of the core), "template_name", "force_field", "aminoacid" and
+    "outdir" (folder with its DataLocal), used by copy_shared_core. dict
+    """
+    pdb_basename = os.path.splitext(os.path.basename(complex_pdb))[0]
+    outdir = os.path.join(execution_dir, c.SHARED_CORE_FOLDER, pdb_basename)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    stage_manifest = manifest.StageManifest(outdir)
+    if cov_res:
+        core_chain, core_res = complex_to_prody.read_residue_string(cov_res)
+        if force_field == 'OFF':  # OpenForceField does not support residues, the growing uses OPLS2005
+            force_field = 'OPLS2005'
+    else:
+        core_chain, core_res = c_chain, None
+    inputs = stage_manifest.hash_inputs([complex_pdb])
+    signature = manifest.compute_signature(inputs, {"c_chain": core_chain, "cov_res": cov_res,
+                                                    "force_field": force_field, "rotamers": rotamers})
+    if stage_manifest.is_done("shared_core", signature):
+        logger.info("Templates of the core of {} already prepared in {}".format(complex_pdb, outdir))
+        return stage_manifest.get_data("shared_core")
+    with timings.Span("shared_core", outdir, complex=complex_pdb):
+        core_residue_name = add_fragment_from_pdbs.extract_atoms_pdbs(complex_pdb, True, core_chain, resnum=core_res,
+                                                                      output_folder=outdir)
+        core_pdb = os.path.join(outdir, "{}.pdb".format(core_residue_name))
+        template_name = core_residue_name.lower()
+        create_templates.get_datalocal(pdb=core_pdb, outdir=outdir, forcefield=force_field,
+                                       template_name=template_name, aminoacid=cov_res, rot_res=rotamers,
+                                       aminoacid_type=template_name if cov_res else None, sch_path=sch_path,
+                                       template_cache=template_cache, preparation_cache=preparation_cache)
+    shared_core = {"complex": complex_pdb, "pdb": core_pdb, "template_name": template_name,
+                   "force_field": force_field, "aminoacid": bool(cov_res), "outdir": outdir}
+    stage_manifest.record("shared_core", signature, inputs,
+                          outputs=[core_pdb] + list(get_template_files(outdir, template_name, force_field, cov_res)),
+                          data=shared_core)
+    return shared_core
+
+
+def copy_shared_core(shared_core, pdb_to_template, template_name, outdir):
+    """
+    It copies the template and rotamer library of the shared core into the DataLocal of a growing, if the PDB that
+    the growing would parameterize is the same molecule (same atom names and bonds) as the shared core.
+    :param shared_core: dictionary returned by prepare_shared_core. dict
+    :param pdb_to_template: PDB file of the core extracted by the growing. str
+    :param template_name: name of the template of the growing. str
+    :param outdir: working directory of the growing. str
+    :return: True if the template and the rotamer library have been copied, False otherwise. bool
+    """
+    if template_name != shared_core["template_name"] or not os.path.exists(shared_core["pdb"]):
+        return False
+    if create_templates.get_molecule_graph(pdb_to_template) != create_templates.get_molecule_graph(shared_core["pdb"]):
+        logger.info("The core of {} differs from the shared core {}".format(pdb_to_template, shared_core["pdb"]))
+        return False
+    sources = get_template_files(shared_core["outdir"], template_name, shared_core["force_field"],
+                                 shared_core["aminoacid"])
+    destinations = get_template_files(outdir, template_name, shared_core["force_field"], shared_core["aminoacid"])
+    for source, destination in zip(sources, destinations):
+        if not os.path.exists(source):
+            return False
+    for source, destination in zip(sources, destinations):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(source, destination)
+    print("Template of the core {} copied from {}".format(template_name, shared_core["outdir"]))
+    return True
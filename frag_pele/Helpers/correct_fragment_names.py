@@ -1,6 +1,8 @@
+from frag_pele.Helpers import parsed_pdb
+
+
 def main(pdb_path, lig_chain="L"):
-    with open(pdb_path) as in_pdb:
-        pdb = in_pdb.readlines()
+    pdb = parsed_pdb.load(pdb_path).lines
     elements = []
     pdb_out = []
     dictionary_to_transcript = {}
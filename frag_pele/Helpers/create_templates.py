@@ -1,19 +1,25 @@
 import os
 import shutil
+import numpy as np
 import frag_pele
+import peleffy
 from peleffy.topology import Molecule, Topology, RotamerLibrary
 from peleffy.forcefield import OpenForceField, OPLS2005ForceField
 from peleffy.template import Impact
 from peleffy.utils import get_data_file_path
 import frag_pele.Covalent.correct_template_of_backbone_res as cov
 import frag_pele.constants as c
-from frag_pele.Helpers import folder_handler
+from frag_pele.Helpers import folder_handler, disk_cache
 from frag_pele.Helpers.plop_rot_temp import prepare_pdb
 from peleffy.utils import Logger
 
 logger = Logger()
 logger.set_level('WARNING')
 
+# Covalent radii (in A) used to find the bonds of the PDB files without CONECT records
+COVALENT_RADII = {"H": 0.31, "C": 0.76, "N": 0.71, "O": 0.66, "F": 0.57, "P": 1.07, "S": 1.05, "CL": 1.02,
+                  "BR": 1.20, "I": 1.39, "B": 0.84, "SI": 1.11, "SE": 1.20}
+
 def create_template_path(path, name, forcefield='OPLS2005', protein=False, templates_generated=False):
     if templates_generated:
         templ_string = "templates_generated"
@@ -37,11 +43,75 @@ def create_template_path(path, name, forcefield='OPLS2005', protein=False, templ
                             templ_string, name.lower()+"z")
     return path
 
+def get_molecule_graph(pdb):
+    """
+    Canonical description of the molecule of a PDB file: its atoms (PDB atom names and elements) and bonds, taken from
+    the CONECT records or, if there are none, from the distances between atoms. The coordinates are not included, so
+    the same molecule placed in another pose has the same description.
+    :param pdb: PDB file with the molecule. str
+    :return: dictionary with "atoms" (sorted list of [atom name, element]) and "bonds" (sorted list of pairs of atom
+    names). dict
+    """
+    names, elements, coordinates, serials, conects = [], [], [], {}, []
+    with open(pdb) as pdb_file:
+        for line in pdb_file:
+            if line.startswith("ATOM") or line.startswith("HETATM"):
+                name = line[12:16].strip()
+                element = line[76:78].strip().upper() or "".join([char for char in name if char.isalpha()])[:1]
+                serials[line[6:11].strip()] = len(names)
+                names.append(name)
+                elements.append(element)
+                coordinates.append([float(line[30:38]), float(line[38:46]), float(line[46:54])])
+            elif line.startswith("CONECT"):
+                fields = [line[i:i + 5].strip() for i in range(6, len(line.rstrip("\n")), 5)]
+                conects.extend([(fields[0], bonded) for bonded in fields[1:] if bonded])
+    if conects:
+        bonds = set([tuple(sorted((names[serials[atom]], names[serials[bonded]])))
+                     for atom, bonded in conects if atom in serials and bonded in serials])
+    else:
+        coordinates = np.array(coordinates).reshape(-1, 3)
+        radii = np.array([COVALENT_RADII.get(element, 0.77) for element in elements])
+        distances = np.linalg.norm(coordinates[:, None, :] - coordinates[None, :, :], axis=-1)
+        bonded = np.triu(distances < (radii[:, None] + radii[None, :] + 0.4), k=1)
+        bonds = set([tuple(sorted((names[i], names[j]))) for i, j in zip(*np.nonzero(bonded))])
+    return {"atoms": sorted([[name, element] for name, element in zip(names, elements)]),
+            "bonds": sorted([list(bond) for bond in bonds])}
+
+
+def get_molecule_coordinates(pdb):
+    """
+    :param pdb: PDB file with the molecule. str
+    :return: sorted list of [atom name, x, y, z] of its atoms, with the precision of the PDB format. list
+    """
+    coordinates = []
+    with open(pdb) as pdb_file:
+        for line in pdb_file:
+            if line.startswith("ATOM") or line.startswith("HETATM"):
+                coordinates.append([line[12:16].strip()] + [round(float(line[i:i + 8]), 3) for i in (30, 38, 46)])
+    return sorted(coordinates)
+
+
+def get_template_key(pdb, forcefield, template_name, aminoacid, rot_res, constraints):
+    """
+    Key of the template and rotamer library of a molecule in the template cache. It changes with anything that
+    changes their content: the molecule (connectivity and atom names), the force field, the name of the template, the
+    rotamer resolution, the constrained atoms, the version of peleffy and the coordinates. The z-matrix of the
+    template (and the OpenFF charges) come from the pose of the molecule, so the templates of other poses (p.ex. other
+    conformers of the fragment) are never shared.
+    :return: key. str
+    """
+    content = {"molecule": get_molecule_graph(pdb), "coordinates": get_molecule_coordinates(pdb),
+               "forcefield": forcefield, "template_name": template_name.upper(), "aminoacid": bool(aminoacid),
+               "rot_res": rot_res, "constraints": sorted(constraints or []),
+               "peleffy": getattr(peleffy, "__version__", None)}
+    return disk_cache.hash_content(content)
+
+
 def get_template_and_rot(pdb, forcefield='OPLS2005', template_name='grw', aminoacid=False, outdir='.', rot_res=30,
-                         contrained_atoms=None, aminoacid_type=None, sch_path=c.SCHRODINGER):
+                         contrained_atoms=None, aminoacid_type=None, sch_path=c.SCHRODINGER,
+                         template_cache=c.TEMPLATE_CACHE, preparation_cache=c.PREPARATION_CACHE):
     p, pdb_name = os.path.split(pdb)
     out = pdb_name.split(".pdb")[0] + "_p" + ".pdb"
-    currdir = os.getcwd()
     pdb_dir = os.path.dirname(pdb)
     # Check if the residue is an amino-acid from the library
     path = os.path.dirname(frag_pele.__file__)
@@ -53,13 +123,28 @@ def get_template_and_rot(pdb, forcefield='OPLS2005', template_name='grw', aminoa
         output_pdb = aa_pdb
     # Check if the output path exist to dont repeat calculations
     if not os.path.exists(output_pdb):
-        os.chdir(pdb_dir)
-        prepare_pdb(pdb_in=pdb_name, 
-                    pdb_out=out, 
-                    sch_path=sch_path)
-        os.chdir(currdir)
+        # prepwizard writes the output in the directory where it is run
+        prepare_pdb(pdb_in=pdb_name,
+                    pdb_out=out,
+                    sch_path=sch_path,
+                    cwd=pdb_dir or None,
+                    preparation_cache=preparation_cache)
     os.environ['SCHRODINGER'] = sch_path
     template_path = create_template_path(outdir, template_name, forcefield, aminoacid, True)
+    rot_path = os.path.join(outdir,
+                            "DataLocal/LigandRotamerLibs/{}.rot.assign".format(template_name.upper()))
+    if template_cache:
+        if aminoacid and not contrained_atoms:
+            key_constraints = [' CA ', ' C  ', ' N  ']
+        else:
+            key_constraints = contrained_atoms
+        cache = disk_cache.DiskCache(template_cache)
+        cache_key = get_template_key(output_pdb, forcefield, template_name, aminoacid, rot_res, key_constraints)
+        cache_files = {"template": template_path, "rotamers": rot_path}
+        if cache.get(cache_key, cache_files):
+            print("Template in {} and rotamer library in {} taken from the cache {}.".format(template_path,
+                                                                                                rot_path, cache.path))
+            return
     if aminoacid:
         print("Aminoacid template")
         if not contrained_atoms:
@@ -88,11 +173,12 @@ def get_template_and_rot(pdb, forcefield='OPLS2005', template_name='grw', aminoa
     impact = Impact(topology)
     impact.to_file(template_path) 
     print("Template in {}.".format(template_path))
-    rot_path = os.path.join(outdir, 
-                            "DataLocal/LigandRotamerLibs/{}.rot.assign".format(template_name.upper()))
     rotamer_library = RotamerLibrary(m)
     rotamer_library.to_file(rot_path)
     print("Rotamer library stored in {}".format(rot_path))
+    if template_cache:
+        cache.put(cache_key, cache_files, metadata={"pdb": output_pdb, "template_name": template_name,
+                                                    "forcefield": forcefield, "rot_res": rot_res})
 
 def add_off_waters_to_datalocal(outdir):
     path = os.path.dirname(frag_pele.__file__)
@@ -100,11 +186,13 @@ def add_off_waters_to_datalocal(outdir):
                 os.path.join(outdir, "DataLocal/Templates/OFF/Parsley/hohz"))
  
 def get_datalocal(pdb, outdir='.', forcefield='OPLS2005', template_name='grw', aminoacid=False, rot_res=30,
-                  constrainted_atoms=None, aminoacid_type=None, sch_path=c.SCHRODINGER):
+                  constrainted_atoms=None, aminoacid_type=None, sch_path=c.SCHRODINGER,
+                  template_cache=c.TEMPLATE_CACHE, preparation_cache=c.PREPARATION_CACHE):
     folder_handler.check_and_create_DataLocal(working_dir=outdir)
     get_template_and_rot(pdb, forcefield=forcefield, template_name=template_name, 
                          aminoacid=aminoacid, outdir=outdir, rot_res=rot_res,
                          contrained_atoms=constrainted_atoms, aminoacid_type=aminoacid_type,
-                         sch_path=sch_path)
+                         sch_path=sch_path, template_cache=template_cache,
+                         preparation_cache=preparation_cache)
     if forcefield == 'OFF':
         add_off_waters_to_datalocal(outdir)
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import logging
+import argparse
+import contextlib
+# Local import
+import frag_pele.constants as c
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+
+def hash_content(content):
+    """
+    :param content: JSON serializable description of the cached object (molecule, parameters...).
+    :return: sha256 of its canonical JSON representation. str
+    """
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class DiskCache(object):
+    """
+    Content-addressed cache of files shared by all the runs of FrAG of a user (or a group, if the folder is shared).
+    Each entry is a folder named by its key that contains a set of files, p.ex. a template and its rotamer library.
+    Entries are written to a temporary folder and renamed when complete, so concurrent workers never see partial
+    entries, and only one of them is kept when several store the same key at the same time. When the total size
+    exceeds max_size the least recently used entries are removed (under a lock, so only one worker evicts at once).
+    The hits and misses of all the workers are counted in stats.json.
+    """
+    def __init__(self, path, max_size=c.TEMPLATE_CACHE_SIZE):
+        """
+        :param path: folder of the cache. It is created if it does not exist. str
+        :param max_size: maximum size of the cache in MB. 0 or None to never evict entries. float
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def get(self, key, destinations):
+        """
+        It copies the files of an entry to their destinations. The files are copied (not linked) because FrAG rewrites
+        the templates in place during the growing, which would change the cached ones.
+        :param key: key of the entry. str
+        :param destinations: dictionary {name of the file in the entry: destination path}. dict
+        :return: True if the entry was found and all its files copied, False otherwise. bool
+        """
+        entry = self.entry_path(key)
+        if not os.path.isdir(entry):
+            logger.info("Cache miss of {} in {}".format(key, self.path))
+            self.count("misses")
+            return False
+        try:
+            for name, destination in destinations.items():
+                tmp_destination = "{}.tmp{}".format(destination, os.getpid())
+                shutil.copyfile(os.path.join(entry, name), tmp_destination)
+                os.replace(tmp_destination, destination)
+            os.utime(entry)  # Most recently used
+        except OSError as error:  # The entry was evicted meanwhile or it is incomplete
+            logger.warning("Entry {} of the cache {} could not be read: {}".format(key, self.path, error))
+            self.count("misses")
+            return False
+        logger.info("Cache hit of {} in {}".format(key, self.path))
+        self.count("hits")
+        return True
+
+    def lock_path(self, name=""):
+        """
+        :param name: key of the entry. Empty for the lock of the whole cache. str
+        :return: lock file. str
+        """
+        if name:
+            return os.path.join(self.path, ".locks", name + ".lock")
+        return os.path.join(self.path, ".lock")
+
+    @contextlib.contextmanager
+    def lock(self, name=""):
+        """
+        Exclusive lock between the workers that use the cache. With a key, the workers that look for an entry that
+        is being created wait for it instead of creating it again. The lock file of a key is removed when its entry
+        is evicted.
+        :param name: key of the entry. Empty to lock the whole cache. str
+        """
+        lock_path = self.lock_path(name)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read_stats(self):
+        """
+        :return: number of "hits" and "misses" of the cache since it was created. dict
+        """
+        try:
+            with open(os.path.join(self.path, "stats.json")) as stats_file:
+                return json.load(stats_file)
+        except (OSError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def count(self, event):
+        """
+        :param event: "hits" or "misses". str
+        """
+        try:
+            with self.lock():
+                stats = self.read_stats()
+                stats[event] = stats.get(event, 0) + 1
+                tmp_path = os.path.join(self.path, "stats.json.tmp{}".format(os.getpid()))
+                with open(tmp_path, "w") as stats_file:
+                    json.dump(stats, stats_file)
+                os.replace(tmp_path, os.path.join(self.path, "stats.json"))
+        except OSError:  # The statistics are not essential
+            pass
+
+    def put(self, key, sources, metadata=None):
+        """
+        :param key: key of the entry. str
+        :param sources: dictionary {name of the file in the entry: path of the file to store}. dict
+        :param metadata: JSON serializable description of the entry, saved in metadata.json to inspect the cache. dict
+        """
+        entry = self.entry_path(key)
+        if os.path.isdir(entry):
+            return
+        tmp_entry = os.path.join(self.path, ".tmp-{}".format(uuid.uuid4().hex))
+        try:
+            os.makedirs(tmp_entry)
+            for name, source in sources.items():
+                shutil.copyfile(source, os.path.join(tmp_entry, name))
+            with open(os.path.join(tmp_entry, "metadata.json"), "w") as metadata_file:
+                json.dump({"key": key, "created": time.time(), "metadata": metadata or {}}, metadata_file,
+                          indent=2, sort_keys=True, default=str)
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            os.rename(tmp_entry, entry)
+        except OSError:  # Another worker stored it first (or the cache is not writable)
+            if not os.path.isdir(entry):
+                logger.warning("Entry {} could not be stored in the cache {}".format(key, self.path))
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+
+    def get_entries(self):
+        """
+        :return: list of (last use, size in bytes, path) of the entries of the cache. list
+        """
+        entries = []
+        for prefix in os.listdir(self.path):
+            prefix_path = os.path.join(self.path, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_path):
+                continue
+            for key in os.listdir(prefix_path):
+                entry = os.path.join(prefix_path, key)
+                try:
+                    size = sum([os.path.getsize(os.path.join(entry, filename)) for filename in os.listdir(entry)])
+                    entries.append((os.path.getmtime(entry), size, entry))
+                except OSError:  # Evicted meanwhile
+                    continue
+        return entries
+
+    def evict(self):
+        """
+        It removes the least recently used entries until the cache fits in max_size.
+        """
+        if not self.max_size:
+            return
+        max_bytes = self.max_size * 1024 * 1024
+        with self.lock():
+            entries = sorted(self.get_entries())
+            total_size = sum([size for last_use, size, entry in entries])
+            for last_use, size, entry in entries:
+                if total_size <= max_bytes:
+                    break
+                # Renamed first, so the workers do not read an entry that is being removed
+                trash = os.path.join(self.path, ".trash-{}".format(uuid.uuid4().hex))
+                try:
+                    os.rename(entry, trash)
+                except OSError:
+                    continue
+                shutil.rmtree(trash, ignore_errors=True)
+                try:
+                    os.rmdir(os.path.dirname(entry))
+                except OSError:  # There are other entries with the same prefix
+                    pass
+                try:
+                    os.remove(self.lock_path(os.path.basename(entry)))
+                except OSError:  # The entry was never locked
+                    pass
+                total_size -= size
+                logger.info("Entry {} evicted from the cache {}".format(os.path.basename(entry), self.path))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Report the size, entries, hits and misses of FrAG caches.")
+    parser.add_argument("paths", nargs="+", help="Folders of the caches.")
+    args = parser.parse_args()
+    return args.paths
+
+
+def main(paths):
+    for path in paths:
+        cache = DiskCache(path, max_size=None)
+        entries = cache.get_entries()
+        stats = cache.read_stats()
+        lookups = stats.get("hits", 0) + stats.get("misses", 0)
+        print("{}: {} entries, {:.1f} MB, {} hits, {} misses ({:.1f} % hit rate)".format(
+              cache.path, len(entries), sum([size for last_use, size, entry in entries]) / (1024 * 1024),
+              stats.get("hits", 0), stats.get("misses", 0), 100. * stats.get("hits", 0) / lookups if lookups else 0.))
+
+
+if __name__ == '__main__':
+    paths = parse_arguments()
+    main(paths)
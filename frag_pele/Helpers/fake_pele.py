@@ -0,0 +1,177 @@
+"""
+Stand-in of PELE that reads a rendered control file and writes synthetic results (report_N, trajectory_N.pdb and the
+log file) with the same layout, sizes and formats than a real simulation. It does not simulate anything: the ligand
+(chain selected to perturb) is randomly displaced a few tenths of Angstrom in each accepted step and the energies are
+random. It allows to run and profile the whole FrAG workflow (templates, clustering, selection of structures and
+analysis) without a PELE installation.
+"""
+import os
+import re
+import json
+import time
+import random
+import argparse
+import logging
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = ["#Task", "Step", "numberOfAcceptedPeleSteps", "currentEnergy"]
+
+
+def parse_arguments():
+    """
+        Parse user arguments
+        Output: list with all the user arguments
+    """
+    parser = argparse.ArgumentParser(description="""Writes synthetic PELE results for a rendered control file.""")
+    required_named = parser.add_argument_group('required named arguments')
+    required_named.add_argument("control_file", help="Rendered PELE control file.")
+    parser.add_argument("-n", "--processors", type=int, default=1,
+                        help="Number of MPI processes emulated. As in PELE, one of them is the master, so "
+                             "processors - 1 trajectories are written (at least one).")
+    parser.add_argument("-t", "--step_time", type=float, default=0.,
+                        help="Seconds spent by each PELE step.")
+    args = parser.parse_args()
+    return args.control_file, args.processors, args.step_time
+
+
+def read_control_file(control_file):
+    """
+    It extracts from a rendered control file the parameters needed to create the synthetic results.
+    :param control_file: path to the control file. str
+    :return: dictionary with the input PDBs ("pdbs"), "report_path", "trajectory_path", "log_path", "steps", "seed",
+    "chain" and report "metrics". dict
+    """
+    with open(control_file) as control:
+        content = control.read()
+    try:
+        control = json.loads(content)
+        command = control["commands"][0]
+        pdbs = [complex_file["files"][0]["path"] for complex_file in control["Initialization"]["MultipleComplex"]]
+        output = command["PELE_Output"]
+        metrics = []
+        for task in command.get("PeleTasks", []):
+            for metric in task.get("metrics", []):
+                if metric["type"] == "bindingEnergy":
+                    metrics.append("Binding Energy")
+                elif metric["type"] != "random":
+                    metrics.append(metric.get("tag", metric["type"]))
+        return {"pdbs": pdbs, "report_path": output["reportPath"], "trajectory_path": output["trajectoryPath"],
+                "log_path": control.get("simulationLogPath"),
+                "steps": int(command["PELE_Parameters"]["numberOfPeleSteps"]),
+                "seed": int(command["RandomGenerator"]["seed"]),
+                "chain": command["selectionToPerturb"]["chains"]["names"][0], "metrics": metrics}
+    except (ValueError, KeyError, IndexError, TypeError):
+        # Control files that are not strict JSON (p.ex. custom templates), use the fields that can be found
+        logger.debug("{} could not be read as JSON, looking only for the required fields.".format(control_file))
+
+        def find(pattern, default=None):
+            match = re.search(pattern, content)
+            return match.group(1) if match else default
+
+        return {"pdbs": re.findall(r'"path"\s*:\s*"([^"]+)"', content),
+                "report_path": find(r'"reportPath"\s*:\s*"([^"]+)"', "report"),
+                "trajectory_path": find(r'"trajectoryPath"\s*:\s*"([^"]+)"', "trajectory.pdb"),
+                "log_path": find(r'"simulationLogPath"\s*:\s*"([^"]+)"'),
+                "steps": int(find(r'"numberOfPeleSteps"\s*:\s*(\d+)', 1)),
+                "seed": int(find(r'"seed"\s*:\s*(\d+)', 1279183)),
+                "chain": find(r'"selectionToPerturb"\s*:\s*{\s*"chains"\s*:\s*{\s*"names"\s*:\s*\[\s*"(\w)"', "L"),
+                "metrics": ["Binding Energy", "sasaLig"]}
+
+
+def get_numbered_path(path, processor):
+    """
+    PELE adds the number of the processor before the extension of the output files: report -> report_1,
+    trajectory.pdb -> trajectory_1.pdb
+    """
+    root, extension = os.path.splitext(path)
+    return "{}_{}{}".format(root, processor, extension)
+
+
+def read_structure(pdb_file):
+    """
+    :param pdb_file: input PDB of the simulation. str
+    :return: list with the ATOM, HETATM and TER lines of the PDB. list
+    """
+    with open(pdb_file) as pdb:
+        return [line.rstrip("\n") for line in pdb if line.startswith(("ATOM", "HETATM", "TER"))]
+
+
+def displace_ligand(lines, chain, rng, max_displacement=0.3):
+    """
+    It moves rigidly the atoms of the ligand chain (HETATM records) a random vector.
+    :return: list of PDB lines with the new coordinates. list
+    """
+    displacement = [rng.uniform(-max_displacement, max_displacement) for axis in range(3)]
+    new_lines = []
+    for line in lines:
+        if line.startswith("HETATM") and line[21:22] == chain:
+            coords = [float(line[30 + 8 * axis:38 + 8 * axis]) + displacement[axis] for axis in range(3)]
+            line = "{}{:8.3f}{:8.3f}{:8.3f}{}".format(line[0:30], coords[0], coords[1], coords[2], line[54:])
+        new_lines.append(line)
+    return new_lines
+
+
+def write_trajectory_and_report(structure, parameters, processor, step_time, rng):
+    """
+    Writes the report and the trajectory of one processor. All the steps are accepted, so the trajectory has
+    steps + 1 models (the initial structure and one for each step).
+    """
+    report_file = get_numbered_path(parameters["report_path"], processor)
+    trajectory_file = get_numbered_path(parameters["trajectory_path"], processor)
+    header = REPORT_COLUMNS + parameters["metrics"]
+    current_energy = rng.uniform(-13500, -13000)
+    binding_energy = rng.uniform(-45, -30)
+    with open(report_file, "w") as report, open(trajectory_file, "w") as trajectory:
+        report.write("    ".join(header) + "    \n")
+        for step in range(parameters["steps"] + 1):
+            if step:
+                time.sleep(step_time)
+                structure = displace_ligand(structure, parameters["chain"], rng)
+                current_energy += rng.gauss(0, 2)
+                binding_energy += rng.gauss(0, 1.5)
+            values = [processor, step, step, "{:.1f}".format(current_energy)]
+            for metric in parameters["metrics"]:
+                if metric == "Binding Energy":
+                    values.append("{:.4f}".format(binding_energy))
+                else:
+                    values.append("{:.6g}".format(rng.uniform(0, 1)))
+            report.write("    ".join([str(value) for value in values]) + "    \n")
+            trajectory.write("MODEL     {}\n{}\nENDMDL    \n".format(step + 1, "\n".join(structure)))
+            report.flush()
+            trajectory.flush()
+
+
+def main(control_file, processors=1, step_time=0.):
+    """
+    :param control_file: rendered PELE control file. str
+    :param processors: number of MPI processes emulated. int
+    :param step_time: seconds spent by each PELE step. float
+    """
+    start_time = time.time()
+    parameters = read_control_file(control_file)
+    n_trajectories = max(processors - 1, 1)
+    output_folder = os.path.dirname(parameters["report_path"])
+    if output_folder and not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    structures = {pdb: read_structure(pdb) for pdb in set(parameters["pdbs"])}
+    mapping = []
+    for processor in range(1, n_trajectories + 1):
+        pdb = parameters["pdbs"][(processor - 1) % len(parameters["pdbs"])]
+        rng = random.Random(parameters["seed"] + processor)
+        write_trajectory_and_report(structures[pdb], parameters, processor, step_time, rng)
+        mapping.append("(0, 1, 1)")
+    with open(os.path.join(output_folder, "processorMapping.txt"), "w") as processor_mapping:
+        processor_mapping.write(":".join(mapping))
+    if parameters["log_path"]:
+        with open(parameters["log_path"], "w") as log:
+            log.write("Fake PELE simulation of {}: {} trajectories of {} steps in {:.2f} s\n".format(
+                control_file, n_trajectories, parameters["steps"], time.time() - start_time))
+    print("Fake PELE simulation finished. Results in {}".format(output_folder))
+
+
+if __name__ == '__main__':
+    control_file, processors, step_time = parse_arguments()
+    main(control_file, processors, step_time)
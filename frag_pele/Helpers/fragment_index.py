@@ -0,0 +1,232 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import argparse
+import numpy as np
+# Local imports
+import frag_pele.constants as c
+from frag_pele.Helpers import parsed_pdb
+try:
+    import rdkit
+    RDKIT = True
+except ImportError:
+    RDKIT = False
+if RDKIT:
+    from rdkit import Chem
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+# Version of the entries, the indexes written by other versions are rebuilt
+INDEX_VERSION = 1
+# Indexes of fragment libraries read in this process: {index file: (key of the file, fragments)}
+_indexes = {}
+
+
+def hash_file(path):
+    """
+    :param path: file. str
+    :return: sha256 of its content. str
+    """
+    with open(path, "rb") as input_file:
+        return hashlib.sha256(input_file.read()).hexdigest()
+
+
+def get_index_path(folder):
+    """
+    :param folder: folder of a fragment library. str
+    :return: index file of the library. str
+    """
+    return os.path.join(folder, c.FRAGMENT_INDEX)
+
+
+def get_repeated_names(lines, chain="L"):
+    """
+    :param lines: lines of a PDB file. list
+    :param chain: chain of the ligand. str
+    :return: PDB atom names of the ligand that are repeated (as checker.check_duplicated_pdbatomnames). list
+    """
+    names = [line[12:17] for line in lines if line.startswith("HETATM") and line[21:22] == chain]
+    return sorted(set([name.strip() for name in names if names.count(name) > 1]))
+
+
+def index_fragment(pdb_file, chain="L"):
+    """
+    It derives, from a PDB file with a fragment, everything that the growings need of it: its atoms, the hydrogens
+    that can be replaced when it is attached (the ones selected by pdb_joiner.get_H_bonded_to_grow), the vectors of
+    these bonds, the bond orders (as detect_bond_type) and its canonical SMILES.
+    :param pdb_file: PDB file with the fragment, and only with it (the hydrogens of a ligand in a complex depend on
+    the rest of the atoms). str
+    :param chain: chain of the fragment. str
+    :return: entry of the fragment in the index, or None if the file is not a fragment. dict
+    """
+    parsed = parsed_pdb.load(pdb_file)
+    structure = parsed.get_structure()
+    if structure is None or set(structure.getChids()) != {chain}:
+        logger.warning("{} is not indexed: it does not only contain a ligand in the chain {}".format(pdb_file, chain))
+        return None
+    names = list(structure.getNames())
+    heavy_atoms = structure.select("not hydrogen")
+    attachments = {}
+    for heavy_atom in (heavy_atoms if heavy_atoms is not None else []):
+        # The same selection that pdb_joiner.get_H_bonded_to_grow does while growing
+        hydrogens = structure.select("chain {} and hydrogen within 1.74 of name {}".format(chain, heavy_atom.getName()))
+        attachments[heavy_atom.getName()] = []
+        for hydrogen in (hydrogens if hydrogens is not None else []):
+            vector = hydrogen.getCoords() - heavy_atom.getCoords()
+            attachments[heavy_atom.getName()].append(
+                [hydrogen.getName(), [round(float(x), 4) for x in vector / np.linalg.norm(vector)]])
+    bonds = None
+    identity = None
+    molecule = Chem.MolFromPDBBlock("".join(parsed.lines), removeHs=False) if RDKIT else None
+    if molecule is not None:
+        atom_names = [atom.GetPDBResidueInfo().GetName().strip() for atom in molecule.GetAtoms()]
+        bonds = [[atom_names[bond.GetBeginAtomIdx()], atom_names[bond.GetEndAtomIdx()], str(bond.GetBondType()).lower()]
+                 for bond in molecule.GetBonds()]
+        identity = Chem.MolToSmiles(Chem.RemoveHs(molecule))
+    elif RDKIT:
+        logger.warning("RDKit could not read {}, its bonds are not indexed".format(pdb_file))
+    status = os.stat(pdb_file)
+    return {"version": INDEX_VERSION, "chain": chain, "mtime_ns": status.st_mtime_ns, "size": status.st_size,
+            "sha256": hash_file(pdb_file), "resname": structure.getResnames()[0], "atoms": names,
+            "elements": list(structure.getElements()), "heavy_atoms": list(attachments),
+            "attachments": attachments, "bonds": bonds, "identity": identity,
+            "repeated_names": get_repeated_names(parsed.lines, chain)}
+
+
+def is_up_to_date(entry, pdb_file, chain="L"):
+    """
+    :param entry: entry of the index. dict
+    :param pdb_file: PDB file of the fragment. str
+    :param chain: chain of the fragment. str
+    :return: True if the entry describes the current content of the file, False otherwise. bool
+    """
+    if entry is None or entry.get("version") != INDEX_VERSION or entry.get("chain") != chain:
+        return False
+    try:
+        status = os.stat(pdb_file)
+    except OSError:
+        return False
+    if status.st_size != entry["size"]:
+        return False
+    # A copied or touched file keeps its content, so it is checked by its hash
+    return status.st_mtime_ns == entry["mtime_ns"] or hash_file(pdb_file) == entry["sha256"]
+
+
+def read_index(folder):
+    """
+    :param folder: folder of a fragment library. str
+    :return: fragments of its index ({PDB file name: entry}), empty if the library is not indexed. dict
+    """
+    index_path = get_index_path(folder)
+    try:
+        key = parsed_pdb.get_file_key(index_path)
+    except OSError:
+        return {}
+    if index_path not in _indexes or _indexes[index_path][0] != key:
+        try:
+            with open(index_path) as index_file:
+                fragments = json.load(index_file).get("fragments", {})
+        except (OSError, ValueError) as error:
+            logger.warning("The fragment index {} could not be read: {}".format(index_path, error))
+            fragments = {}
+        _indexes[index_path] = (key, fragments)
+    return _indexes[index_path][1]
+
+
+def get_fragment_entry(pdb_file, chain="L"):
+    """
+    :param pdb_file: PDB file of a fragment. str
+    :param chain: chain of the fragment. str
+    :return: entry of the fragment in the index of its folder, or None if it is not indexed or the file has changed
+    since it was indexed. dict
+    """
+    folder, filename = os.path.split(os.path.abspath(str(pdb_file)))
+    entry = read_index(folder).get(filename)
+    if is_up_to_date(entry, pdb_file, chain):
+        return entry
+    return None
+
+
+def get_bonded_hydrogens(pdb_file, atom_name, chain="L"):
+    """
+    :param pdb_file: PDB file of a fragment. str
+    :param atom_name: PDB atom name of the heavy atom where the fragment is attached. str
+    :param chain: chain of the fragment. str
+    :return: names of the hydrogens bonded to the atom, or None if they are not indexed. list
+    """
+    entry = get_fragment_entry(pdb_file, chain)
+    if entry is None or atom_name not in entry["attachments"]:
+        return None
+    return [hydrogen for hydrogen, vector in entry["attachments"][atom_name]]
+
+
+def get_bond_type(pdb_file, atom_name_1, atom_name_2, chain="L"):
+    """
+    :param pdb_file: PDB file of a fragment. str
+    :param atom_name_1: PDB atom name of an atom of the bond. str
+    :param atom_name_2: PDB atom name of the other atom of the bond. str
+    :param chain: chain of the fragment. str
+    :return: type of the bond ("single", "double"...) as detect_bond_type, or None if it is not indexed. str
+    """
+    entry = get_fragment_entry(pdb_file, chain)
+    if entry is None or entry["bonds"] is None:
+        return None
+    for name_1, name_2, bond_type in entry["bonds"]:
+        if {name_1, name_2} == {atom_name_1, atom_name_2}:
+            return bond_type
+    raise KeyError("There is no bond between {} and {} in {}".format(atom_name_1, atom_name_2, pdb_file))
+
+
+def build_index(folder, chain="L"):
+    """
+    It indexes all the PDB files of a fragment library. The entries of the files that have not changed since the last
+    indexing are kept.
+    :param folder: folder of the library. str
+    :param chain: chain of the fragments. str
+    :return: fragments of the index ({PDB file name: entry}) and number of them that have been indexed again. tuple
+    """
+    old_fragments = read_index(folder)
+    fragments = {}
+    indexed = 0
+    for pdb_file in sorted(glob.glob(os.path.join(folder, "*.pdb"))):
+        filename = os.path.basename(pdb_file)
+        if is_up_to_date(old_fragments.get(filename), pdb_file, chain):
+            fragments[filename] = old_fragments[filename]
+            continue
+        entry = index_fragment(pdb_file, chain)
+        if entry is not None:
+            fragments[filename] = entry
+            indexed += 1
+    index_path = get_index_path(folder)
+    tmp_path = "{}.tmp{}".format(index_path, os.getpid())
+    with open(tmp_path, "w") as index_file:
+        json.dump({"version": INDEX_VERSION, "fragments": fragments}, index_file, separators=(",", ":"),
+                  sort_keys=True)
+    os.replace(tmp_path, index_path)
+    return fragments, indexed
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Index the fragments of a library (the PDB files of a folder), so "
+                                                 "the growings read their atoms, hydrogens and bonds from the index.")
+    parser.add_argument("folders", nargs="+", help="Folders of the fragment libraries.")
+    parser.add_argument("-fc", "--frag_chain", default="L", help="Chain of the fragments. By default: L")
+    args = parser.parse_args()
+    return args.folders, args.frag_chain
+
+
+def main(folders, chain="L"):
+    for folder in folders:
+        fragments, indexed = build_index(folder, chain)
+        identities = [entry["identity"] for entry in fragments.values() if entry["identity"]]
+        print("{}: {} fragments ({} indexed now, {} up to date), {} of them repeated".format(
+              get_index_path(folder), len(fragments), indexed, len(fragments) - indexed,
+              len(identities) - len(set(identities))))
+
+
+if __name__ == '__main__':
+    folders, chain = parse_arguments()
+    main(folders, chain)
@@ -0,0 +1,34 @@
+import importlib
+
+
+class LazyModule(object):
+    """
+    Stand-in of a module that is only imported when one of its attributes is used for the first time. The modules of
+    FrAG that import heavy dependencies (prody, mdtraj, AdaptivePELE, peleffy, rdkit, pandas...) are loaded this way,
+    so the command line (p.ex. --help) and the worker processes start fast and only pay the imports they need.
+    """
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__["_module"] = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        return "<lazy module '{}'{}>".format(self._name, " (loaded)" if self._module is not None else "")
+
+
+def lazy_import(name):
+    """
+    :param name: full name of the module, p.ex. "frag_pele.Helpers.clusterizer". str
+    :return: LazyModule
+    """
+    return LazyModule(name)
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import hashlib
+import logging
+# Local import
+import frag_pele.constants as c
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+
+def hash_file(path, block_size=1048576):
+    """
+    :param path: path to the file. str
+    :param block_size: number of bytes read at once. int
+    :return: sha256 of the content of the file, or None if the file does not exist. str
+    """
+    if not os.path.isfile(path):
+        return None
+    sha = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for block in iter(lambda: input_file.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def compute_signature(input_hashes=None, parameters=None, upstream=None):
+    """
+    It combines everything that determines the result of a stage into a single hash. When any input file, parameter or
+    previous stage changes, the signature changes too and the stage is considered not done.
+    :param input_hashes: dictionary {path: hash} of the input files of the stage. dict
+    :param parameters: JSON serializable parameters of the stage. dict
+    :param upstream: signatures of the stages this one depends on. list
+    :return: signature of the stage. str
+    """
+    content = json.dumps({"inputs": input_hashes or {}, "parameters": parameters or {}, "upstream": upstream or []},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class StageManifest(object):
+    """
+    Record of the stages of a growing that have been completed in a working directory (pregrow, templates, PELE
+    simulation and clustering of each growing step, sampling, selection of the best structures and scoring). Each
+    stage is saved with the hashes of its inputs, a signature and its output paths, so when a growing is restarted
+    the stages that are still valid can be skipped and it resumes at the first unfinished one. The manifest is written
+    to disk (atomically) each time a stage is recorded.
+    """
+    def __init__(self, working_dir, filename=c.MANIFEST_FILE):
+        self.working_dir = working_dir
+        self.path = os.path.join(working_dir, filename)
+        self.stages = {}
+        self.found = os.path.exists(self.path)
+        if self.found:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as manifest_file:
+                self.stages = json.load(manifest_file).get("stages", {})
+        except ValueError:
+            logger.warning("Stage manifest {} is corrupted. All stages will be run again.".format(self.path))
+            self.stages = {}
+
+    def write(self):
+        tmp_path = "{}.tmp{}".format(self.path, os.getpid())
+        with open(tmp_path, "w") as manifest_file:
+            json.dump({"version": 1, "stages": self.stages}, manifest_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def hash_inputs(self, input_files):
+        """
+        :param input_files: list of paths. list
+        :return: dictionary {path relative to the working directory: hash}. dict
+        """
+        return {self.relative(path): hash_file(path) for path in input_files}
+
+    def relative(self, path):
+        path = os.path.abspath(path)
+        if path.startswith(os.path.abspath(self.working_dir) + os.sep):
+            return os.path.relpath(path, self.working_dir)
+        return path
+
+    def absolute(self, path):
+        return os.path.join(self.working_dir, path)
+
+    def is_done(self, stage, signature):
+        """
+        A stage is done when it has been recorded with the same signature and all its outputs still exist.
+        :param stage: name of the stage. str
+        :param signature: current signature of the stage (see compute_signature). str
+        :return: bool
+        """
+        record = self.stages.get(stage)
+        if not record or record["signature"] != signature:
+            return False
+        missing = [path for path in record["outputs"] if not os.path.exists(self.absolute(path))]
+        if missing:
+            logger.info("Stage {} was done but {} outputs are missing.".format(stage, len(missing)))
+            return False
+        return True
+
+    def get_signature(self, stage):
+        record = self.stages.get(stage)
+        if record:
+            return record["signature"]
+
+    def get_data(self, stage):
+        record = self.stages.get(stage)
+        if record:
+            return record["data"]
+
+    def record(self, stage, signature, input_hashes=None, outputs=(), data=None):
+        """
+        It saves a completed stage and writes the manifest.
+        :param stage: name of the stage. str
+        :param signature: signature of the stage (see compute_signature). str
+        :param input_hashes: dictionary {path: hash} of the inputs of the stage. dict
+        :param outputs: paths of the files or folders generated by the stage. list
+        :param data: JSON serializable values needed to resume the growing without running the stage again.
+        """
+        self.stages[stage] = {"signature": signature, "inputs": input_hashes or {},
+                              "outputs": [self.relative(path) for path in outputs], "data": data,
+                              "finished": time.strftime("%Y-%m-%d %H:%M:%S")}
+        self.write()
+
+    def invalidate(self, stage):
+        if self.stages.pop(stage, None) is not None:
+            self.write()
@@ -0,0 +1,96 @@
+import os
+import logging
+import collections
+# Local imports
+from frag_pele.Helpers.lazy_modules import lazy_import
+prody = lazy_import("prody")
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+# Parsed PDB files, memoized per process
+PARSED_PDB_MEMO_SIZE = 16
+_parsed_pdbs = collections.OrderedDict()
+
+
+def get_file_key(path):
+    """
+    :param path: PDB file. str
+    :return: (real path, modification time in ns, size) of the file. It changes when the file is rewritten. tuple
+    """
+    status = os.stat(path)
+    return os.path.realpath(path), status.st_mtime_ns, status.st_size
+
+
+class ParsedPDB(object):
+    """
+    A PDB file parsed once and shared by all the stages of a growing that read it (the pregrow, the checks of the
+    instructions, the constraints...). Its lines and its ProDy structure are read the first time they are needed.
+    Both are shared, so they must not be modified: get_structure(copy=True) returns a structure that can be changed.
+    The data derived from the structure (p.ex. KD-trees) can be kept in memo, so it is also computed once.
+    """
+    def __init__(self, path, key=None):
+        """
+        :param path: PDB file. str
+        :param key: key of the file when it was loaded (see get_file_key). tuple
+        """
+        self.path = path
+        self.key = key or get_file_key(path)
+        self.memo = {}
+        self._lines = None
+        self._structure = None
+
+    @property
+    def lines(self):
+        """
+        :return: lines of the file (with their newlines). list
+        """
+        if self._lines is None:
+            with open(self.path) as pdb:
+                self._lines = pdb.readlines()
+        return self._lines
+
+    def get_structure(self, copy=False):
+        """
+        :param copy: if set, a copy of the structure is returned, so it can be modified.
+        :return: ProDy molecule of the file. prody.AtomGroup
+        """
+        if self._structure is None:
+            self._structure = prody.parsePDB(self.path)
+        if copy:
+            return self._structure.copy()
+        return self._structure
+
+    def __str__(self):
+        return self.path
+
+    def __repr__(self):
+        return "ParsedPDB({})".format(self.path)
+
+
+def load(pdb):
+    """
+    :param pdb: PDB file, or a ParsedPDB (that is returned as it is).
+    :return: ParsedPDB with the current content of the file. It is taken from the memo if the file has not changed
+    since it was parsed (same modification time and size). ParsedPDB
+    """
+    if isinstance(pdb, ParsedPDB):
+        return pdb
+    key = get_file_key(pdb)
+    parsed = _parsed_pdbs.get(key[0])
+    if parsed is None or parsed.key != key:
+        parsed = ParsedPDB(pdb, key)
+        _parsed_pdbs[key[0]] = parsed
+    _parsed_pdbs.move_to_end(key[0])
+    while len(_parsed_pdbs) > PARSED_PDB_MEMO_SIZE:
+        _parsed_pdbs.popitem(last=False)
+    return parsed
+
+
+def forget(pdb):
+    """
+    It removes a file from the memo. The functions that rewrite a PDB file call it, so the next load parses the file
+    again even if its modification time and size have not changed.
+    :param pdb: PDB file or ParsedPDB.
+    """
+    _parsed_pdbs.pop(os.path.realpath(str(pdb)), None)
@@ -3,8 +3,10 @@ import time
 import shutil
 import subprocess
 import frag_pele.constants as c
+from frag_pele.Helpers import disk_cache
 
 DATA_PATH = "Data/Templates/OPLS2005/Protein"
+PREPWIZARD_OPTIONS = ["-noepik", "-noprotassign", "-noimpref", "-noccd", "-NOJOBID"]
 
 def create_template(pdb_file, sch_path=c.SCHRODINGER,
                     plop_script_path="../PlopRotTemp_S_2017/ligand_prep.py", rotamers="10.0",
@@ -47,8 +49,43 @@ def create_template(pdb_file, sch_path=c.SCHRODINGER,
             raise OSError("Path {} not foud. Change schrodinger path under frag_pele/constants.py".format(sch_python))
     return filename    
 
-def prepare_pdb(pdb_in, pdb_out, sch_path):
-    command = [os.path.join(sch_path, "utilities/prepwizard"), pdb_in, pdb_out, "-noepik", "-noprotassign",
-               "-noimpref", "-noccd", "-NOJOBID"]
-    print(command)
-    subprocess.call(command)
+def get_preparation_key(pdb_content, sch_path, options=PREPWIZARD_OPTIONS):
+    """
+    :param pdb_content: content of the PDB file to prepare. str
+    :param sch_path: path to Schrodinger. str
+    :param options: options of prepwizard. list
+    :return: key of the prepared structure in the preparation cache. str
+    """
+    return disk_cache.hash_content({"pdb": pdb_content, "options": options, "schrodinger": os.path.realpath(sch_path)})
+
+
+def prepare_pdb(pdb_in, pdb_out, sch_path, cwd=None, preparation_cache=c.PREPARATION_CACHE):
+    """
+    It prepares (protonates) a PDB with Schrodinger's prepwizard. The prepared structures are kept in a cache shared
+    across working directories and runs, keyed by the content of the input PDB, the prepwizard options and the
+    Schrodinger installation, so each structure is only prepared once.
+    :param pdb_in: PDB file to prepare, relative to cwd. str
+    :param pdb_out: prepared PDB file, relative to cwd. str
+    :param sch_path: path to Schrodinger. str
+    :param cwd: directory where prepwizard is run. str
+    :param preparation_cache: folder of the cache of prepared structures. None to disable it. str
+    """
+    command = [os.path.join(sch_path, "utilities/prepwizard"), pdb_in, pdb_out] + PREPWIZARD_OPTIONS
+    if not preparation_cache:
+        print(command)
+        subprocess.call(command, cwd=cwd)
+        return
+    pdb_in_path, pdb_out_path = [os.path.join(cwd or ".", path) for path in (pdb_in, pdb_out)]
+    with open(pdb_in_path) as pdb_file:
+        content = pdb_file.read()
+    cache = disk_cache.DiskCache(preparation_cache, max_size=c.PREPARATION_CACHE_SIZE)
+    key = get_preparation_key(content, sch_path, PREPWIZARD_OPTIONS)
+    # The workers that need the same structure wait for the one that prepares it
+    with cache.lock(key):
+        if cache.get(key, {"prepared.pdb": pdb_out_path}):
+            print("Prepared structure of {} taken from the cache {}".format(pdb_in_path, cache.path))
+            return
+        print(command)
+        subprocess.call(command, cwd=cwd)
+        if os.path.exists(pdb_out_path):
+            cache.put(key, {"prepared.pdb": pdb_out_path}, metadata={"pdb": os.path.abspath(pdb_in_path)})
@@ -0,0 +1,49 @@
+import os
+import logging
+# Local imports
+from frag_pele import serie_handler
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+
+class RunContext(object):
+    """
+    Paths of a FrAG run: the directory where it was launched (execution_dir), where the user inputs are read from and
+    the summary of scores is written, and, for a single growing, its working directory. All the paths are absolute and
+    passed explicitly, so the current directory of the process is never changed and several growings can run in the
+    same process (threads or asyncio) without overwriting the files of each other.
+    """
+    def __init__(self, execution_dir=None, working_dir=None):
+        self.execution_dir = os.path.abspath(execution_dir or os.getcwd())
+        self.working_dir = os.path.abspath(working_dir) if working_dir else None
+
+    def path(self, path):
+        """
+        :param path: path given by the user, relative to the execution directory or absolute. str
+        :return: absolute path. str
+        """
+        if path is None or os.path.isabs(path):
+            return path
+        return os.path.join(self.execution_dir, path)
+
+    def working_path(self, *paths):
+        """
+        :return: absolute path inside the working directory of the growing. str
+        """
+        if self.working_dir is None:
+            raise ValueError("The run context of {} has no working directory".format(self.execution_dir))
+        return os.path.join(self.working_dir, *paths)
+
+    def for_growing(self, complex_pdb, ID):
+        """
+        :param complex_pdb: PDB file with the complex that contains the core. str
+        :param ID: identifier of the growing. str
+        :return: RunContext of the growing, with the same execution directory and its own working directory.
+        """
+        return RunContext(self.execution_dir,
+                          os.path.join(self.execution_dir, serie_handler.get_working_dir_name(complex_pdb, ID)))
+
+    def __repr__(self):
+        return "RunContext(execution_dir={}, working_dir={})".format(self.execution_dir, self.working_dir)
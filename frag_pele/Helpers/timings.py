@@ -0,0 +1,218 @@
+"""
+Instrumentation of the stages of a growing. Each stage is measured inside a span (see Span) that records its wall
+time, CPU time (of FrAG and of the finished subprocesses, like PELE) and peak memory, and appends them as a JSON line
+to the timings file of the working directory. Run this module to summarise the hot spots of one or several runs:
+
+    python -m frag_pele.Helpers.timings growing_folder_1 growing_folder_2 ...
+"""
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import argparse
+import resource
+import logging
+import threading
+# Local imports
+import frag_pele.constants as c
+
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+# Spans opened in each thread, to know the parent of the new ones
+_open_spans = threading.local()
+
+
+def get_cpu_times():
+    """
+    :return: CPU seconds (user + system) used by this process and by its finished children. tuple
+    """
+    times = os.times()
+    return times.user + times.system, times.children_user + times.children_system
+
+
+def get_maxrss(who):
+    """
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN. int
+    :return: peak resident memory (kB) given by getrusage, that is in bytes on macOS and in kB on Linux. int
+    """
+    maxrss = resource.getrusage(who).ru_maxrss
+    if sys.platform == "darwin":
+        maxrss //= 1024
+    return maxrss
+
+
+def get_peak_rss():
+    """
+    :return: peak resident memory (kB) of this process and of the biggest of its finished children. tuple
+    """
+    return get_maxrss(resource.RUSAGE_SELF), get_maxrss(resource.RUSAGE_CHILDREN)
+
+
+class Span(object):
+    """
+    Measures a stage of a growing. It can be used as a context manager:
+
+        with timings.Span("cluster_traject", working_dir, step=3):
+            clusterizer.cluster_traject(...)
+
+    or with start() and stop() when the stage does not fit in a block. When the span is stopped, a record with its
+    name, attributes, parent span, wall time, CPU time and peak memory is appended to the timings file of the working
+    directory. The peak memory of a process can only grow, so "peak_rss_increase" is the memory added by the stage on
+    top of the previous stages.
+    """
+    def __init__(self, name, working_dir, filename=c.TIMINGS_FILE, **attributes):
+        self.name = name
+        self.path = os.path.join(working_dir, filename)
+        self.attributes = attributes
+        self.parent = None
+        self.record = None
+
+    def start(self):
+        stack = getattr(_open_spans, "stack", None)
+        if stack is None:
+            stack = _open_spans.stack = []
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start_time = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu, self.start_children_cpu = get_cpu_times()
+        self.start_rss, self.start_children_rss = get_peak_rss()
+        return self
+
+    def stop(self, status="ok"):
+        wall = time.perf_counter() - self.start_wall
+        cpu, children_cpu = get_cpu_times()
+        peak_rss, children_peak_rss = get_peak_rss()
+        stack = _open_spans.stack
+        if self in stack:
+            stack.remove(self)
+        self.record = {"name": self.name, "parent": self.parent, "attributes": self.attributes, "status": status,
+                       "start": self.start_time, "wall": wall, "cpu": cpu - self.start_cpu,
+                       "children_cpu": children_cpu - self.start_children_cpu, "peak_rss": peak_rss,
+                       "peak_rss_increase": peak_rss - self.start_rss, "children_peak_rss": children_peak_rss,
+                       "pid": os.getpid(), "host": socket.gethostname()}
+        try:
+            with open(self.path, "a") as timings_file:
+                timings_file.write(json.dumps(self.record, default=str) + "\n")
+        except (IOError, OSError) as e:
+            logger.warning("Timings of {} could not be saved in {}: {}".format(self.name, self.path, e))
+        return self.record
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.stop("ok" if exc_type is None else exc_type.__name__)
+        return False
+
+
+def read_timings(paths, filename=c.TIMINGS_FILE):
+    """
+    :param paths: timings files or folders, where they are searched recursively. list
+    :param filename: name of the timings files. str
+    :return: list of records (dictionaries) of all the spans. list
+    """
+    timings_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            timings_files.extend(sorted(glob.glob(os.path.join(path, "**", filename), recursive=True)))
+        else:
+            timings_files.append(path)
+    records = []
+    for timings_file in timings_files:
+        with open(timings_file) as input_file:
+            for line in input_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # Line truncated by a killed run
+                record["file"] = timings_file
+                records.append(record)
+    return records
+
+
+def summarise(records, group_by=None):
+    """
+    Aggregates the spans with the same name (and value of the attribute group_by, if set).
+    :param records: spans read with read_timings. list
+    :param group_by: attribute used to split the spans of a name, p.ex. "step". str
+    :return: list of dictionaries with the aggregated values, sorted by total wall time. list
+    """
+    groups = {}
+    for record in records:
+        key = record["name"]
+        if group_by:
+            key = "{}[{}={}]".format(key, group_by, record["attributes"].get(group_by, "-"))
+        group = groups.setdefault(key, {"name": key, "calls": 0, "errors": 0, "wall": 0., "max_wall": 0.,
+                                        "cpu": 0., "children_cpu": 0., "peak_rss": 0, "children_peak_rss": 0,
+                                        "top_level": record["parent"] is None})
+        group["calls"] += 1
+        group["errors"] += record["status"] != "ok"
+        group["wall"] += record["wall"]
+        group["max_wall"] = max(group["max_wall"], record["wall"])
+        group["cpu"] += record["cpu"]
+        group["children_cpu"] += record["children_cpu"]
+        group["peak_rss"] = max(group["peak_rss"], record["peak_rss"])
+        group["children_peak_rss"] = max(group["children_peak_rss"], record["children_peak_rss"])
+    # The share of each stage is computed over the time of the outermost spans (whole growings)
+    total_wall = sum([record["wall"] for record in records if record["parent"] is None]) or \
+                 sum([record["wall"] for record in records])
+    summary = sorted(groups.values(), key=lambda group: group["wall"], reverse=True)
+    for group in summary:
+        group["share"] = 100. * group["wall"] / total_wall if total_wall else 0.
+    return summary
+
+
+def format_summary(summary, top=None):
+    """
+    :return: table of the summary, one stage per line. str
+    """
+    header = "{:<40} {:>6} {:>6} {:>11} {:>10} {:>10} {:>11} {:>12} {:>7} {:>10}".format(
+        "Stage", "Calls", "Errors", "Wall(s)", "Mean(s)", "Max(s)", "CPU(s)", "Child CPU(s)", "Share%", "Peak(MB)")
+    lines = [header, "-" * len(header)]
+    for group in summary[:top]:
+        lines.append("{:<40} {:>6} {:>6} {:>11.2f} {:>10.2f} {:>10.2f} {:>11.2f} {:>12.2f} {:>7.1f} {:>10.1f}".format(
+            group["name"][:40], group["calls"], group["errors"], group["wall"], group["wall"] / group["calls"],
+            group["max_wall"], group["cpu"], group["children_cpu"], group["share"],
+            max(group["peak_rss"], group["children_peak_rss"]) / 1024.))
+    return "\n".join(lines)
+
+
+def parse_arguments():
+    """
+        Parse user arguments
+        Output: list with all the user arguments
+    """
+    parser = argparse.ArgumentParser(description="""Summarises the timings of the stages of one or several FrAG runs,
+    sorted by the total wall time spent in each of them.""")
+    parser.add_argument("paths", nargs="+",
+                        help="Timings files or folders where they are searched recursively.")
+    parser.add_argument("-g", "--group_by", default=None,
+                        help="Split each stage by the value of an attribute, p.ex. 'step' or 'ID'.")
+    parser.add_argument("-t", "--top", type=int, default=None,
+                        help="Number of stages shown. By default, all of them.")
+    parser.add_argument("-j", "--json", action="store_true",
+                        help="Print the summary as JSON.")
+    args = parser.parse_args()
+    return args.paths, args.group_by, args.top, args.json
+
+
+def main(paths, group_by=None, top=None, as_json=False):
+    records = read_timings(paths)
+    if not records:
+        sys.exit("No timings found in {}".format(", ".join(paths)))
+    summary = summarise(records, group_by)
+    if as_json:
+        print(json.dumps(summary[:top], indent=2))
+    else:
+        print("{} spans read from {} files".format(len(records), len(set([record["file"] for record in records]))))
+        print(format_summary(summary, top))
+
+
+if __name__ == '__main__':
+    paths, group_by, top, as_json = parse_arguments()
+    main(paths, group_by, top, as_json)
@@ -9,32 +9,56 @@ DIR = os.path.dirname(__file__)
 # PUBLIC CONSTANTS (to change by the user)
 # Preparation inputs to grow
 
-machine = socket.getfqdn()
-print(machine)
-
 # Paths definitions (IMPORTANT!)
-if "bsc.mn" in machine:
-    # PELE parameters
-    PATH_TO_PELE = "/gpfs/projects/bsc72/PELE++/mniv/V1.6.2-SideChainPert_4/bin/PELE-1.6.2_mpi"
-    PATH_TO_PELE_DATA = "/gpfs/projects/bsc72/PELE++/mniv/V1.6.2-SideChainPert_4/Data"
-    PATH_TO_PELE_DOCUMENTS = None # Data and documents is added automatically from PELE >= 1.6
-    PATH_TO_LICENSE = "/gpfs/projects/bsc72/PELE++/license"
-    # PlopRotTemp parameters
-    SCHRODINGER = "/gpfs/projects/bsc72/SCHRODINGER_ACADEMIC"
-elif "bsccv" in machine:
-    # PELE parameters
-    PATH_TO_PELE = "/data/EAPM/PELE/PELE++/bin/rev12360/Pele_rev12360_mpi"
-    PATH_TO_PELE_DATA = "/data/EAPM/PELE/PELE++/data/rev12360/Data"
-    PATH_TO_PELE_DOCUMENTS = "/data/EAPM/PELE/PELE++/Documents/rev12360"
-    PATH_TO_LICENSE = "/data/EAPM/PELE/PELE++/license"
-    SCHRODINGER = "/data2/bsc72/SCHRODINGER_ACADEMIC"
-else:
-    # PELE parameters
-    PATH_TO_PELE = "/home/user/pelepath/PELE_mpi"
-    PATH_TO_PELE_DATA = None
-    PATH_TO_PELE_DOCUMENTS = None
-    PATH_TO_LICENSE = "/home/user/pelepath/licenses"
-    SCHRODINGER = "/home/user/schrodingerVVVV-VV"
+def get_machine_paths(machine):
+    """
+    Paths to PELE and Schrodinger of the machine. They are set here for the clusters where FrAG is installed.
+    """
+    if "bsc.mn" in machine:
+        # PELE parameters
+        return {"PATH_TO_PELE": "/gpfs/projects/bsc72/PELE++/mniv/V1.6.2-SideChainPert_4/bin/PELE-1.6.2_mpi",
+                "PATH_TO_PELE_DATA": "/gpfs/projects/bsc72/PELE++/mniv/V1.6.2-SideChainPert_4/Data",
+                "PATH_TO_PELE_DOCUMENTS": None,  # Data and documents is added automatically from PELE >= 1.6
+                "PATH_TO_LICENSE": "/gpfs/projects/bsc72/PELE++/license",
+                # PlopRotTemp parameters
+                "SCHRODINGER": "/gpfs/projects/bsc72/SCHRODINGER_ACADEMIC"}
+    elif "bsccv" in machine:
+        # PELE parameters
+        return {"PATH_TO_PELE": "/data/EAPM/PELE/PELE++/bin/rev12360/Pele_rev12360_mpi",
+                "PATH_TO_PELE_DATA": "/data/EAPM/PELE/PELE++/data/rev12360/Data",
+                "PATH_TO_PELE_DOCUMENTS": "/data/EAPM/PELE/PELE++/Documents/rev12360",
+                "PATH_TO_LICENSE": "/data/EAPM/PELE/PELE++/license",
+                "SCHRODINGER": "/data2/bsc72/SCHRODINGER_ACADEMIC"}
+    else:
+        # PELE parameters
+        return {"PATH_TO_PELE": "/home/user/pelepath/PELE_mpi",
+                "PATH_TO_PELE_DATA": None,
+                "PATH_TO_PELE_DOCUMENTS": None,
+                "PATH_TO_LICENSE": "/home/user/pelepath/licenses",
+                "SCHRODINGER": "/home/user/schrodingerVVVV-VV"}
+
+
+MACHINE_PATHS = ("PATH_TO_PELE", "PATH_TO_PELE_DATA", "PATH_TO_PELE_DOCUMENTS", "PATH_TO_LICENSE", "SCHRODINGER")
+
+
+def get_machine():
+    """
+    Name of the machine. It can be set with the FRAG_PELE_MACHINE environment variable, otherwise its fully qualified
+    domain name is looked up (a DNS query, that can block several seconds) the first time it is needed.
+    """
+    if "machine" not in globals():
+        globals()["machine"] = os.environ.get("FRAG_PELE_MACHINE") or socket.getfqdn()
+    return globals()["machine"]
+
+
+def __getattr__(name):
+    # The machine and its paths are only resolved when they are used
+    if name == "machine":
+        return get_machine()
+    if name in MACHINE_PATHS:
+        globals().update(get_machine_paths(get_machine()))
+        return globals()[name]
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
 
 # FragPELE configuration
 CONTROL_TEMPLATE = os.path.join(DIR, "Templates/control_template.conf")
@@ -46,6 +70,21 @@ RESTART = False
 STEPS = 6  # PELE steps for growing step
 BANNED_DIHEDRALS_ATOMS = None
 BANNED_ANGLE_THRESHOLD = None
+MAX_CONCURRENT_GROWINGS = 1  # Instructions of the serie file grown at the same time (0: as many as the cores allow)
+PREPARE_AHEAD = 0  # Growings prepared ahead while the previous ones are running
+PELE_BACKEND = None  # srun, mpirun, serial or fake. None: srun/mpirun depending on the srun flag, serial without cpus
+FAKE_PELE_STEP_TIME = 0.  # Seconds spent in each step by the fake PELE backend
+# Folder of the templates and rotamer libraries shared across runs. Disabled unless FRAG_PELE_TEMPLATE_CACHE is set
+TEMPLATE_CACHE = os.environ.get("FRAG_PELE_TEMPLATE_CACHE") or None
+TEMPLATE_CACHE_SIZE = 2048  # MB, the least recently used templates are removed above it
+# Folder of the structures prepared by Schrodinger's prepwizard shared across runs. Disabled unless
+# FRAG_PELE_PREPARATION_CACHE is set
+PREPARATION_CACHE = os.environ.get("FRAG_PELE_PREPARATION_CACHE") or None
+PREPARATION_CACHE_SIZE = 1024  # MB
+# Placement of the fragment on the core
+PROTEIN_CLASH_THRESHOLD = 2.0  # Amstrongs between an atom of the fragment and one of the receptor
+PLACEMENT_POSES = 1  # Poses of the fragment that start the growing (at most one per PELE processor)
+PLACEMENT_CONFORMERS = 0  # Conformers of the fragment (RDKit) tried besides its input pose
 
 # PELE control file configuration
 REPORT_NAME = "report"
@@ -82,6 +121,11 @@ OUTPUT_FOLDER = "growing_steps/"
 TEMPLATES_FOLDER = "growing_templates"
 CONFIG_PATH = "log_configure.ini"
 PLOP_PATH = "PlopRotTemp_S_2017/ligand_prep.py"
+MANIFEST_FILE = "stage_manifest.json"
+PREPARATION_SUMMARY = "preparation_summary.tsv"
+TIMINGS_FILE = "timings.jsonl"
+SHARED_CORE_FOLDER = "shared_core"
+FRAGMENT_INDEX = "fragment_index.json"
 
 # Messages constants
 TEMPLATE_MESSAGE = "We are going to transform the template _{}_ into _{}_ in _{}_ steps! Starting..."
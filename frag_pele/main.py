@@ -12,16 +12,27 @@ import shutil
 import subprocess
 import traceback
 # Local imports
-from frag_pele.Growing.AddingFragHelpers import complex_to_prody
-from frag_pele.Helpers import clusterizer, checker, folder_handler, runner, constraints, check_constants
-from frag_pele.Helpers import helpers, correct_fragment_names, center_of_mass, plop_rot_temp, create_templates, find_dihedrals
+from frag_pele.Helpers import folder_handler, constraints, check_constants, helpers, correct_fragment_names
+from frag_pele.Helpers import center_of_mass, manifest, timings, run_context, core_templates
 from frag_pele.Growing import template_fragmenter, simulations_linker
-from frag_pele.Growing import add_fragment_from_pdbs, bestStructs
-from frag_pele.Covalent import correct_pdb_to_covalent_res, correct_template_of_backbone_res, correct_rotamer_library
-from frag_pele.Analysis import analyser
-from frag_pele.Banner import Detector as dt
-from frag_pele import serie_handler
+from frag_pele import serie_handler, scheduler
 import frag_pele.constants as c
+# Modules with heavy dependencies (prody, mdtraj, AdaptivePELE, peleffy, rdkit, pandas...), imported on first use
+from frag_pele.Helpers.lazy_modules import lazy_import
+complex_to_prody = lazy_import("frag_pele.Growing.AddingFragHelpers.complex_to_prody")
+clusterizer = lazy_import("frag_pele.Helpers.clusterizer")
+checker = lazy_import("frag_pele.Helpers.checker")
+runner = lazy_import("frag_pele.Helpers.runner")
+plop_rot_temp = lazy_import("frag_pele.Helpers.plop_rot_temp")
+create_templates = lazy_import("frag_pele.Helpers.create_templates")
+find_dihedrals = lazy_import("frag_pele.Helpers.find_dihedrals")
+add_fragment_from_pdbs = lazy_import("frag_pele.Growing.add_fragment_from_pdbs")
+bestStructs = lazy_import("frag_pele.Growing.bestStructs")
+correct_pdb_to_covalent_res = lazy_import("frag_pele.Covalent.correct_pdb_to_covalent_res")
+correct_template_of_backbone_res = lazy_import("frag_pele.Covalent.correct_template_of_backbone_res")
+correct_rotamer_library = lazy_import("frag_pele.Covalent.correct_rotamer_library")
+analyser = lazy_import("frag_pele.Analysis.analyser")
+dt = lazy_import("frag_pele.Banner.Detector")
 
 # Calling configuration file for log system
 FilePath = os.path.abspath(__file__)
@@ -32,9 +43,6 @@ fileConfig(LogPath)
 # Getting the name of the module for the log system
 logger = logging.getLogger(__name__)
 
-# Get current path
-curr_dir = os.path.abspath(os.path.curdir)
-
 
 def parse_arguments():
     """
@@ -68,7 +76,8 @@ def parse_arguments():
                         And col3 is a string with the PDB atom name of the heavy atom of the fragment that will be used
                         to perform the bonding with the core.
                         """)
-    parser.add_argument("--debug", action="store_true", help="Run Frag without launching PELE simulation")
+    parser.add_argument("--debug", action="store_true", help="Run Frag without launching PELE simulation. The serie "
+                                                             "stops at the first growing that fails.")
     parser.add_argument("-nc", "--no_check", action="store_true", help="Don't perform the environment variables check")
     parser.add_argument("-x", "--growing_steps", type=int, default=c.GROWING_STEPS,
                         help="""Number of Growing Steps (GS). By default = {}.""".format(c.GROWING_STEPS))
@@ -77,17 +86,34 @@ def parse_arguments():
                         next GS. Additionally, this parameter will be the selection criteria to extract the best 
                         structure after completing the growing. By default = {}.""".format(c.SELECTION_CRITERIA))
     parser.add_argument("-rst", "--restart", action="store_true",
-                        help="If set FrAG will continue from the last GS detected. If all GS are finished it will"
-                             "restart in the equilibration phase.")
+                        help="If set FrAG will continue from the first stage that is not recorded as done in the "
+                             "stage manifest ({}) of the working folder. In folders without manifest, it will continue "
+                             "from the last GS detected. If all GS are finished it will restart in the equilibration "
+                             "phase.".format(c.MANIFEST_FILE))
     parser.add_argument("-cc", "--c_chain", default="L", help="Chain name of the core. By default = 'L'")
     parser.add_argument("-fc", "--f_chain", default="L", help="Chain name of the fragment. By default = 'L'")
     parser.add_argument("-tc", "--clash_thr", default=None, help="Threshold distance that would to classify intramolecular"
                                                                  "clashes. If None value set, it will use the distance of the "
                                                                  "bond between the fragment and the core." )
+    parser.add_argument("-pps", "--placement_poses", type=int, default=c.PLACEMENT_POSES,
+                        help="Number of poses of the fragment (with the least clashes with the core and the protein) "
+                             "that start the growing, at most one per PELE processor. By default = {}".format(
+                             c.PLACEMENT_POSES))
+    parser.add_argument("-pcf", "--placement_conformers", type=int, default=c.PLACEMENT_CONFORMERS,
+                        help="Number of conformers of the fragment, generated with RDKit, that are tried (with all "
+                             "their rotations around the new bond) to place it. By default = {}".format(
+                             c.PLACEMENT_CONFORMERS))
+    parser.add_argument("-npp", "--no_protein_placement", action="store_true",
+                        help="Place the fragment only avoiding clashes with the core, not with the protein.")
     parser.add_argument("-sc",  "--sampling_control", default=None, help="If set, templatized control file to use in the"
                                                                          " sampling simulation.")
     parser.add_argument("-op",  "--only_prepare", action="store_true", help="If set, all files to run growing are"
-                                                                            " prepared, it stops before running PELE.")
+                                                                            " prepared, it stops before running PELE."
+                                                                            " Each preparation uses one core, so "
+                                                                            "with '-mcg 0' all the cores are used. "
+                                                                            "Stages already prepared are not repeated. "
+                                                                            "A summary is written in {}.".format(
+                                                                            c.PREPARATION_SUMMARY))
     parser.add_argument("-og", "--only_grow", action="store_true", help="If set, it runs all growings of folders "
                                                                         "already prepared.")
     parser.add_argument("-cov", "--cov_res", default=None, help="Set to do growing onto protein residues. Example of selection: "
@@ -110,23 +136,23 @@ def parse_arguments():
     # Plop related arguments
     parser.add_argument("-pl", "--plop_path", default=c.PLOP_PATH,
                         help="Absolute path to PlopRotTemp.py. By default = {}".format(c.PLOP_PATH))
-    parser.add_argument("-sp", "--sch_path", default=c.SCHRODINGER,
-                        help="""Absolute path to Schrodinger's directory. 
-                        By default = {}""".format(c.SCHRODINGER))
+    parser.add_argument("-sp", "--sch_path", default=None,
+                        help="""Absolute path to Schrodinger's directory.
+                        By default, the path set in constants.py for this machine.""")
     parser.add_argument("-rot", "--rotamers", default=c.ROTRES, type=int,
                         help="""Rotamers threshold used in the rotamers' library. 
                             By default = {}""".format(c.ROTRES))
 
 
     # PELE configuration arguments
-    parser.add_argument("-d", "--pele_dir", default=c.PATH_TO_PELE,
+    parser.add_argument("-d", "--pele_dir", default=None,
                         help="Complete path to Pele_serial. "
-                             "By default = {}".format(c.PATH_TO_PELE))
+                             "By default, the path set in constants.py for this machine.")
     parser.add_argument("-c", "--contrl", default=c.CONTROL_TEMPLATE,
                         help="Path to PELE's control file templatized. By default = {}".format(c.CONTROL_TEMPLATE))
-    parser.add_argument("-l", "--license", default=c.PATH_TO_LICENSE,
+    parser.add_argument("-l", "--license", default=None,
                         help="Absolute path to PELE's licenses folder. "
-                             " By default = {}".format(c.PATH_TO_LICENSE))
+                             " By default, the path set in constants.py for this machine.")
     parser.add_argument("-r", "--resfold", default=c.RESULTS_FOLDER,
                         help="Name for PELE's results folder. By default = {}".format(c.RESULTS_FOLDER))
     parser.add_argument("-rp", "--report", default=c.REPORT_NAME,
@@ -171,10 +197,11 @@ def parse_arguments():
     parser.add_argument("-rad", "--radius_box", default=c.RADIUS_BOX,
                         help="Size of the radius to define the box in the PELE simulation where the ligand will be"
                              "perturbed. By default = {}".format(c.RADIUS_BOX))
-    parser.add_argument("-dat", "--data", default=c.PATH_TO_PELE_DATA,
-                        help="Path to PELE Data folder.")
-    parser.add_argument("-doc", "--documents", default=c.PATH_TO_PELE_DOCUMENTS,
-                        help="Path to PELE Documents folder.")
+    parser.add_argument("-dat", "--data", default=None,
+                        help="Path to PELE Data folder. By default, the path set in constants.py for this machine.")
+    parser.add_argument("-doc", "--documents", default=None,
+                        help="Path to PELE Documents folder. By default, the path set in constants.py for this "
+                             "machine.")
     parser.add_argument("-sr", "--srun", default=True,
                         help="If true it runs PELE with srun command, else it will run it with mpirun.")
     parser.add_argument("-core", "--constraint_core", action="store_true",
@@ -233,6 +260,42 @@ def parse_arguments():
                         help="Maximum degrees that can accept the banned dihedral."
                              "By default = {}".format(c.BANNED_ANGLE_THRESHOLD))
 
+    # Scheduling arguments
+    parser.add_argument("-mcg", "--max_concurrent_growings", type=int, default=c.MAX_CONCURRENT_GROWINGS,
+                        help="Maximum number of instructions of the serie file grown at the same time. Each growing "
+                             "uses --cpus cores, so no more than total_cpus // cpus growings will run together. "
+                             "Set to 0 to run as many as the cores allow. By default = {}".format(
+                             c.MAX_CONCURRENT_GROWINGS))
+    parser.add_argument("-tcpu", "--total_cpus", type=int, default=None,
+                        help="Total number of cores available to split between concurrent growings. "
+                             "By default, all the cores of the node.")
+    parser.add_argument("-pa", "--prepare_ahead", type=int, default=c.PREPARE_AHEAD,
+                        help="Number of growings whose files (pregrow and templates) are prepared ahead, on spare "
+                             "cores, while the previous growings are running. By default = {}".format(c.PREPARE_AHEAD))
+    parser.add_argument("-pb", "--pele_backend", default=c.PELE_BACKEND,
+                        choices=["srun", "mpirun", "serial", "fake"],
+                        help="How PELE is launched. 'fake' writes synthetic PELE results without running PELE, to test "
+                             "or profile the workflow. By default, srun or mpirun depending on --srun.")
+    parser.add_argument("-fst", "--fake_step_time", type=float, default=c.FAKE_PELE_STEP_TIME,
+                        help="Seconds spent by each PELE step with --pele_backend fake, to emulate the timings of real "
+                             "simulations. By default = {}".format(c.FAKE_PELE_STEP_TIME))
+    parser.add_argument("-tpc", "--template_cache", default=c.TEMPLATE_CACHE,
+                        help="Folder where the templates and rotamer libraries are cached, to reuse them in the growings "
+                             "(and runs) that parameterize the same molecule, p.ex. ~/.frag_pele/template_cache. By "
+                             "default, the folder of the FRAG_PELE_TEMPLATE_CACHE environment variable, or no cache "
+                             "if it is not set.")
+    parser.add_argument("-ntpc", "--no_template_cache", action="store_true",
+                        help="Always create the templates and rotamer libraries, without the template cache (even if "
+                             "FRAG_PELE_TEMPLATE_CACHE is set).")
+    parser.add_argument("-pc", "--preparation_cache", default=c.PREPARATION_CACHE,
+                        help="Folder where the structures prepared by Schrodinger's prepwizard are cached, to reuse "
+                             "them in other growings and runs, p.ex. ~/.frag_pele/preparation_cache. By default, the "
+                             "folder of the FRAG_PELE_PREPARATION_CACHE environment variable, or no cache if it is not "
+                             "set.")
+    parser.add_argument("-npc", "--no_preparation_cache", action="store_true",
+                        help="Always run prepwizard, without the preparation cache (even if "
+                             "FRAG_PELE_PREPARATION_CACHE is set).")
+
     #Protocol argument
     parser.add_argument("-HT", "--highthroughput", action="store_true",
                         help="Run frag pele high-throughput mode")
@@ -264,7 +327,10 @@ def parse_arguments():
            args.radius_box, args.sampling_control, args.data, args.documents, args.only_prepare, args.only_grow, \
            args.no_check, args.debug, args.highthroughput, args.test, args.cov_res, args.dist_const, \
            args.constraint_core, args.dih_constr, args.protocol, args.st_from, args.min_grow, args.min_sampling, \
-           args.force_field, args.dihedrals_list, args.srun
+           args.force_field, args.dihedrals_list, args.srun, args.max_concurrent_growings, args.total_cpus, \
+           args.prepare_ahead, args.pele_backend, None if args.no_template_cache else args.template_cache, \
+           None if args.no_preparation_cache else args.preparation_cache, args.placement_poses, \
+           args.placement_conformers, not args.no_protein_placement, args.fake_step_time
 
 
 def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iterations, criteria, plop_path, sch_path,
@@ -276,7 +342,10 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                   radius_box=4, sampling_control=None, data=None, documents=None, only_prepare=False, only_grow=False, 
                   no_check=False, debug=False, cov_res=None, dist_constraint=None, constraint_core=None,
                   dih_constr=None, growing_protocol="SoftcoreLike", start_growing_from=0.0, min_grow=0.01, min_sampling=0.1,
-                  force_field='OPLS2005', dih_to_constraint=None, srun=True):
+                  force_field='OPLS2005', dih_to_constraint=None, srun=True, reuse_prepared=False,
+                  pele_backend=None, template_cache=c.TEMPLATE_CACHE, preparation_cache=c.PREPARATION_CACHE,
+                  shared_core=None, context=None, placement_poses=c.PLACEMENT_POSES,
+                  placement_conformers=c.PLACEMENT_CONFORMERS, protein_placement=True):
 
 
     """
@@ -389,6 +458,30 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
     :type radius_box: float
     :param sampling_control: templatized control file to be used in the sampling simulation.
     :type sampling_control: str
+    :param reuse_prepared: if set, the pregrow and templates already recorded as done in the stage manifest of the
+    working folder (for example, prepared ahead) are not run again.
+    :type reuse_prepared: bool
+    :param pele_backend: how PELE is launched: srun, mpirun, serial or fake (see simulations_linker.get_backend).
+    :type pele_backend: str
+    :param template_cache: folder of the cache of templates and rotamer libraries shared across runs. None (default,
+    unless FRAG_PELE_TEMPLATE_CACHE is set) to disable it.
+    :type template_cache: str
+    :param preparation_cache: folder of the cache of structures prepared by prepwizard. None (default, unless
+    FRAG_PELE_PREPARATION_CACHE is set) to disable it.
+    :type preparation_cache: str
+    :param shared_core: core of the serie prepared once by shared_core.prepare_shared_core. If the growing starts from
+    its complex, the template and rotamer library of the core are copied instead of created.
+    :type shared_core: dict
+    :param context: paths of the run. The relative input paths are read from its execution directory, where the
+    working directory of the growing is created. By default, the current directory.
+    :type context: run_context.RunContext
+    :param placement_poses: number of poses of the fragment, with the least clashes with the core and the protein, that
+    start the growing (one per PELE processor, at most cpus - 1).
+    :type placement_poses: int
+    :param placement_conformers: number of conformers of the fragment, generated with RDKit, tried to place it.
+    :type placement_conformers: int
+    :param protein_placement: if set, the poses of the fragment are also scored by their clashes with the protein.
+    :type protein_placement: bool
     :return:
     """
     #Check harcoded path in constants.py
@@ -400,13 +493,14 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
     simulation_info = []
     # Path definition
     plop_relative_path = os.path.join(PackagePath, plop_path)
-    current_path = os.path.abspath(".")
     sch_python = os.path.join(sch_path, "utilities/python")
-    pdb_basename = complex_pdb.split(".pdb")[0]  # Get the name of the pdb without extension
-    if "/" in pdb_basename:
-        pdb_basename = pdb_basename.split("/")[-1]  # And if it is a path, get only the name
-
-    working_dir = os.path.join(current_path, "{}_{}".format(pdb_basename, ID))
+    # All the paths are absolute, the current directory is never changed
+    if context is None:
+        context = run_context.RunContext()
+    context = context.for_growing(complex_pdb, ID)
+    complex_pdb, fragment_pdb, contrl, sampling_control = [context.path(path) for path in (complex_pdb, fragment_pdb,
+                                                                                           contrl, sampling_control)]
+    working_dir = context.working_dir
     if not os.path.exists(working_dir):
         os.mkdir(working_dir)  # Creating a working directory for each PDB-fragment combination
     pdbout_folder = os.path.join(working_dir, pdbout)
@@ -455,18 +549,68 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                 break
     inv_lam = 1-lam_initial
     print(f"Reducing fragment size to the {lam_initial*100} %")
-    fragment_names_dict, hydrogen_atoms, pdb_to_initial_template, pdb_to_final_template, pdb_initialize, \
-    core_original_atom, fragment_original_atom = add_fragment_from_pdbs.main(complex_pdb, fragment_pdb, core_atom,
-                                                                             fragment_atom, inv_lam, h_core=h_core,
-                                                                             h_frag=h_frag, core_chain=c_chain,
-                                                                             fragment_chain=f_chain, rename=rename,
-                                                                             threshold_clash=threshold_clash,
-                                                                             output_path=working_dir,
-                                                                             only_grow=only_grow, cov_res=cov_res)
+    # The stages already done are only skipped when restarting or growing from prepared files
+    stage_manifest = manifest.StageManifest(working_dir)
+    resume = restart or only_grow or reuse_prepared
+    pregrow_parameters = {"core_atom": core_atom, "fragment_atom": fragment_atom, "lambda": inv_lam, "h_core": h_core,
+                          "h_frag": h_frag, "c_chain": c_chain, "f_chain": f_chain, "rename": rename,
+                          "threshold_clash": threshold_clash, "cov_res": cov_res,
+                          "placement_poses": add_fragment_from_pdbs.get_number_of_poses(placement_poses, cpus),
+                          "placement_conformers": placement_conformers, "protein_placement": protein_placement}
+    pregrow_signature = manifest.compute_signature(stage_manifest.hash_inputs([complex_pdb, fragment_pdb]),
+                                                   pregrow_parameters)
+    if resume and stage_manifest.is_done("pregrow", pregrow_signature):
+        print("PREGROW ALREADY DONE, SKIPPING...")
+        pregrow_data = stage_manifest.get_data("pregrow")
+        fragment_names_dict, pdb_to_initial_template, pdb_to_final_template, pdb_initialize, core_original_atom, \
+        fragment_original_atom = [pregrow_data[key] for key in ("fragment_names_dict", "pdb_to_initial_template",
+                                                                "pdb_to_final_template", "pdb_initialize",
+                                                                "core_original_atom", "fragment_original_atom")]
+    else:
+        with timings.Span("pregrow", working_dir, ID=ID):
+            fragment_names_dict, hydrogen_atoms, pdb_to_initial_template, pdb_to_final_template, pdb_initialize, \
+            core_original_atom, fragment_original_atom = add_fragment_from_pdbs.main(complex_pdb, fragment_pdb,
+                                                                                     core_atom, fragment_atom, inv_lam,
+                                                                                     h_core=h_core, h_frag=h_frag,
+                                                                                     core_chain=c_chain,
+                                                                                     fragment_chain=f_chain,
+                                                                                     rename=rename,
+                                                                                     threshold_clash=threshold_clash,
+                                                                                     output_path=working_dir,
+                                                                                     only_grow=only_grow,
+                                                                                     cov_res=cov_res,
+                                                                                     placement_poses=pregrow_parameters[
+                                                                                         "placement_poses"],
+                                                                                     placement_conformers=placement_conformers,
+                                                                                     protein_placement=protein_placement)
+        # The inputs are hashed after the pregrow because it fixes the atom and ligand names in place
+        pregrow_inputs = stage_manifest.hash_inputs([complex_pdb, fragment_pdb])
+        pregrow_signature = manifest.compute_signature(pregrow_inputs, pregrow_parameters)
+        stage_manifest.record("pregrow", pregrow_signature, pregrow_inputs,
+                              outputs=[os.path.join(working_dir, c.PRE_WORKING_DIR, pdb_to_initial_template),
+                                       pdb_to_final_template] +
+                                      add_fragment_from_pdbs.get_initialization_pdbs(pdb_initialize),
+                              data={"fragment_names_dict": fragment_names_dict,
+                                    "pdb_to_initial_template": pdb_to_initial_template,
+                                    "pdb_to_final_template": pdb_to_final_template,
+                                    "pdb_initialize": pdb_initialize, "core_original_atom": core_original_atom,
+                                    "fragment_original_atom": fragment_original_atom})
+    # Poses of the fragment that start the growing, one per PELE processor
+    initialization_pdbs = add_fragment_from_pdbs.get_initialization_pdbs(pdb_initialize,
+                                                                          pregrow_parameters["placement_poses"])
     # Create the templates for the initial and final structures
+    pdbs_to_template = [os.path.join(working_dir, c.PRE_WORKING_DIR, pdb_to_template) for pdb_to_template in
+                        (pdb_to_initial_template, pdb_to_final_template)]
+    templates_inputs = stage_manifest.hash_inputs(pdbs_to_template)
+    templates_signature = manifest.compute_signature(templates_inputs, {"force_field": force_field,
+                                                                        "rotamers": rotamers, "cov_res": cov_res},
+                                                     [pregrow_signature])
+    templates_done = resume and stage_manifest.is_done("templates", templates_signature)
     template_resnames = []
     for pdb_to_template, ch, rn in zip([pdb_to_initial_template, pdb_to_final_template], [c_chain, f_chain], [resnum_core, None]):
-        if not only_grow and not restart:
+        if templates_done:
+            template_name = stage_manifest.get_data("templates")[len(template_resnames)]
+        elif not only_grow and not (restart and not stage_manifest.found):
             if "growing_result.pdb" in pdb_to_template:
                 template_name = "grw"
             else:
@@ -475,17 +619,25 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                 aa_type = template_name
             else:
                 aa_type = None
-            create_templates.get_datalocal(pdb=os.path.join(working_dir,
-                                                 add_fragment_from_pdbs.c.PRE_WORKING_DIR,
-                                                 pdb_to_template), 
-                                           outdir=working_dir, 
-                                           forcefield=force_field, 
-                                           template_name=template_name, 
-                                           aminoacid=cov_res,
-                                           rot_res=rotamers,
-                                           aminoacid_type=aa_type,
-                                           sch_path = sch_path)
-        if restart:
+            with timings.Span("templates", working_dir, ID=ID, template=template_name):
+                if shared_core and shared_core["complex"] == complex_pdb and core_templates.copy_shared_core(
+                        shared_core, os.path.join(working_dir, c.PRE_WORKING_DIR, pdb_to_template), template_name,
+                        working_dir):
+                    template_resnames.append(template_name.upper())
+                    continue
+                create_templates.get_datalocal(pdb=os.path.join(working_dir,
+                                                     add_fragment_from_pdbs.c.PRE_WORKING_DIR,
+                                                     pdb_to_template),
+                                               outdir=working_dir,
+                                               forcefield=force_field,
+                                               template_name=template_name,
+                                               aminoacid=cov_res,
+                                               rot_res=rotamers,
+                                               aminoacid_type=aa_type,
+                                               sch_path = sch_path,
+                                               template_cache=template_cache,
+                                               preparation_cache=preparation_cache)
+        else:  # Growings prepared or started without stage manifest
             if cov_res:
                 template_name = 'grw'
             else:
@@ -502,14 +654,20 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                                                    "DataLocal/Templates/{}/Protein/templates_generated".format(force_field))
     else:
         template_initial, template_final = ["{}z".format(resname.lower()) for resname in template_resnames]
+    templates_outputs = [os.path.join(path_to_templates_generated, template_initial),
+                         os.path.join(path_to_templates_generated, template_final),
+                         os.path.join(path_to_lib, "{}.rot.assign".format(template_resnames[1]))]
+    if not templates_done and all([os.path.exists(output) for output in templates_outputs]):
+        stage_manifest.record("templates", templates_signature, templates_inputs, outputs=templates_outputs,
+                              data=template_resnames)
     if only_prepare:
         print("Files of {} prepared".format(ID))
         return
 
-    templ_ini = template_fragmenter.TemplateImpact(os.path.join(
+    templ_ini = template_fragmenter.load_template(os.path.join(
                                                                path_to_templates_generated,
                                                                template_initial))
-    templ_grw = template_fragmenter.TemplateImpact(os.path.join(
+    templ_grw = template_fragmenter.load_template(os.path.join(
                                                                path_to_templates_generated,
                                                                template_final))
     fragment_atoms, core_atoms_in, core_atoms_grown = template_fragmenter.detect_atoms(template_initial=templ_ini,
@@ -524,7 +682,9 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                                        template_name=template_name,
                                        aminoacid=cov_res,
                                        rot_res=rotamers,
-                                       constrainted_atoms=[atom.pdb_atom_name.replace("_", " ") for atom in core_atoms_grown])
+                                       constrainted_atoms=[atom.pdb_atom_name.replace("_", " ") for atom in core_atoms_grown],
+                                       template_cache=template_cache,
+                                       preparation_cache=preparation_cache)
     if dih_constr:
         frg_atoms = [atom.pdb_atom_name for atom in fragment_atoms]
         dih = find_dihedrals.ComputeDihedrals(os.path.join(working_dir,
@@ -550,7 +710,8 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                                                                            template_resnames[0].lower()),
                                                               os.path.join(data, "Templates/OPLS2005/Protein/leu"))
         # Correcting templates
-        correct_pdb_to_covalent_res.correct_pdb(pdb_initialize, new_chain, resnum_core, template_resnames[1])
+        for pdb_to_correct in initialization_pdbs:
+            correct_pdb_to_covalent_res.correct_pdb(pdb_to_correct, new_chain, resnum_core, template_resnames[1])
         correct_template_of_backbone_res.correct_template(os.path.join(path_to_templates_generated, 
                                                                        template_resnames[1].lower()),
                                                           os.path.join(data, "Templates/OPLS2005/Protein/leu"))
@@ -572,16 +733,18 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
         initial_step = 1
     else:
         initial_step = math.ceil(start_growing_from*(iterations+1))
-    template_fragmenter.main(template_initial_path=os.path.join(
-                                                   path_to_templates_generated, template_initial),
-                             template_grown_path=os.path.join(
-                                                   path_to_templates_generated, template_final),
-                             step=initial_step, total_steps=iterations, 
-                             hydrogen_to_replace=core_original_atom,
-                             core_atom_linker=core_atom,
-                             tmpl_out_path=os.path.join(path_to_templates_generated, 
-                                                        "{}_0".format(template_final)),
-                             null_charges=True, growing_mode=growing_protocol)
+    # The templates of all the steps are generated (and checked) at once, before running any simulation
+    with timings.Span("template_fragmenter", working_dir, ID=ID, step=0):
+        template_fragmenter.create_templates_schedule(template_initial_path=os.path.join(
+                                                          path_to_templates_generated, template_initial),
+                                                      template_grown_path=os.path.join(
+                                                          path_to_templates_generated, template_final),
+                                                      total_steps=iterations,
+                                                      hydrogen_to_replace=core_original_atom,
+                                                      core_atom_linker=core_atom,
+                                                      tmpl_out_path=os.path.join(path_to_templates_generated,
+                                                                                 template_final),
+                                                      initial_step=initial_step, growing_mode=growing_protocol)
 
     rot_lib_filename = os.path.join(working_dir, "DataLocal/LigandRotamerLibs/{}.rot.assign".format(template_resnames[1]))
 
@@ -595,12 +758,15 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
         for subfolder in list_of_subfolders:
             shutil.rmtree(subfolder)
     copy_const_nondih = const
+    clustering_parameters = {"criteria": criteria, "cpus": cpus, "distance_contact": distance_contact,
+                             "threshold": clusterThreshold, "epsilon": epsilon, "condition": condition,
+                             "metricweights": metricweights, "nclusters": nclusters}
     # Simulation loop - LOOP CORE
     skipped_steps = False
     for i, (template, pdb_file, result) in enumerate(zip(templates, pdbs, results)):
 
-        # Only if reset
-        if restart:
+        # Only if reset (growings started without stage manifest)
+        if restart and not stage_manifest.found:
             if os.path.exists(os.path.join(pdbout_folder, "{}".format(i))) and os.path.exists(os.path.join(pdbout_folder,
                                                                                                     "{}".format(i),
                                                                                                     "initial_0_0.pdb")):
@@ -637,14 +803,16 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                     const = constr_dih
             # Check atom overlapping
             if not skipped_steps:
-                pdbs_with_overlapping = clusterizer.check_atom_overlapping(pdb_input_paths)
+                with timings.Span("check_atom_overlapping", working_dir, ID=ID, step=i):
+                    pdbs_with_overlapping = clusterizer.check_atom_overlapping(pdb_input_paths)
                 pdb_input_paths_checked = []
                 for pdb in pdb_input_paths:
                     if pdb not in pdbs_with_overlapping:
                         pdb_input_paths_checked.append(pdb)
             else:
-                pdb_input_paths_checked = [pdb_initialize]
+                pdb_input_paths_checked = initialization_pdbs
                 skipped_steps = False
+            simulation_pdbs = pdb_input_paths_checked
             simulation_file = simulations_linker.control_file_modifier(contrl, pdb=pdb_input_paths_checked, step=i,
                                                                        license=license,
                                                                        working_dir=working_dir,
@@ -663,8 +831,9 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
         else:
             if dih_constr:
                 const = constr_dih
-            logger.info(c.SELECTED_MESSAGE.format(contrl, pdb_initialize, result, i))
-            simulation_file = simulations_linker.control_file_modifier(contrl, pdb=[pdb_initialize], step=i,
+            logger.info(c.SELECTED_MESSAGE.format(contrl, ", ".join(initialization_pdbs), result, i))
+            simulation_pdbs = initialization_pdbs
+            simulation_file = simulations_linker.control_file_modifier(contrl, pdb=initialization_pdbs, step=i,
                                                                        license=license,
                                                                        working_dir=working_dir,
                                                                        overlap=overlapping_factor, results_path=result,
@@ -681,30 +850,42 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                                                                        force_field=force_field)
 
         logger.info(c.LINES_MESSAGE)
+        # Copy the template of the step to the main folder of Templates, where PELE reads it
         if i != 0:
-            if i > mid_step:
-                null_charges = False
-            else:
-                null_charges = True
-            template_fragmenter.main(template_initial_path=os.path.join(path_to_templates_generated, template_initial),
-                                     template_grown_path=os.path.join(path_to_templates_generated, template_final),
-                                     step=i+1, total_steps=iterations, hydrogen_to_replace=core_original_atom,
-                                     core_atom_linker=core_atom,
-                                     tmpl_out_path=os.path.join(path_to_templates, template_final),
-                                     null_charges=null_charges, growing_mode=growing_protocol)
+            shutil.copy(template, os.path.join(path_to_templates, template_final))
 
-        # Make a copy of the template file in growing_templates folder
-        shutil.copy(os.path.join(path_to_templates, template_final), template)
+        # The control file and the template of the step determine the PELE simulation and the clustering
+        pele_inputs = stage_manifest.hash_inputs([simulation_file, template] + simulation_pdbs)
+        pele_signature = manifest.compute_signature(pele_inputs, upstream=[templates_signature])
+        clustering_signature = manifest.compute_signature(parameters=clustering_parameters, upstream=[pele_signature])
+        if restart and stage_manifest.is_done("clustering_{}".format(i), clustering_signature):
+            print("STEP {} ALREADY DONE, JUMPING TO THE NEXT STEP...".format(i))
+            continue
 
         # Creating results folder
         folder_handler.check_and_create_results_folder(result, working_dir)
         # ------SIMULATION PART------
-        # Change directory to the working one
-        os.chdir(working_dir)
         if debug:
             return 
+        # A simulation that failed leaves its step (and the next stages) unrecorded, so a restart runs it again
+        pele_completed = True
+        if restart and stage_manifest.is_done("pele_{}".format(i), pele_signature):
+            print("PELE SIMULATION OF STEP {} ALREADY DONE, CLUSTERING IT...".format(i))
         else:
-            simulations_linker.simulation_runner(pele_dir, simulation_file, cpus, srun)
+            with timings.Span("pele", working_dir, ID=ID, step=i, cpus=cpus):
+                return_code = simulations_linker.simulation_runner(pele_dir, simulation_file, cpus, srun,
+                                                                  backend=pele_backend, cwd=working_dir)
+            pele_outputs = glob.glob(os.path.join(result, "{}*".format(report))) + \
+                           glob.glob(os.path.join(result, "{}*".format(traject)))
+            if return_code and not pele_outputs:
+                raise RuntimeError("PELE simulation of the Growing Step {} failed with exit code {}. No reports "
+                                   "found in {}".format(i, return_code, result))
+            if return_code:
+                logger.warning("PELE simulation of the Growing Step {} failed with exit code {}. Its partial results "
+                               "are used, but it will be run again if the growing is restarted".format(i, return_code))
+                pele_completed = False
+            elif pele_outputs:
+                stage_manifest.record("pele_{}".format(i), pele_signature, pele_inputs, outputs=pele_outputs)
         logger.info(c.LINES_MESSAGE)
         logger.info(c.FINISH_SIM_MESSAGE.format(result))
         # Before selecting a step from a trajectory we will save the input PDB file in a folder
@@ -720,12 +901,16 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
         column_number = clusterizer.get_column_num(result_abs, criteria, report)
         # Selection of the trajectory used as new input
         try:
-            clusterizer.cluster_traject(str(template_resnames[1]), cpus-1, column_number, distance_contact,
+            with timings.Span("cluster_traject", working_dir, ID=ID, step=i):
+                clusterizer.cluster_traject(str(template_resnames[1]), cpus-1, column_number, distance_contact,
                                             clusterThreshold, "{}*".format(os.path.join(result_abs, traject)),
                                             os.path.join(pdbout_folder, str(i)), os.path.join(result_abs),
                                             epsilon, report, condition, metricweights, nclusters)
         except ZeroDivisionError: # If any structure is found in the clustering
             raise ZeroDivisionError(f"Not accepted steps found in the Growing Step {i}. Try to change the amount of Growing Steps or PELE steps")
+        if pele_completed:
+            stage_manifest.record("clustering_{}".format(i), clustering_signature,
+                                  outputs=glob.glob(os.path.join(pdbout_folder, str(i), "*.pdb")))
             
     # ----------------------------------------------------EQUILIBRATION-------------------------------------------------
     # Set input PDBs
@@ -787,27 +972,60 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
                                                                    force_field=force_field)
 
     # EQUILIBRATION SIMULATION
-    # Change directory to the working one
-    os.chdir(working_dir)
     shutil.copy(os.path.join(path_to_templates_generated, template_final), path_to_templates)
-    if not (restart and os.path.exists("top_result")):
-        logger.info(".....STARTING EQUILIBRATION.....")
-        simulations_linker.simulation_runner(pele_dir, simulation_file, cpus, srun)
-    os.chdir(curr_dir)
     equilibration_path = os.path.join(working_dir, "sampling_result")
+    sampling_inputs = stage_manifest.hash_inputs([simulation_file, os.path.join(path_to_templates, template_final)] +
+                                                 pdb_inputs)
+    sampling_signature = manifest.compute_signature(sampling_inputs, upstream=[templates_signature])
+    sampling_completed = True
+    if restart and stage_manifest.is_done("sampling", sampling_signature):
+        print("SAMPLING SIMULATION ALREADY DONE, SKIPPING...")
+    elif not (restart and not stage_manifest.found and os.path.exists(os.path.join(working_dir, "top_result"))):
+        logger.info(".....STARTING EQUILIBRATION.....")
+        with timings.Span("sampling", working_dir, ID=ID, cpus=cpus):
+            return_code = simulations_linker.simulation_runner(pele_dir, simulation_file, cpus, srun,
+                                                              backend=pele_backend, cwd=working_dir)
+        sampling_outputs = glob.glob(os.path.join(equilibration_path, "{}*".format(report))) + \
+                           glob.glob(os.path.join(equilibration_path, "{}*".format(traject)))
+        if return_code and not sampling_outputs:
+            raise RuntimeError("PELE sampling simulation failed with exit code {}. No reports found in {}".format(
+                               return_code, equilibration_path))
+        if return_code:
+            logger.warning("PELE sampling simulation failed with exit code {}. Its partial results are used, but it "
+                           "will be run again if the growing is restarted".format(return_code))
+            sampling_completed = False
+        elif sampling_outputs:
+            stage_manifest.record("sampling", sampling_signature, sampling_inputs, outputs=sampling_outputs)
     # SELECTION OF BEST STRUCTURES
     selected_results_path = os.path.join(working_dir, "top_result")
     if not os.path.exists(selected_results_path):  # Create the folder if it does not exist
         os.mkdir(selected_results_path)
-    best_structure_file, all_output_files = bestStructs.main(criteria, selected_results_path, path=equilibration_path,
-                                                             n_structs=50)
+    best_structs_signature = manifest.compute_signature(parameters={"criteria": criteria, "ID": ID},
+                                                        upstream=[sampling_signature])
+    if restart and stage_manifest.is_done("bestStructs", best_structs_signature):
+        best_structure_file, all_output_files = stage_manifest.get_data("bestStructs")
+    else:
+        with timings.Span("bestStructs", working_dir, ID=ID):
+            best_structure_file, all_output_files = bestStructs.main(criteria, selected_results_path,
+                                                                     path=equilibration_path, n_structs=50)
 
-    shutil.copy(os.path.join(selected_results_path, best_structure_file), os.path.join(working_dir,
-                                                                                       '{}_top.pdb'.format(ID)))
+        shutil.copy(os.path.join(selected_results_path, best_structure_file), os.path.join(working_dir,
+                                                                                           '{}_top.pdb'.format(ID)))
+        if sampling_completed:
+            stage_manifest.record("bestStructs", best_structs_signature,
+                                  outputs=[os.path.join(selected_results_path, output) for output in all_output_files]
+                                  + [os.path.join(working_dir, '{}_top.pdb'.format(ID))],
+                                  data=[best_structure_file, all_output_files])
 
     # COMPUTE AND SAVE THE SCORE
-    analyser.analyse_at_epoch(report_prefix=report, path_to_equilibration=equilibration_path, execution_dir=curr_dir,
-                              column=criteria, quantile_value=0.25)
+    scoring_signature = manifest.compute_signature(parameters={"criteria": criteria, "summary": context.execution_dir},
+                                                   upstream=[best_structs_signature])
+    if not (restart and stage_manifest.is_done("scoring", scoring_signature)):
+        with timings.Span("analyse_at_epoch", working_dir, ID=ID):
+            analyser.analyse_at_epoch(report_prefix=report, path_to_equilibration=equilibration_path,
+                                      execution_dir=context.execution_dir, column=criteria, quantile_value=0.25)
+        if sampling_completed:
+            stage_manifest.record("scoring", scoring_signature)
 
     
     #MOVE FROM PDB TO MAE
@@ -830,13 +1048,85 @@ def grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iteration
     return fragment_names_dict
     
 
-def main(complex_pdb, serie_file, iterations=c.GROWING_STEPS, criteria=c.SELECTION_CRITERIA, plop_path=c.PLOP_PATH, sch_path=c.SCHRODINGER, pele_dir=c.PATH_TO_PELE, contrl=c.CONTROL_TEMPLATE, license=c.PATH_TO_LICENSE, resfold=c.RESULTS_FOLDER, 
+def run_growing_node(node, parent_result, context, growing_args):
+    """
+    Performs a single growing of the growing graph (see serie_handler.build_growing_graph): the addition of the
+    fragment of the node onto the complex of the node, which is the best structure of its parent for successive
+    growings.
+    :param node: node of the growing graph.
+    :type node: dict
+    :param parent_result: value returned by this function for the parent node, None for the first growings.
+    :type parent_result: dict
+    :param context: paths of the run, the working directories are created in its execution directory.
+    :type context: run_context.RunContext
+    :param growing_args: keyword arguments of grow_fragment shared by all the growings.
+    :type growing_args: dict
+    :return: dictionary with the atom name maps of the node and all its ancestors ("atomname_maps"), used to translate
+    the back-referenced atoms (*N*) of the successive growings.
+    """
+    c_chain, f_chain = growing_args["c_chain"], growing_args["f_chain"]
+    fragment_pdb, core_atom, fragment_atom, step_ID, fragment_number = node["task"]
+    complex_sequential_pdb, ID = context.path(node["complex"]), node["ID"]
+    fragment_pdb = context.path(fragment_pdb)
+    if parent_result:
+        atomname_mappig = parent_result["atomname_maps"]
+    else:
+        atomname_mappig = []
+    if fragment_number:
+        previous_fragment_atomnames_map = atomname_mappig[int(fragment_number)-1]
+    else:
+        previous_fragment_atomnames_map = None
+    atoms_if_bond = serie_handler.extract_hydrogens_from_instructions([fragment_pdb, core_atom, fragment_atom])
+    if atoms_if_bond:
+        core_atom = atoms_if_bond[0]
+        if previous_fragment_atomnames_map:
+            core_atom = previous_fragment_atomnames_map[core_atom]
+            h_core = previous_fragment_atomnames_map[atoms_if_bond[1]]
+        else:
+            h_core = atoms_if_bond[1]
+        fragment_atom = atoms_if_bond[2]
+        h_frag = atoms_if_bond[3]
+    else:
+        if previous_fragment_atomnames_map:
+            core_atom = previous_fragment_atomnames_map[core_atom]
+        h_core = None
+        h_frag = None
+    if node["successive"]:
+        if node["parent"]:
+            dict_traceback = correct_fragment_names.main(complex_sequential_pdb)
+        serie_handler.check_instructions((fragment_pdb,) + tuple(node["task"][1:]), complex_sequential_pdb, c_chain,
+                                         f_chain)
+        print("PERFORMING SUCCESSIVE GROWING...")
+    else:
+        print("PERFORMING INDIVIDUAL GROWING...")
+    print("HYDROGEN ATOMS IN INSTRUCTIONS:  {}    {}".format(h_core, h_frag))
+    with timings.Span("growing", context.for_growing(complex_sequential_pdb, ID).working_dir, ID=ID,
+                      fragment=fragment_pdb, only_prepare=bool(growing_args.get("only_prepare"))):
+        atomname_map = grow_fragment(complex_sequential_pdb, fragment_pdb, core_atom, fragment_atom, ID=ID,
+                                     h_core=h_core, h_frag=h_frag, context=context, **growing_args)
+    return {"atomname_maps": atomname_mappig + [atomname_map]}
+
+
+def prepare_growing_node(node, parent_result, context, growing_args):
+    """
+    Prepares the working folder of a node of the growing graph (pregrow and templates) without running PELE, so it can
+    be done ahead while other growings are running. See run_growing_node for the parameters.
+    """
+    growing_args = dict(growing_args, only_prepare=True)
+    run_growing_node(node, parent_result, context, growing_args)
+
+
+def main(complex_pdb, serie_file, iterations=c.GROWING_STEPS, criteria=c.SELECTION_CRITERIA, plop_path=c.PLOP_PATH, sch_path=None, pele_dir=None, contrl=c.CONTROL_TEMPLATE, license=None, resfold=c.RESULTS_FOLDER, 
     report=c.REPORT_NAME, traject=c.TRAJECTORY_NAME, pdbout=c.PDBS_OUTPUT_FOLDER, cpus=c.CPUS, distcont=c.DISTANCE_COUNTER, threshold=c.CONTACT_THRESHOLD, epsilon=c.EPSILON, condition=c.CONDITION, metricweights=c.METRICS_WEIGHTS, 
     nclusters=c.NUM_CLUSTERS, pele_eq_steps=c.PELE_EQ_STEPS, restart=False, min_overlap=c.MIN_OVERLAP, max_overlap=c.MAX_OVERLAP,
     c_chain="L", f_chain="L", steps=c.STEPS, temperature=c.TEMPERATURE, seed=c.SEED, rotamers=c.ROTRES, banned=c.BANNED_DIHEDRALS_ATOMS, limit=c.BANNED_ANGLE_THRESHOLD, mae=False,
     rename=None, threshold_clash=None, steering=c.STEERING, translation_high=c.TRANSLATION_HIGH, rotation_high=c.ROTATION_HIGH, 
-    translation_low=c.TRANSLATION_LOW, rotation_low=c.ROTATION_LOW, explorative=False, radius_box=c.RADIUS_BOX, sampling_control=None, data=c.PATH_TO_PELE_DATA, documents=c.PATH_TO_PELE_DOCUMENTS, 
-    only_prepare=False, only_grow=False, no_check=False, debug=False, protocol=False, test=False, cov_res=None, dist_constraint=None, constraint_core=False, dih_constr=None, growing_protocol="SoftcoreLike", start_growing_from=0.0, min_grow=0.01, min_sampling=0.1, force_field='OPLS2005', dih_to_constraint=None, srun=True):
+    translation_low=c.TRANSLATION_LOW, rotation_low=c.ROTATION_LOW, explorative=False, radius_box=c.RADIUS_BOX, sampling_control=None, data=None, documents=None, 
+    only_prepare=False, only_grow=False, no_check=False, debug=False, protocol=False, test=False, cov_res=None, dist_constraint=None, constraint_core=False, dih_constr=None, growing_protocol="SoftcoreLike", start_growing_from=0.0, min_grow=0.01, min_sampling=0.1, force_field='OPLS2005', dih_to_constraint=None, srun=True,
+    max_concurrent_growings=c.MAX_CONCURRENT_GROWINGS, total_cpus=None, prepare_ahead=c.PREPARE_AHEAD,
+    pele_backend=c.PELE_BACKEND, template_cache=c.TEMPLATE_CACHE, preparation_cache=c.PREPARATION_CACHE,
+    context=None, placement_poses=c.PLACEMENT_POSES, placement_conformers=c.PLACEMENT_CONFORMERS,
+    protein_placement=True, fake_step_time=c.FAKE_PELE_STEP_TIME):
 
     if protocol == "HT":
         iteration = 1
@@ -850,129 +1140,88 @@ def main(complex_pdb, serie_file, iterations=c.GROWING_STEPS, criteria=c.SELECTI
         pele_eq_steps = 1
         temp = 1000000
 
-    #HOT FIX!! Fix it properly
-    original_dir = os.path.abspath(os.getcwd())
+    # The paths of the machine are only looked up when they are not given
+    sch_path = sch_path or c.SCHRODINGER
+    pele_dir = pele_dir or c.PATH_TO_PELE
+    license = license or c.PATH_TO_LICENSE
+    data = data or c.PATH_TO_PELE_DATA
+    documents = documents or c.PATH_TO_PELE_DOCUMENTS
+    if pele_backend == simulations_linker.FakePeleBackend.name:
+        pele_backend = simulations_linker.FakePeleBackend(step_time=fake_step_time)
+
+    # Paths of the run, the current directory by default. It is never changed, so several runs can share a process
+    if context is None:
+        context = run_context.RunContext()
+    complex_pdb, serie_file = context.path(complex_pdb), context.path(serie_file)
     list_of_instructions = serie_handler.read_instructions_from_file(serie_file)
     print("READING INSTRUCTIONS... You will perform the growing of {} fragments. GOOD LUCK and ENJOY the "
           "trip :)".format(len(list_of_instructions)))
     dict_traceback = correct_fragment_names.main(complex_pdb)
-    for instruction in list_of_instructions:
-        # We will iterate trough all individual instructions of file.
-        os.chdir(original_dir)
-        # SUCCESSIVE GROWING
-        if type(instruction) == list:  #  If in the individual instruction we have more than one command means successive growing.
-            growing_counter = len(instruction)  #  Doing so we will determinate how many successive growings the user wants to do.
-            atomname_mappig = []
-            for i in range(int(growing_counter)):
-                core_from_previous_fragment = instruction[i][-1]
-                fragment_pdb, core_atom, fragment_atom = instruction[i][0], instruction[i][1], instruction[i][2]
-                atoms_if_bond = serie_handler.extract_hydrogens_from_instructions([fragment_pdb, core_atom, fragment_atom])
-                if atoms_if_bond:
-                    core_atom = atoms_if_bond[0]
-                    if core_from_previous_fragment and i!=0:
-                        previous_fragment_atomnames_map = atomname_mappig[int(instruction[i][4])-1]
-                        core_atom = previous_fragment_atomnames_map[core_atom]
-                        h_core = previous_fragment_atomnames_map[atoms_if_bond[1]]
-                    else:
-                        h_core = atoms_if_bond[1]
-                    fragment_atom = atoms_if_bond[2]
-                    h_frag = atoms_if_bond[3]
-                else:
-                    if core_from_previous_fragment and i!=0:
-                        previous_fragment_atomnames_map = atomname_mappig[int(instruction[i][4])-1]
-                        core_atom = previous_fragment_atomnames_map[core_atom]
-                    h_core = None
-                    h_frag = None
-                if i == 0:  # In the first iteration we will use the complex_pdb as input.
-                    complex_sequential_pdb = complex_pdb
-                    ID = instruction[i][3]
-                else:
-                    if i == 1:  # If is not the first we will use as input the output of the previous iteration
-                        pdb_basename = complex_pdb.split(".pdb")[0]  # Get the name of the pdb without extension
-                        if "/" in pdb_basename:
-                            pdb_basename = pdb_basename.split("/")[-1]  # And if it is a path, get only the name
-                    if i > 1:
-                        previous_ID = instruction[i-2][-1] + "_top"
-                        pdb_basename = "{}_{}".format(previous_ID, ID)
-                        if "/" in pdb_basename:
-                            pdb_basename = pdb_basename.split("/")[-1]
-                    working_dir = "{}_{}".format(pdb_basename, ID)
-                    complex_sequential_pdb = os.path.join(working_dir, '{}_top.pdb'.format(ID))
-                    dict_traceback = correct_fragment_names.main(complex_sequential_pdb)
-                    ID_completed = []
-                    for id in instruction[0:i+1]:
-                        ID_completed.append(id[3])
-                    ID = "".join(ID_completed)
-                try:
-                    ID = ID.split("/")[-1]
-                except Exception:
-                    os.chdir(original_dir)
-                    traceback.print_exc()
-                    if debug: raise Exception()
-                try:
-                    ID = ID.split("/")[-1]
-                except Exception:
-                    os.chdir(original_dir)
-                    traceback.print_exc()
-                    if debug: raise Exception()
-                try:
-                    serie_handler.check_instructions(instruction[i], complex_sequential_pdb, c_chain, f_chain)
-                    print("PERFORMING SUCCESSIVE GROWING...")
-                    print("HYDROGEN ATOMS IN INSTRUCTIONS:  {}    {}".format(h_core, h_frag))
-                    atomname_map = grow_fragment(complex_sequential_pdb, fragment_pdb, core_atom, fragment_atom, 
-                                   iterations, criteria, plop_path, sch_path, pele_dir, contrl, license, resfold, 
-                                   report, traject, pdbout, cpus, distcont, threshold, epsilon, condition, 
-                                   metricweights, nclusters, pele_eq_steps, restart, min_overlap, max_overlap, 
-                                   ID, h_core, h_frag, c_chain, f_chain, steps, temperature, seed, rotamers, banned,
-                                   limit, mae, rename, threshold_clash, steering, translation_high, rotation_high,
-                                   translation_low, rotation_low, explorative, radius_box, sampling_control, data, documents,
-                                   only_prepare, only_grow, no_check, debug, cov_res, dist_constraint, constraint_core,
-                                   dih_constr, growing_protocol, start_growing_from, min_grow, min_sampling, force_field,
-                                   dih_to_constraint, srun)
-
-                    atomname_mappig.append(atomname_map)
- 
-                except Exception:
-                    os.chdir(original_dir)
-                    traceback.print_exc()
-                    if debug: raise Exception()
-        # INDIVIDUAL GROWING
-        else:
-            # Initialize the growing for each line in the file
-            fragment_pdb, core_atom, fragment_atom, ID = instruction[0], instruction[1], instruction[2], instruction[3]
-            atoms_if_bond = serie_handler.extract_hydrogens_from_instructions([fragment_pdb, core_atom, fragment_atom])
-            try:
-                complex_pdb = complex_pdb
-                ID = ID.split("/")[-1]
-            except Exception:
-                os.chdir(original_dir)
-                traceback.print_exc()
-                if debug: raise Exception()
- 
-            if atoms_if_bond:
-                core_atom = atoms_if_bond[0]
-                h_core = atoms_if_bond[1]
-                fragment_atom = atoms_if_bond[2]
-                h_frag = atoms_if_bond[3]
-            else:
-                h_core = None
-                h_frag = None
-            try:
-                print("PERFORMING INDIVIDUAL GROWING...")
-                print("HYDROGEN ATOMS IN INSTRUCTIONS:  {}    {}".format(h_core, h_frag))
-                grow_fragment(complex_pdb, fragment_pdb, core_atom, fragment_atom, iterations, criteria, plop_path, sch_path,
-                     pele_dir, contrl, license, resfold, report, traject, pdbout, cpus, distcont, threshold, epsilon,
-                     condition, metricweights, nclusters, pele_eq_steps, restart, min_overlap, max_overlap, ID, h_core,
-                     h_frag, c_chain, f_chain, steps, temperature, seed, rotamers, banned, limit, mae, rename,
-                     threshold_clash, steering, translation_high, rotation_high,
-                     translation_low, rotation_low, explorative, radius_box, sampling_control, data, documents,
-                     only_prepare, only_grow, no_check, debug, cov_res, dist_constraint, constraint_core, dih_constr,
-                     growing_protocol, start_growing_from, min_grow, min_sampling, force_field, dih_to_constraint, srun)
-            except Exception:
-                os.chdir(original_dir)
-                traceback.print_exc()
-                if debug: raise Exception()
-        os.chdir(original_dir) 
+    if template_cache:
+        logger.info("Templates and rotamer libraries are cached in {}".format(template_cache))
+    if preparation_cache:
+        logger.info("Structures prepared by prepwizard are cached in {}".format(preparation_cache))
+    growing_args = dict(iterations=iterations, criteria=criteria, plop_path=plop_path, sch_path=sch_path,
+                        pele_dir=pele_dir, contrl=contrl, license=license, resfold=resfold, report=report,
+                        traject=traject, pdbout=pdbout, cpus=cpus, distance_contact=distcont,
+                        clusterThreshold=threshold, epsilon=epsilon, condition=condition, metricweights=metricweights,
+                        nclusters=nclusters, pele_eq_steps=pele_eq_steps, restart=restart, min_overlap=min_overlap,
+                        max_overlap=max_overlap, c_chain=c_chain, f_chain=f_chain, steps=steps,
+                        temperature=temperature, seed=seed, rotamers=rotamers, banned=banned, limit=limit, mae=mae,
+                        rename=rename, threshold_clash=threshold_clash, steering=steering,
+                        translation_high=translation_high, rotation_high=rotation_high,
+                        translation_low=translation_low, rotation_low=rotation_low, explorative=explorative,
+                        radius_box=radius_box, sampling_control=sampling_control, data=data, documents=documents,
+                        only_prepare=only_prepare, only_grow=only_grow, no_check=no_check, debug=debug,
+                        cov_res=cov_res, dist_constraint=dist_constraint, constraint_core=constraint_core,
+                        dih_constr=dih_constr, growing_protocol=growing_protocol,
+                        start_growing_from=start_growing_from, min_grow=min_grow, min_sampling=min_sampling,
+                        force_field=force_field, dih_to_constraint=dih_to_constraint, srun=srun,
+                        reuse_prepared=bool(only_prepare or prepare_ahead), pele_backend=pele_backend,
+                        template_cache=template_cache, preparation_cache=preparation_cache,
+                        placement_poses=placement_poses, placement_conformers=placement_conformers,
+                        protein_placement=protein_placement)
+    growing_graph = serie_handler.build_growing_graph(list_of_instructions, complex_pdb, context.execution_dir)
+    root_fragments = [node["task"][0] for node in growing_graph if node["parent"] is None]
+    if len(root_fragments) > 1 and not only_grow:
+        # The template of the core is created once for all the growings that start from complex_pdb. The inputs are
+        # fixed before, as the pregrow of each growing would do, so the core they extract is the same
+        try:
+            scheduler.normalize_shared_inputs(complex_pdb, root_fragments, c_chain, f_chain, cov_res)
+            growing_args["shared_core"] = core_templates.prepare_shared_core(complex_pdb, context.execution_dir,
+                                                                             c_chain, cov_res, force_field,
+                                                                             rotamers, sch_path, template_cache,
+                                                                             preparation_cache)
+        except Exception:
+            traceback.print_exc()
+            logger.warning("The template of the core of {} could not be prepared. Each growing will create "
+                           "it.".format(complex_pdb))
+    if only_prepare:
+        # The preparation of a growing does not run PELE, so each one only needs one core
+        max_concurrent_growings = scheduler.get_concurrent_growings(1, max_concurrent_growings, total_cpus)
+    else:
+        max_concurrent_growings = scheduler.get_concurrent_growings(cpus, max_concurrent_growings, total_cpus)
+    if prepare_ahead and not only_prepare:
+        prepare_function = prepare_growing_node
+    else:
+        prepare_function = None
+    if max_concurrent_growings > 1 or prepare_function:
+        # The shared inputs are fixed before dispatching, so the growings do not rewrite them at the same time
+        normalize = dict(c_chain=c_chain, f_chain=f_chain, cov_res=cov_res)
+    else:
+        normalize = None
+    # In debug mode the serie stops at the first failed growing, which is raised at the end
+    results = scheduler.run_graph(growing_graph, run_growing_node, max_concurrent_growings, context,
+                                  growing_args, normalize=normalize, prepare_function=prepare_function,
+                                  prepare_ahead=prepare_ahead, progress=only_prepare, stop_on_failure=debug)
+    if only_prepare:
+        scheduler.write_summary(results, os.path.join(context.execution_dir, c.PREPARATION_SUMMARY),
+                                done_label="prepared")
+    failed = [(node, result) for node, status, result, duration in results if status == "failed"]
+    if debug and failed:
+        node, error = failed[0]
+        raise Exception("Growing {} failed: {}".format(node["ID"], scheduler.get_error_message(error)))
+
 
 if __name__ == '__main__':
     complex_pdb, iterations, criteria, plop_path, sch_path, pele_dir, \
@@ -982,7 +1231,9 @@ if __name__ == '__main__':
     rename, threshold_clash, steering, translation_high, rotation_high, \
     translation_low, rotation_low, explorative, radius_box, sampling_control, data, documents, \
     only_prepare, only_grow, no_check, debug, protocol, test, cov_res, dist_constraint, constraint_core, \
-    dih_constr, protocol, start_growing_from, min_grow, min_sampling, force_field, dih_to_constraint, srun = parse_arguments()
+    dih_constr, protocol, start_growing_from, min_grow, min_sampling, force_field, dih_to_constraint, srun, \
+    max_concurrent_growings, total_cpus, prepare_ahead, pele_backend, template_cache, \
+    preparation_cache, placement_poses, placement_conformers, protein_placement, fake_step_time = parse_arguments()
     
     main(complex_pdb, serie_file, iterations, criteria, plop_path, sch_path, pele_dir, contrl, license, resfold,
              report, traject, pdbout, cpus, distcont, threshold, epsilon, condition, metricweights,
@@ -991,5 +1242,9 @@ if __name__ == '__main__':
              rename, threshold_clash, steering, translation_high, rotation_high,
              translation_low, rotation_low, explorative, radius_box, sampling_control, data, documents,
              only_prepare, only_grow, no_check, debug, protocol, test, cov_res, dist_constraint, constraint_core,
-             dih_constr, protocol, start_growing_from, min_grow, min_sampling, force_field, dih_to_constraint, srun)
+             dih_constr, protocol, start_growing_from, min_grow, min_sampling, force_field, dih_to_constraint, srun,
+             max_concurrent_growings=max_concurrent_growings, total_cpus=total_cpus, prepare_ahead=prepare_ahead,
+             pele_backend=pele_backend, template_cache=template_cache, preparation_cache=preparation_cache,
+             placement_poses=placement_poses, placement_conformers=placement_conformers,
+             protein_placement=protein_placement, fake_step_time=fake_step_time)
 
@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import queue
+import collections
+import logging
+import traceback
+import multiprocessing as mp
+# Local imports
+from frag_pele.Helpers.lazy_modules import lazy_import
+checker = lazy_import("frag_pele.Helpers.checker")
+add_fragment_from_pdbs = lazy_import("frag_pele.Growing.add_fragment_from_pdbs")
+complex_to_prody = lazy_import("frag_pele.Growing.AddingFragHelpers.complex_to_prody")
+
+# Getting the name of the module for the log system
+logger = logging.getLogger(__name__)
+
+
+def get_concurrent_growings(cpus, max_concurrent_growings=1, total_cpus=None):
+    """
+    It computes how many growings can run at the same time splitting the cores of the node between them. Each growing
+    uses 'cpus' cores, so the number of growings is limited by total_cpus // cpus.
+    :param cpus: number of cores used by each growing (PELE processors). int
+    :param max_concurrent_growings: maximum number of growings running at the same time. If 0, as many growings as
+    the cores of the node allow will be run. int
+    :param total_cpus: number of cores of the node. If None, all the cores detected will be used. int
+    :return: number of growings that will run at the same time. int
+    """
+    if not total_cpus:
+        total_cpus = os.cpu_count() or 1
+    cpus = max(int(cpus), 1)
+    cores_limit = max(int(total_cpus) // cpus, 1)
+    if not max_concurrent_growings:
+        return cores_limit
+    if int(max_concurrent_growings) > cores_limit:
+        logger.warning("{} concurrent growings of {} cores do not fit in {} cores. Only {} will run at the same "
+                       "time.".format(max_concurrent_growings, cpus, total_cpus, cores_limit))
+        return cores_limit
+    return int(max_concurrent_growings)
+
+
+def normalize_shared_inputs(complex_pdb, fragments, c_chain="L", f_chain="L", cov_res=None):
+    """
+    The pregrow stage fixes the ligand names and the PDB atom names of its input files in place. When several
+    growings that share the same complex or fragments run at the same time they would be rewriting the same files
+    concurrently, so this function applies these fixes once before dispatching them. Afterwards, the fixes done by
+    each growing do not modify the files.
+    :param complex_pdb: PDB file with the complex that contains the core. str
+    :param fragments: PDB files of the fragments that will be grown onto complex_pdb. list
+    :param c_chain: chain of the core. str
+    :param f_chain: chain of the fragments. str
+    :param cov_res: residue selection (chain:resnum) if the growing is done onto a protein residue. str
+    """
+    if cov_res:
+        core_chain, core_res = complex_to_prody.read_residue_string(cov_res)
+        add_fragment_from_pdbs.check_and_fix_resname(complex_pdb, core_chain, core_res)
+    else:
+        core_chain, core_res = c_chain, None
+    for fragment in sorted(set(fragments)):
+        add_fragment_from_pdbs.check_and_fix_repeated_lignames(complex_pdb, fragment, core_chain, f_chain, core_res)
+    for pdb_file in [complex_pdb] + sorted(set(fragments)):
+        checker.check_and_fix_pdbatomnames(pdb_file)
+
+
+def get_error_message(error):
+    """
+    :param error: traceback string returned by contained_call or reason why a growing was skipped. str
+    :return: last line of the error. str
+    """
+    return str(error).strip().split("\n")[-1]
+
+
+def contained_call(function, args, kwargs):
+    """
+    Runs a growing keeping its failures contained: any error (even a sys.exit) is printed and reported back instead
+    of being propagated to the scheduler.
+    :return: tuple (succeeded, result or traceback string, duration in seconds)
+    """
+    start_time = time.time()
+    try:
+        return True, function(*args, **kwargs), time.time() - start_time
+    except KeyboardInterrupt:
+        raise
+    except BaseException:
+        traceback.print_exc()
+        return False, traceback.format_exc(), time.time() - start_time
+
+
+def print_progress(done, total, failed, start_time, width=40):
+    """
+    Prints a progress bar in the standard error, overwriting the previous one.
+    :param done: number of tasks finished. int
+    :param total: total number of tasks. int
+    :param failed: number of tasks finished that failed or were skipped. int
+    :param start_time: time when the tasks started. float
+    """
+    filled = int(width * done / total) if total else width
+    elapsed = time.time() - start_time
+    if done:
+        remaining = "{:.1f} min".format(elapsed * (total - done) / done / 60)
+    else:
+        remaining = "?"
+    sys.stderr.write("\r[{}{}] {}/{} ({:.1f}%) failed/skipped: {} elapsed: {:.1f} min remaining: {}".format(
+        "#" * filled, "." * (width - filled), done, total, 100. * done / total if total else 100., failed,
+        elapsed / 60, remaining))
+    if done == total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+def get_descendants(node, nodes_by_key):
+    """
+    :return: list with the keys of all the nodes that depend on the given node of the growing graph.
+    """
+    descendants = []
+    for child in node["children"]:
+        descendants.append(child)
+        descendants.extend(get_descendants(nodes_by_key[child], nodes_by_key))
+    return descendants
+
+
+def run_graph(nodes, function, max_concurrent_growings, *args, normalize=None, prepare_function=None, prepare_ahead=0,
+              progress=False, stop_on_failure=False, **kwargs):
+    """
+    Runs function(node, parent_result, *args, **kwargs) for each node of the growing graph built by
+    serie_handler.build_growing_graph. A node is dispatched as soon as its parent has finished successfully and its best
+    structure ("top") exists, so sibling branches run at the same time and each parent is grown only once. The nodes
+    that depend on a failed growing are skipped. With max_concurrent_growings equal to 1 the nodes are run one after
+    another in this process.
+    If prepare_function and prepare_ahead are set, the preparation of the next prepare_ahead nodes waiting for a free
+    slot is run in a separate pool while the current growings are running (for example, while PELE runs), by calling
+    prepare_function(node, parent_result, *args, **kwargs). The nodes are always grown in order: if the first node of
+    the queue is still being prepared, the scheduler waits for its preparation.
+    If stop_on_failure is set, no more nodes are dispatched after the first failed growing: the running ones finish and
+    the rest are skipped. With max_concurrent_growings equal to 1 this stops the serie at the first failure.
+    :param nodes: list of nodes of the growing graph, parents before children. list
+    :param function: function that performs the growing of a single node. Its return value is passed to the children
+    as parent_result.
+    :param max_concurrent_growings: number of processes of the pool. int
+    :param normalize: if set, dictionary with the c_chain, f_chain and cov_res arguments of normalize_shared_inputs,
+    which is applied to the inputs of each group of siblings before dispatching them. dict
+    :param prepare_function: function that prepares a single node before it is grown.
+    :param prepare_ahead: number of nodes prepared ahead of the growings (and processes of the preparation pool). int
+    :param progress: if set, a progress bar is printed each time a node finishes. bool
+    :param stop_on_failure: if set, no more nodes are started after the first failure. bool
+    :return: list of tuples (node, status, result or error message, duration in seconds), in the order of the nodes.
+    The status is "done", "failed" or "skipped" (when the growing it depends on failed or did not produce its best
+    structure, or when the scheduler stopped at a failure).
+    """
+    start_time = time.time()
+    nodes_by_key = {node["key"]: node for node in nodes}
+    results = {}
+    finished = queue.Queue()
+    waiting = collections.deque()  # Nodes with their dependencies done, waiting for a free slot
+    preparing = set()
+    prepared = set()
+    stopped_by = []  # Failed growing that stopped the scheduler (with stop_on_failure)
+    running = 0
+    logger.info("Running {} growings, {} at the same time.".format(len(nodes), max_concurrent_growings))
+    if max_concurrent_growings > 1:
+        pool = mp.Pool(max_concurrent_growings, maxtasksperchild=1)
+    else:
+        pool = None
+    if prepare_function is not None and prepare_ahead:
+        logger.info("Preparing up to {} growings ahead.".format(prepare_ahead))
+        prepare_pool = mp.Pool(prepare_ahead, maxtasksperchild=1)
+    else:
+        prepare_pool = None
+
+    def add_waiting(siblings, parent_result):
+        if normalize is not None:
+            for complex_pdb in sorted(set([node["complex"] for node in siblings])):
+                fragments = [node["task"][0] for node in siblings if node["complex"] == complex_pdb]
+                try:
+                    normalize_shared_inputs(complex_pdb, fragments, **normalize)
+                except Exception:
+                    traceback.print_exc()
+                    logger.critical("Inputs of the growings onto {} could not be checked.".format(complex_pdb))
+        for node in siblings:
+            waiting.append((node, parent_result))
+
+    def submit(target_pool, event, target, node, parent_result):
+        call_args = [target, [node, parent_result] + list(args), kwargs]
+        if target_pool is None:
+            finished.put((event, node["key"], contained_call(*call_args)))
+        else:
+            target_pool.apply_async(contained_call, call_args,
+                                    callback=lambda output, key=node["key"]: finished.put((event, key, output)),
+                                    error_callback=lambda error, key=node["key"]: finished.put((event, key,
+                                                                                                (False, repr(error),
+                                                                                                 0.))))
+
+    def schedule():
+        started = 0
+        while waiting and not stopped_by and running + started < max_concurrent_growings:
+            node, parent_result = waiting[0]
+            if node["key"] in preparing:  # Wait until its preparation finishes
+                break
+            waiting.popleft()
+            started += 1
+            if pool is None:
+                # The growing will block this process, so the preparations have to be sent before
+                send_preparations(list(waiting))
+            submit(pool, "grown", function, node, parent_result)
+        send_preparations(list(waiting))
+        return started
+
+    def send_preparations(queued):
+        if prepare_pool is None or stopped_by:
+            return
+        for node, parent_result in queued[0:prepare_ahead]:
+            if node["key"] not in preparing and node["key"] not in prepared:
+                preparing.add(node["key"])
+                submit(prepare_pool, "prepared", prepare_function, node, parent_result)
+
+    try:
+        add_waiting([node for node in nodes if node["parent"] is None], None)
+        running += schedule()
+        while running or preparing:
+            event, key, (succeeded, result, duration) = finished.get()
+            node = nodes_by_key[key]
+            if event == "prepared":
+                preparing.discard(key)
+                prepared.add(key)
+                if not succeeded:
+                    logger.warning("Preparation ahead of growing {} failed, it will be prepared again before growing "
+                                   "it.".format(node["ID"]))
+                running += schedule()
+                continue
+            running -= 1
+            results[key] = ("done" if succeeded else "failed", result, duration)
+            if not succeeded and stop_on_failure and not stopped_by:
+                stopped_by.append(node)
+                logger.critical("Growing {} failed. No more growings will be started.".format(node["ID"]))
+            if succeeded and os.path.exists(node["top"]):
+                add_waiting([nodes_by_key[child] for child in node["children"]], result)
+            elif node["children"]:
+                reason = "failed" if not succeeded else "did not produce {}".format(node["top"])
+                for descendant in get_descendants(node, nodes_by_key):
+                    results[descendant] = ("skipped", "Skipped because growing {} {}.".format(node["ID"], reason), 0.)
+                    if not progress:
+                        logger.warning("Skipping growing {}: growing {} {}.".format(nodes_by_key[descendant]["ID"],
+                                                                                    node["ID"], reason))
+            if progress:
+                print_progress(len(results), len(nodes),
+                               len([r for r in results.values() if r[0] != "done"]), start_time)
+            running += schedule()
+    except BaseException:
+        for target_pool in (pool, prepare_pool):
+            if target_pool is not None:
+                target_pool.terminate()
+        raise
+    for target_pool in (pool, prepare_pool):
+        if target_pool is not None:
+            target_pool.close()
+            target_pool.join()
+    for node in nodes:
+        if node["key"] not in results:  # Never started because the scheduler stopped
+            results[node["key"]] = ("skipped", "Skipped because growing {} failed and the serie stopped at the first "
+                                               "failure.".format(stopped_by[0]["ID"]), 0.)
+    output = [(node,) + results[node["key"]] for node in nodes]
+    failed = [node for node, status, result, duration in output if status != "done"]
+    logger.info("{} of {} growings finished successfully in {:.2f} min.".format(len(output) - len(failed),
+                                                                              len(output),
+                                                                              (time.time() - start_time) / 60))
+    for node in failed:
+        logger.critical("Growing of {} did not finish: {}".format(node["ID"], get_error_message(results[node["key"]][1])))
+    sys.stdout.flush()
+    return output
+
+
+def write_summary(results, output_file, done_label="done"):
+    """
+    Writes a tab separated table with the status and the time spent by each node of the growing graph.
+    :param results: list of tuples returned by run_graph. list
+    :param output_file: path of the table. str
+    :param done_label: status written for the nodes finished successfully. str
+    """
+    lines = ["ID\tFragment\tCore_atom\tFragment_atom\tStatus\tTime(s)\tMessage"]
+    for node, status, result, duration in results:
+        fragment_pdb, core_atom, fragment_atom = node["task"][0:3]
+        if status == "done":
+            status, message = done_label, ""
+        else:
+            message = get_error_message(result)
+        lines.append("\t".join([node["ID"], fragment_pdb, core_atom, fragment_atom, status,
+                                "{:.1f}".format(duration), message]))
+    with open(output_file, "w") as summary:
+        summary.write("\n".join(lines) + "\n")
+    logger.info("Summary of {} growings saved in {}".format(len(results), output_file))
@@ -4,7 +4,10 @@ import os
 import logging
 # Local imports 
 import frag_pele.constants as c
-import frag_pele.Helpers.checker as ch
+from frag_pele.Helpers.lazy_modules import lazy_import
+ch = lazy_import("frag_pele.Helpers.checker")
+parsed_pdb = lazy_import("frag_pele.Helpers.parsed_pdb")
+fragment_index = lazy_import("frag_pele.Helpers.fragment_index")
 # Getting the name of the module for the log system
 logger = logging.getLogger(__name__)
 
@@ -98,9 +101,12 @@ def check_instructions(instructions, complex_pdb, c_chain = "L", f_chain="L"):
         else:
             ch.check_if_atom_exists_in_ligand(fragment, atom_fr, f_chain)
             ch.check_if_atom_exists_in_ligand(complex_pdb, atom_core, c_chain)
-        with open(fragment) as content:
-            fr_content = content.readlines()
-        ch.check_duplicated_pdbatomnames(fr_content)
+        entry = fragment_index.get_fragment_entry(fragment, f_chain)  # Fragment of an indexed library
+        if entry is None:
+            ch.check_duplicated_pdbatomnames(parsed_pdb.load(fragment).lines)
+        elif entry["repeated_names"]:
+            raise ValueError("SOME REPEATED PDB ATOM NAMES of the ligand IN PDB FILES!! {} in {}".format(
+                             ", ".join(entry["repeated_names"]), fragment))
 
 
 def extract_hydrogens_from_instructions(instruction):
@@ -127,3 +133,72 @@ def extract_hydrogens_from_instructions(instruction):
     else:
         return False
 
+
+
+def get_working_dir_name(complex_pdb, ID):
+    """
+    It returns the name of the working directory that grow_fragment creates for a growing (relative to the
+    directory where FrAG is launched).
+    :param complex_pdb: PDB file with the complex that contains the core. str
+    :param ID: identifier of the growing. str
+    :return: name of the working directory. str
+    """
+    pdb_basename = complex_pdb.split(".pdb")[0]  # Get the name of the pdb without extension
+    if "/" in pdb_basename:
+        pdb_basename = pdb_basename.split("/")[-1]  # And if it is a path, get only the name
+    return "{}_{}".format(pdb_basename, ID)
+
+
+def build_growing_graph(list_of_instructions, complex_pdb, execution_dir=None):
+    """
+    It converts the instructions read from the serie file into a dependency graph of growings. Each node is a single
+    growing step: the addition of one fragment onto the best structure of its parent node (or onto complex_pdb for the
+    first step). Successive growings that share their first steps (same fragments, atoms and back-references) share
+    the same nodes, so each parent is grown only once and all its branches start from its result.
+    :param list_of_instructions: list with the instructions read from the instructions file. list
+    :param complex_pdb: PDB file with the complex that contains the core. str
+    :param execution_dir: if set, the relative paths of the fragments and the best structures of the nodes are made
+    absolute from this directory. str
+    :return: list of nodes sorted so that parents are always placed before their children. Each node is a dictionary
+    with: "key" (tuple with the steps from the root), "parent" (key of the parent node or None), "children" (list of
+    keys), "task" (fragment_pdb, core_atom, fragment_atom, ID, fragment_number), "ID" (identifier of the growing),
+    "step" (position in the successive growing), "successive" (if it comes from a successive growing), "complex"
+    (PDB used as core) and "top" (best structure of the growing, used as core by the children). list
+    """
+    nodes = {}
+    graph = []
+    for instruction in list_of_instructions:
+        if type(instruction) == list:
+            tasks = instruction
+            successive = True
+        else:
+            tasks = [tuple(instruction) + (None,)]
+            successive = False
+        parent = None
+        for i, task in enumerate(tasks):
+            fragment_pdb, core_atom, fragment_atom, step_ID, fragment_number = task
+            if execution_dir:
+                fragment_pdb = os.path.join(execution_dir, fragment_pdb)
+            if i == 0:  # The back-references are only used from the second growing
+                fragment_number = None
+            key = (parent or ()) + ((fragment_pdb, core_atom, fragment_atom, fragment_number),)
+            if key in nodes:
+                nodes[key]["successive"] = nodes[key]["successive"] or successive
+                parent = key
+                continue
+            ID = "".join([t[3] for t in tasks[0:i + 1]]).split("/")[-1]
+            if parent is None:
+                complex_node = complex_pdb
+            else:
+                complex_node = nodes[parent]["top"]
+                nodes[parent]["children"].append(key)
+            working_dir = get_working_dir_name(complex_node, ID)
+            if execution_dir:
+                working_dir = os.path.join(execution_dir, working_dir)
+            node = {"key": key, "parent": parent, "children": [], "step": i, "successive": successive,
+                    "task": (fragment_pdb, core_atom, fragment_atom, step_ID, fragment_number), "ID": ID,
+                    "complex": complex_node, "top": os.path.join(working_dir, "{}_top.pdb".format(ID))}
+            nodes[key] = node
+            graph.append(node)
+            parent = key
+    return graph
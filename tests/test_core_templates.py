@@ -0,0 +1,103 @@
+import os
+import shutil
+import pytest
+
+create_templates = pytest.importorskip("frag_pele.Helpers.create_templates")
+from frag_pele.Helpers import core_templates
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def complex_pdb(tmp_path):
+    path = str(tmp_path / "complex.pdb")
+    shutil.copy(os.path.join(DIR, "1w7h_preparation_structure_2w.pdb"), path)
+    return path
+
+
+@pytest.fixture
+def parameterized(monkeypatch):
+    """
+    It replaces the parameterization of the core (Schrodinger or OpenForceField) by one that writes the template and
+    the rotamer library with the PDB file they come from. It returns the list of PDB files parameterized.
+    """
+    pdbs = []
+
+    def get_datalocal(pdb, outdir='.', forcefield='OPLS2005', template_name='grw', aminoacid=False, **kwargs):
+        pdbs.append(pdb)
+        for path in core_templates.get_template_files(outdir, template_name, forcefield, aminoacid):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as output_file:
+                output_file.write("{} of {}\n".format(os.path.basename(path), pdb))
+
+    monkeypatch.setattr(create_templates, "get_datalocal", get_datalocal)
+    return pdbs
+
+
+def rewrite(path, old, new):
+    with open(path) as pdb:
+        content = pdb.read()
+    assert old in content
+    with open(path, "w") as pdb:
+        pdb.write(content.replace(old, new))
+
+
+def test_shared_core_is_prepared_once(tmp_path, complex_pdb, parameterized):
+    shared_core = core_templates.prepare_shared_core(complex_pdb, str(tmp_path))
+    assert shared_core["template_name"] == "3ip"
+    assert shared_core["pdb"] == os.path.join(shared_core["outdir"], "3IP.pdb")
+    assert parameterized == [shared_core["pdb"]]
+    for path in core_templates.get_template_files(shared_core["outdir"], "3ip", "OPLS2005", False):
+        assert os.path.exists(path)
+    # Same complex and options: taken from the manifest
+    assert core_templates.prepare_shared_core(complex_pdb, str(tmp_path)) == shared_core
+    assert len(parameterized) == 1
+    # Other options: prepared again
+    core_templates.prepare_shared_core(complex_pdb, str(tmp_path), rotamers=10)
+    assert len(parameterized) == 2
+
+
+def test_changed_complex_invalidates_shared_core(tmp_path, complex_pdb, parameterized):
+    core_templates.prepare_shared_core(complex_pdb, str(tmp_path))
+    # The core is placed in another position of the same file
+    rewrite(complex_pdb, "HETATM 5666 C1   3IP L   1      21.609", "HETATM 5666 C1   3IP L   1      21.709")
+    shared_core = core_templates.prepare_shared_core(complex_pdb, str(tmp_path))
+    assert len(parameterized) == 2
+    with open(shared_core["pdb"]) as core_pdb:
+        assert "21.709" in core_pdb.read()
+    assert core_templates.prepare_shared_core(complex_pdb, str(tmp_path)) == shared_core
+    assert len(parameterized) == 2
+
+
+def test_copy_shared_core(tmp_path, complex_pdb, parameterized):
+    shared_core = core_templates.prepare_shared_core(complex_pdb, str(tmp_path))
+    growing_dir = tmp_path / "growing"
+    growing_dir.mkdir()
+    pdb_to_template = str(growing_dir / "3IP.pdb")
+    shutil.copy(shared_core["pdb"], pdb_to_template)
+    # The core of the growing is the same molecule in another pose
+    rewrite(pdb_to_template, "21.609", "21.709")
+    assert core_templates.copy_shared_core(shared_core, pdb_to_template, "3ip", str(growing_dir))
+    sources = core_templates.get_template_files(shared_core["outdir"], "3ip", "OPLS2005", False)
+    destinations = core_templates.get_template_files(str(growing_dir), "3ip", "OPLS2005", False)
+    for source, destination in zip(sources, destinations):
+        with open(source) as source_file, open(destination) as destination_file:
+            assert source_file.read() == destination_file.read()
+    assert len(parameterized) == 1
+
+
+@pytest.mark.parametrize("old, new", [(" N1 ", " N9 "),  # Other atom names
+                                      ("21.609  33.919  30.461", "25.609  33.919  30.461")])  # Other bonds
+def test_other_molecule_is_not_copied(tmp_path, complex_pdb, parameterized, old, new):
+    shared_core = core_templates.prepare_shared_core(complex_pdb, str(tmp_path))
+    growing_dir = tmp_path / "growing"
+    growing_dir.mkdir()
+    pdb_to_template = str(growing_dir / "3IP.pdb")
+    shutil.copy(shared_core["pdb"], pdb_to_template)
+    rewrite(pdb_to_template, old, new)
+    assert create_templates.get_molecule_graph(pdb_to_template) != \
+        create_templates.get_molecule_graph(shared_core["pdb"])
+    assert not core_templates.copy_shared_core(shared_core, pdb_to_template, "3ip", str(growing_dir))
+    assert not os.path.exists(str(growing_dir / "DataLocal"))
+    # Other template name
+    assert not core_templates.copy_shared_core(shared_core, shared_core["pdb"], "grw", str(growing_dir))
@@ -0,0 +1,114 @@
+import os
+import time
+import threading
+import pytest
+from frag_pele.Helpers import disk_cache
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def write(path, content):
+    with open(path, "w") as output_file:
+        output_file.write(content)
+
+
+def read(path):
+    with open(path) as input_file:
+        return input_file.read()
+
+
+def put_entry(cache, tmp_path, key, content):
+    source = str(tmp_path / "{}.src".format(key))
+    write(source, content)
+    cache.put(key, {"template": source})
+
+
+def test_miss_then_hit(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None)
+    destination = str(tmp_path / "grwz")
+    assert not cache.get("a" * 64, {"template": destination})
+    put_entry(cache, tmp_path, "a" * 64, "template content")
+    assert cache.get("a" * 64, {"template": destination})
+    assert read(destination) == "template content"
+    assert cache.read_stats() == {"hits": 1, "misses": 1}
+
+
+def test_put_keeps_first_entry(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None)
+    put_entry(cache, tmp_path, "a" * 64, "first")
+    put_entry(cache, tmp_path, "a" * 64, "second")
+    destination = str(tmp_path / "grwz")
+    assert cache.get("a" * 64, {"template": destination})
+    assert read(destination) == "first"
+    assert len(cache.get_entries()) == 1
+
+
+def test_eviction_of_least_recently_used(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None)
+    keys = ["a" * 64, "b" * 64, "c" * 64]
+    put_entry(cache, tmp_path, keys[0], "x" * 1000)
+    put_entry(cache, tmp_path, keys[1], "x" * 1000)
+    entry_size = max([size for last_use, size, entry in cache.get_entries()])
+    # The first entry is the oldest one, but it is used again before the third one is stored
+    now = time.time()
+    os.utime(cache.entry_path(keys[0]), (now - 20, now - 20))
+    os.utime(cache.entry_path(keys[1]), (now - 10, now - 10))
+    assert cache.get(keys[0], {"template": str(tmp_path / "grwz")})
+    cache.max_size = 2.5 * entry_size / (1024 * 1024)
+    put_entry(cache, tmp_path, keys[2], "x" * 1000)
+    assert os.path.isdir(cache.entry_path(keys[0]))
+    assert not os.path.isdir(cache.entry_path(keys[1]))
+    assert os.path.isdir(cache.entry_path(keys[2]))
+
+
+def test_eviction_removes_lock_files(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None)
+    keys = ["a" * 64, "b" * 64]
+    for key in keys:
+        with cache.lock(key):
+            put_entry(cache, tmp_path, key, "x" * 1000)
+    assert sorted(os.listdir(os.path.dirname(cache.lock_path(keys[0])))) == [key + ".lock" for key in keys]
+    now = time.time()
+    os.utime(cache.entry_path(keys[0]), (now - 10, now - 10))
+    cache.max_size = 1.5 * max([size for last_use, size, entry in cache.get_entries()]) / (1024 * 1024)
+    cache.evict()
+    assert not os.path.exists(cache.lock_path(keys[0]))
+    assert os.path.exists(cache.lock_path(keys[1]))
+
+
+def test_lock_is_exclusive(tmp_path):
+    cache = disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None)
+    events = []
+    locked = threading.Event()
+
+    def hold_lock():
+        with cache.lock("a" * 64):
+            locked.set()
+            time.sleep(0.2)
+            events.append("first released")
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    locked.wait()
+    with cache.lock("a" * 64):
+        events.append("second acquired")
+    thread.join()
+    assert events == ["first released", "second acquired"]
+
+
+def test_template_key_and_pose(tmp_path):
+    create_templates = pytest.importorskip("frag_pele.Helpers.create_templates")
+    moved = str(tmp_path / "amino.pdb")
+    with open(os.path.join(DIR, "amino.pdb")) as pdb:
+        lines = [line[:30] + "{:8.3f}".format(float(line[30:38]) + 1.) + line[38:]
+                 if line.startswith("HETATM") else line for line in pdb]
+    write(moved, "".join(lines))
+    original = os.path.join(DIR, "amino.pdb")
+    # Same molecule in another pose: the z-matrix of the template (and OpenFF charges) depend on the pose
+    for forcefield in ("OPLS2005", "OFF"):
+        assert create_templates.get_template_key(original, forcefield, "grw", False, 30, None) != \
+            create_templates.get_template_key(moved, forcefield, "grw", False, 30, None)
+    assert create_templates.get_template_key(original, "OPLS2005", "grw", False, 30, None) == \
+        create_templates.get_template_key(os.path.join(DIR, "amino.pdb"), "OPLS2005", "grw", False, 30, None)
+    assert create_templates.get_template_key(original, "OPLS2005", "grw", False, 30, None) != \
+        create_templates.get_template_key(original, "OPLS2005", "grw", False, 10, None)
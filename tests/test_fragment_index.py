@@ -0,0 +1,113 @@
+import os
+import shutil
+import pytest
+import rdkit.Chem
+from frag_pele import serie_handler
+from frag_pele.Helpers import fragment_index, parsed_pdb
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def library(tmp_path):
+    for pdb in ("phenyl.pdb", "amino.pdb", "1w7h_preparation_structure_2w.pdb"):
+        shutil.copy(os.path.join(DIR, pdb), str(tmp_path))
+    return str(tmp_path)
+
+
+def rewrite(path, old, new):
+    """
+    It replaces a text of a file and moves its modification time, as a later edit would do.
+    """
+    with open(path) as pdb:
+        content = pdb.read()
+    status = os.stat(path)
+    with open(path, "w") as pdb:
+        pdb.write(content.replace(old, new))
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 10 ** 9))
+
+
+def test_build_index(library):
+    fragments, indexed = fragment_index.build_index(library)
+    # The complex is not a fragment
+    assert sorted(fragments) == ["amino.pdb", "phenyl.pdb"]
+    assert indexed == 2
+    entry = fragment_index.get_fragment_entry(os.path.join(library, "phenyl.pdb"))
+    assert entry["resname"] == "FRG"
+    assert entry["identity"] == "c1ccccc1"
+    assert entry["heavy_atoms"] == ["C1", "C2", "C3", "C4", "C5", "C6"]
+    assert entry["repeated_names"] == []
+    # The same hydrogens that the growing selects by distance
+    structure = parsed_pdb.load(os.path.join(library, "phenyl.pdb")).get_structure()
+    for heavy_atom in entry["heavy_atoms"]:
+        hydrogens = structure.select("chain L and hydrogen within 1.74 of name {}".format(heavy_atom))
+        assert fragment_index.get_bonded_hydrogens(os.path.join(library, "phenyl.pdb"), heavy_atom) == \
+            list(hydrogens.getNames())
+    # Indexing again keeps the entries of the files that have not changed
+    assert fragment_index.build_index(library) == (fragments, 0)
+
+
+def test_entries_of_other_chains(tmp_path):
+    shutil.copy(os.path.join(DIR, "phenyl2.pdb"), str(tmp_path))
+    pdb = os.path.join(str(tmp_path), "phenyl2.pdb")
+    fragments, indexed = fragment_index.build_index(str(tmp_path), chain="Z")
+    assert indexed == 1
+    assert fragment_index.get_fragment_entry(pdb, "Z") is not None
+    assert fragment_index.get_fragment_entry(pdb, "L") is None
+
+
+def test_touched_file_is_up_to_date(library):
+    fragment_index.build_index(library)
+    pdb = os.path.join(library, "phenyl.pdb")
+    status = os.stat(pdb)
+    os.utime(pdb, ns=(status.st_atime_ns, status.st_mtime_ns + 10 ** 9))
+    # The modification time changed, but the content is checked by its hash
+    assert fragment_index.get_fragment_entry(pdb) is not None
+    shutil.copy(pdb, os.path.join(library, "copy.pdb"))
+    assert fragment_index.is_up_to_date(fragment_index.get_fragment_entry(pdb), os.path.join(library, "copy.pdb"))
+
+
+def test_changed_file_is_indexed_again(library):
+    fragment_index.build_index(library)
+    pdb = os.path.join(library, "phenyl.pdb")
+    # Same size, other content
+    rewrite(pdb, " H1 ", " H9 ")
+    assert fragment_index.get_fragment_entry(pdb) is None
+    fragments, indexed = fragment_index.build_index(library)
+    assert indexed == 1
+    assert "H9" in fragment_index.get_fragment_entry(pdb)["atoms"]
+    # Other size
+    rewrite(pdb, "END", "END\n")
+    assert fragment_index.get_fragment_entry(pdb) is None
+
+
+def test_repeated_names(library):
+    pdb = os.path.join(library, "phenyl.pdb")
+    rewrite(pdb, " H2 ", " H1 ")
+    fragment_index.build_index(library)
+    assert fragment_index.get_fragment_entry(pdb)["repeated_names"] == ["H1"]
+
+
+def test_bond_types(library):
+    fragment_index.build_index(library)
+    pdb = os.path.join(library, "phenyl.pdb")
+    molecule = rdkit.Chem.MolFromPDBFile(pdb, removeHs=False)
+    names = [atom.GetPDBResidueInfo().GetName().strip() for atom in molecule.GetAtoms()]
+    for bond in molecule.GetBonds():
+        atom_1, atom_2 = names[bond.GetBeginAtomIdx()], names[bond.GetEndAtomIdx()]
+        assert fragment_index.get_bond_type(pdb, atom_2, atom_1) == str(bond.GetBondType()).lower()
+    with pytest.raises(KeyError):
+        fragment_index.get_bond_type(pdb, "C1", "C4")
+    assert fragment_index.get_bond_type(os.path.join(library, "1w7h_preparation_structure_2w.pdb"), "C1", "C2") \
+        is None
+
+
+def test_serie_check_reads_index_of_fragment_chain(tmp_path):
+    for pdb in ("phenyl2.pdb", "1w7h_preparation_structure_2w.pdb"):
+        shutil.copy(os.path.join(DIR, pdb), str(tmp_path))
+    pdb = os.path.join(str(tmp_path), "phenyl2.pdb")
+    rewrite(pdb, " H2 ", " H1 ")
+    fragment_index.build_index(str(tmp_path), chain="Z")
+    with pytest.raises(ValueError):
+        serie_handler.check_instructions((pdb, "C6", "C1"), os.path.join(str(tmp_path),
+                                         "1w7h_preparation_structure_2w.pdb"), "L", "Z")
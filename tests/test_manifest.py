@@ -0,0 +1,71 @@
+import os
+from frag_pele.Helpers import manifest
+
+
+def write(path, content):
+    with open(path, "w") as output_file:
+        output_file.write(content)
+
+
+def record_stage(working_dir, input_path, parameters):
+    stage_manifest = manifest.StageManifest(str(working_dir))
+    inputs = stage_manifest.hash_inputs([input_path])
+    signature = manifest.compute_signature(inputs, parameters=parameters)
+    output = os.path.join(str(working_dir), "output.pdb")
+    write(output, "END\n")
+    stage_manifest.record("pregrow", signature, inputs, outputs=[output])
+    return signature, output
+
+
+def get_signature(working_dir, input_path, parameters):
+    stage_manifest = manifest.StageManifest(str(working_dir))
+    return manifest.compute_signature(stage_manifest.hash_inputs([input_path]), parameters=parameters)
+
+
+def test_recorded_stage_is_done_after_reloading(tmp_path):
+    input_path = str(tmp_path / "complex.pdb")
+    write(input_path, "ATOM\n")
+    signature, output = record_stage(tmp_path, input_path, {"steps": 6})
+    stage_manifest = manifest.StageManifest(str(tmp_path))
+    assert stage_manifest.found
+    assert stage_manifest.is_done("pregrow", signature)
+    assert not stage_manifest.is_done("templates", signature)
+
+
+def test_signature_changes_with_inputs(tmp_path):
+    input_path = str(tmp_path / "complex.pdb")
+    write(input_path, "ATOM\n")
+    signature, output = record_stage(tmp_path, input_path, {"steps": 6})
+    write(input_path, "HETATM\n")
+    new_signature = get_signature(tmp_path, input_path, {"steps": 6})
+    assert new_signature != signature
+    assert not manifest.StageManifest(str(tmp_path)).is_done("pregrow", new_signature)
+
+
+def test_signature_changes_with_parameters(tmp_path):
+    input_path = str(tmp_path / "complex.pdb")
+    write(input_path, "ATOM\n")
+    signature, output = record_stage(tmp_path, input_path, {"steps": 6})
+    assert get_signature(tmp_path, input_path, {"steps": 6}) == signature
+    new_signature = get_signature(tmp_path, input_path, {"steps": 7})
+    assert new_signature != signature
+    assert not manifest.StageManifest(str(tmp_path)).is_done("pregrow", new_signature)
+
+
+def test_signature_changes_with_upstream():
+    assert manifest.compute_signature(upstream=["a"]) != manifest.compute_signature(upstream=["b"])
+
+
+def test_missing_output_invalidates_stage(tmp_path):
+    input_path = str(tmp_path / "complex.pdb")
+    write(input_path, "ATOM\n")
+    signature, output = record_stage(tmp_path, input_path, {"steps": 6})
+    os.remove(output)
+    assert not manifest.StageManifest(str(tmp_path)).is_done("pregrow", signature)
+
+
+def test_corrupted_manifest_runs_all_stages(tmp_path):
+    write(str(tmp_path / manifest.c.MANIFEST_FILE), "{not json")
+    stage_manifest = manifest.StageManifest(str(tmp_path))
+    assert stage_manifest.stages == {}
+    assert not stage_manifest.is_done("pregrow", manifest.compute_signature())
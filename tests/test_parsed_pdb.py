@@ -0,0 +1,88 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from frag_pele.Helpers import parsed_pdb
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def pdb(tmp_path):
+    path = os.path.join(str(tmp_path), "phenyl.pdb")
+    shutil.copy(os.path.join(DIR, "phenyl.pdb"), path)
+    return path
+
+
+def rewrite_keeping_key(path, old, new):
+    """
+    It rewrites a file with the same size and modification time, as a rewrite within the resolution of the
+    modification time of the file system would do.
+    """
+    status = os.stat(path)
+    with open(path) as pdb_file:
+        content = pdb_file.read()
+    with open(path, "w") as pdb_file:
+        pdb_file.write(content.replace(old, new))
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns))
+
+
+def test_file_is_parsed_once(pdb):
+    parsed = parsed_pdb.load(pdb)
+    assert parsed_pdb.load(pdb) is parsed
+    assert parsed_pdb.load(parsed) is parsed
+    assert parsed.get_structure() is parsed.get_structure()
+    assert parsed_pdb.load(os.path.join(os.path.dirname(pdb), ".", "phenyl.pdb")) is parsed
+
+
+def test_modified_file_is_parsed_again(pdb):
+    parsed = parsed_pdb.load(pdb)
+    with open(pdb, "a") as pdb_file:
+        pdb_file.write("\n")
+    assert parsed_pdb.load(pdb) is not parsed
+
+
+def test_same_size_rewrite_and_forget(pdb):
+    parsed = parsed_pdb.load(pdb)
+    assert parsed.get_structure().getResnames()[0] == "FRG"
+    rewrite_keeping_key(pdb, "FRG", "LIG")
+    # The key of the file has not changed, so only forget makes the next load see the new content
+    assert parsed_pdb.load(pdb) is parsed
+    parsed_pdb.forget(pdb)
+    reparsed = parsed_pdb.load(pdb)
+    assert reparsed is not parsed
+    assert reparsed.get_structure().getResnames()[0] == "LIG"
+    assert all(["LIG" in line for line in reparsed.lines if line.startswith("HETATM")])
+
+
+def test_copy_does_not_modify_shared_structure(pdb):
+    parsed = parsed_pdb.load(pdb)
+    shared = parsed.get_structure()
+    coords = shared.getCoords().copy()
+    names = shared.getNames().copy()
+    structure = parsed.get_structure(copy=True)
+    assert structure is not shared
+    structure.setCoords(structure.getCoords() + 1.)
+    structure.setNames(["X"] * structure.numAtoms())
+    np.testing.assert_array_equal(parsed_pdb.load(pdb).get_structure().getCoords(), coords)
+    np.testing.assert_array_equal(parsed_pdb.load(pdb).get_structure().getNames(), names)
+
+
+def test_memo_size(tmp_path):
+    paths = []
+    for n in range(parsed_pdb.PARSED_PDB_MEMO_SIZE + 1):
+        paths.append(os.path.join(str(tmp_path), "{}.pdb".format(n)))
+        shutil.copy(os.path.join(DIR, "phenyl.pdb"), paths[-1])
+    first = parsed_pdb.load(paths[0])
+    for path in paths[1:]:
+        parsed_pdb.load(path)
+    assert len(parsed_pdb._parsed_pdbs) <= parsed_pdb.PARSED_PDB_MEMO_SIZE
+    assert parsed_pdb.load(paths[0]) is not first
+
+
+def test_helpers_that_rewrite_files_forget_them(pdb):
+    from frag_pele.Growing import add_fragment_from_pdbs as addfr
+    parsed_pdb.load(pdb)
+    addfr.lignames_replacer(pdb, "FRG", "LIG")
+    assert os.path.realpath(pdb) not in parsed_pdb._parsed_pdbs
+    assert parsed_pdb.load(pdb).get_structure().getResnames()[0] == "LIG"
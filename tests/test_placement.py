@@ -0,0 +1,212 @@
+import os
+import math
+import numpy as np
+import pytest
+import prody
+import Bio.PDB as bio
+from scipy.spatial import cKDTree
+from frag_pele.Growing import add_fragment_from_pdbs as addfr
+from frag_pele.Growing.AddingFragHelpers import complex_to_prody, pdb_joiner
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+THRESHOLD = 1.2
+
+
+def build_complex(obstacle=None):
+    """
+    Core COR (C1 bonded to the fragment, C2) and fragment FRG (F1 bonded to C1, F2 out of the bond axis, that is the
+    x axis). An extra core atom can be placed as an obstacle.
+    :return: ProDy molecule and bond (Bio.PDB atoms of C1 and F1).
+    """
+    atoms = [("COR", "C1", [0., 0., 0.]), ("COR", "C2", [-1.5, 0., 0.]), ("FRG", "F1", [1.5, 0., 0.]),
+             ("FRG", "F2", [2.0, 1.4, 0.])]
+    if obstacle is not None:
+        atoms.append(("COR", "C3", obstacle))
+    structure = prody.AtomGroup("complex")
+    structure.setCoords(np.array([coords for resname, name, coords in atoms]))
+    structure.setNames([name for resname, name, coords in atoms])
+    structure.setResnames([resname for resname, name, coords in atoms])
+    structure.setChids(["L"] * len(atoms))
+    structure.setResnums([1 if resname == "COR" else 2 for resname, name, coords in atoms])
+    bond = []
+    for resname, name in (("COR", "C1"), ("FRG", "F1")):
+        residue = bio.Residue.Residue(("H_{}".format(resname), 1, " "), resname, " ")
+        coords = dict([(atom_name, coords) for atom_resname, atom_name, coords in atoms])[name]
+        atom = bio.Atom.Atom(name, np.array(coords), 0., 1., " ", " {} ".format(name), 1, "C")
+        residue.add(atom)
+        bond.append(atom)
+    return structure, bond
+
+
+def get_coords(structure, name):
+    return structure.getCoords()[structure.getNames() == name][0]
+
+
+def test_scan_angles_start_without_rotation():
+    angles = addfr.get_scan_angles()
+    assert angles[0] == 0
+    assert len(angles) == 360
+    assert len(np.unique(np.round(angles, 6))) == 360
+    np.testing.assert_allclose(angles[:36], np.arange(36) * math.pi / 18)
+
+
+def test_rotation_matrices():
+    matrices = addfr.get_rotation_matrices([0., 0., 2.], [0., math.pi / 2, math.pi])
+    for matrix in matrices:
+        np.testing.assert_allclose(matrix.dot(matrix.T), np.eye(3), atol=1e-12)
+        assert np.isclose(np.linalg.det(matrix), 1.)
+    np.testing.assert_allclose(matrices[0], np.eye(3), atol=1e-12)
+    np.testing.assert_allclose(matrices[1].dot([1., 0., 0.]), [0., 1., 0.], atol=1e-12)
+    np.testing.assert_allclose(matrices[2].dot([1., 0., 0.]), [-1., 0., 0.], atol=1e-12)
+
+
+def test_rotation_around_bond_keeps_bond_length():
+    origin = np.array([0., 0., 0.])
+    coords = np.array([[1.5, 0., 0.], [2.0, 1.4, 0.]])
+    rotated = addfr.rotate_around_axis(coords, origin, coords[0] - origin, addfr.get_scan_angles())
+    # The bonded atom is on the axis and the others keep their distance to it and to the axis
+    np.testing.assert_allclose(rotated[:, 0], np.tile(coords[0], (len(rotated), 1)), atol=1e-12)
+    np.testing.assert_allclose(np.linalg.norm(rotated[:, 1] - rotated[:, 0], axis=1), np.linalg.norm(coords[1] -
+                                                                                                     coords[0]))
+    np.testing.assert_allclose(np.linalg.norm(rotated[:, 1, 1:], axis=1), 1.4)
+
+
+def test_unclashed_input_pose_is_kept():
+    structure, bond = build_complex(obstacle=[2.0, -1.4, 0.])
+    poses, placement = addfr.find_rotations(structure, bond, THRESHOLD)
+    assert (poses[0].conformer, poses[0].angle, poses[0].clashes) == (0, 0, 0)
+    coords = structure.getCoords().copy()
+    assert addfr.check_collision(structure, bond, THRESHOLD) is structure
+    np.testing.assert_array_equal(structure.getCoords(), coords)
+
+
+def test_ranking_of_poses():
+    structure, bond = build_complex(obstacle=[2.0, 1.4, 0.3])
+    poses, placement = addfr.find_rotations(structure, bond, THRESHOLD)
+    # The input pose clashes, the first angles without clashes come first (in the order of the scan)
+    assert poses[0].angle != 0 and poses[0].clashes == 0
+    free = [pose for pose in poses if not pose.clashes]
+    assert poses[:len(free)] == free
+    order = list(addfr.get_scan_angles())
+    assert [order.index(pose.angle) for pose in free] == sorted([order.index(pose.angle) for pose in free])
+    # Then the clashing ones, from the farthest to the closest to the core
+    distances = [pose.min_distance for pose in poses[len(free):]]
+    assert all([pose.clashes for pose in poses[len(free):]])
+    assert distances == sorted(distances, reverse=True)
+    bonded_fragment_atom = get_coords(structure, "F1").copy()
+    placed = addfr.check_collision(structure, bond, THRESHOLD)
+    np.testing.assert_allclose(get_coords(placed, "F1"), bonded_fragment_atom)
+    assert np.linalg.norm(get_coords(placed, "F2") - get_coords(placed, "C3")) > THRESHOLD
+
+
+def test_every_angle_clashes():
+    # A core atom on the axis of the bond, next to the fragment atom, clashes with all the rotations
+    structure, bond = build_complex(obstacle=[1.8, 0., 0.])
+    poses, placement = addfr.find_rotations(structure, bond, THRESHOLD)
+    assert all([pose.clashes for pose in poses])
+    assert addfr.check_collision(structure, bond, THRESHOLD) is None
+
+
+def test_protein_clashes_rank_below_free_poses():
+    structure, bond = build_complex()
+    # A receptor atom on the fragment atom out of the rotation axis: the input pose does not clash with the core,
+    # but it does with the protein
+    receptor = cKDTree([[2.0, 1.4, 0.]])
+    poses, placement = addfr.find_rotations(structure, bond, THRESHOLD, receptor=receptor,
+                                           threshold_protein=THRESHOLD)
+    assert poses[0].clashes == poses[0].protein_clashes == 0
+    assert poses[0].angle != 0
+    input_pose = [pose for pose in poses if pose.angle == 0 and pose.conformer == 0][0]
+    assert (input_pose.clashes, input_pose.protein_clashes) == (0, 1)
+    free = [pose for pose in poses if not pose.clashes and not pose.protein_clashes]
+    assert poses.index(input_pose) >= len(free)
+    # Without the receptor, the input pose is the best one
+    poses, placement = addfr.find_rotations(structure, bond, THRESHOLD)
+    assert (poses[0].conformer, poses[0].angle) == (0, 0)
+
+
+def test_receptor_index_excludes_ligand():
+    pdb = os.path.join(DIR, "1w7h_preparation_structure_2w.pdb")
+    structure = prody.parsePDB(pdb)
+    tree = addfr.get_receptor_index(pdb, "L")
+    assert tree.n == structure.numAtoms() - structure.select("chain L").numAtoms()
+    assert addfr.get_receptor_index(pdb, "L") is tree
+
+
+def test_select_poses_keeps_different_angles():
+    poses = [addfr.Pose(0, math.radians(angle), 0, 3., 0, 3.) for angle in (0, 10, 350, 40, 90)] + \
+            [addfr.Pose(1, math.radians(5), 0, 3., 0, 3.), addfr.Pose(0, math.radians(180), 1, 1., 0, 3.)]
+    selected = addfr.select_poses(poses, 10)
+    # Poses of the same conformer closer than 30 degrees (also across 0) are discarded, other conformers are kept
+    assert [(pose.conformer, round(math.degrees(pose.angle))) for pose in selected] == [(0, 0), (0, 40), (0, 90),
+                                                                                       (1, 5)]
+    assert addfr.select_poses(poses, 2) == selected[:2]
+    assert len(addfr.select_poses(poses, 10, min_angle=0)) == 6
+    # The poses with clashes with the core are never selected
+    assert addfr.select_poses(poses[-1:], 10) == []
+
+
+def test_place_fragment_returns_several_poses():
+    structure, bond = build_complex(obstacle=[2.0, 1.4, 0.3])
+    coords = structure.getCoords().copy()
+    structures = addfr.place_fragment(structure, bond, THRESHOLD, number_of_poses=3)
+    assert len(structures) == 3
+    assert structures[0] is structure
+    for placed in structures:
+        np.testing.assert_allclose(get_coords(placed, "F1"), coords[2])
+        np.testing.assert_allclose(get_coords(placed, "C2"), coords[1])
+        assert np.linalg.norm(get_coords(placed, "F2") - get_coords(placed, "C3")) > THRESHOLD
+    f2 = [get_coords(placed, "F2") for placed in structures]
+    assert min([np.linalg.norm(f2[i] - f2[j]) for i in range(3) for j in range(i)]) > 0.1
+
+
+def test_pose_files(tmp_path):
+    pdb_initialize = str(tmp_path / "pregrow" / "initialization_grow.pdb")
+    os.makedirs(os.path.dirname(pdb_initialize))
+    poses = [pdb_initialize] + [addfr.get_pose_filename(pdb_initialize, n) for n in (1, 2, 3)]
+    assert poses[1:] == [str(tmp_path / "pregrow" / "initialization_grow_{}.pdb".format(n)) for n in (1, 2, 3)]
+    for pdb in poses:
+        open(pdb, "w").close()
+    # A gap ends the poses of the growing
+    open(addfr.get_pose_filename(pdb_initialize, 5), "w").close()
+    assert addfr.get_initialization_pdbs(pdb_initialize) == poses
+    assert addfr.get_initialization_pdbs(pdb_initialize, 2) == poses[:2]
+    addfr.remove_extra_poses(pdb_initialize)
+    assert addfr.get_initialization_pdbs(pdb_initialize) == [pdb_initialize]
+    assert os.path.exists(pdb_initialize)
+
+
+def test_poses_of_each_processor():
+    # PELE runs one trajectory per processor but the master
+    assert addfr.get_number_of_poses(4, 8) == 4
+    assert addfr.get_number_of_poses(10, 8) == 7
+    assert addfr.get_number_of_poses(4, 1) == 1
+    assert addfr.get_number_of_poses(0, 8) == 1
+
+
+@pytest.mark.parametrize("pdb, chain", [("1w7h_preparation_structure_2w.pdb", "L"),
+                                        ("1w7h_preparation_structure_2w2.pdb", "Z"), ("10.pdb", "L"),
+                                        ("phenyl.pdb", "L"), ("phenyl2.pdb", "Z"), ("amino.pdb", "L"),
+                                        ("carbonyl.pdb", "L"), ("ciano.pdb", "L")])
+def test_bioatoms_in_memory_match_pdb_files(tmp_path, pdb, chain):
+    # The growing used to write the core and the fragment and read them with Bio.PDB
+    pdb = os.path.join(DIR, pdb)
+    name = addfr.extract_atoms_pdbs(pdb, True, chain, output_folder=str(tmp_path))
+    from_file = addfr.from_pdb_to_bioatomlist([os.path.join(str(tmp_path), name)])[0]
+    from_memory = addfr.from_prody_to_bioatomlist([complex_to_prody.pdb_parser_ligand(pdb, chain)])[0]
+    assert len(from_memory) == len(from_file) > 0
+    for atom, expected in zip(from_memory, from_file):
+        assert (atom.get_name(), atom.get_fullname(), atom.get_altloc(), atom.get_serial_number(), atom.element) == \
+            (expected.get_name(), expected.get_fullname(), expected.get_altloc(), expected.get_serial_number(),
+             expected.element)
+        assert (atom.get_bfactor(), atom.get_occupancy()) == (expected.get_bfactor(), expected.get_occupancy())
+        assert atom.get_coord().dtype == expected.get_coord().dtype
+        np.testing.assert_array_equal(atom.get_coord(), expected.get_coord())
+        assert atom.get_parent().get_id() == expected.get_parent().get_id()
+        assert atom.get_parent().get_resname() == expected.get_parent().get_resname()
+    # Both are superimposed to the core bond in the same way
+    core_bond = addfr.from_pdb_to_bioatomlist([os.path.join(str(tmp_path), name)])[0][:2]
+    pdb_joiner.superimpose(core_bond, [from_memory[1], from_memory[0]], from_memory)
+    pdb_joiner.superimpose(core_bond, [from_file[1], from_file[0]], from_file)
+    np.testing.assert_allclose([atom.get_coord() for atom in from_memory], [atom.get_coord() for atom in from_file],
+                               atol=1e-5)
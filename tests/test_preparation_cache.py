@@ -0,0 +1,93 @@
+import os
+import stat
+import pytest
+from frag_pele.Helpers import plop_rot_temp, disk_cache
+
+
+def write(path, content):
+    with open(path, "w") as output_file:
+        output_file.write(content)
+
+
+def read(path):
+    with open(path) as input_file:
+        return input_file.read()
+
+
+@pytest.fixture
+def schrodinger(tmp_path):
+    """
+    Schrodinger installation whose prepwizard copies the input to the output, adding a REMARK with its options, and
+    counts its runs in calls.txt.
+    """
+    def create(name="schrodinger"):
+        sch_path = tmp_path / name
+        (sch_path / "utilities").mkdir(parents=True)
+        prepwizard = str(sch_path / "utilities" / "prepwizard")
+        write(prepwizard, '#!/bin/sh\necho "$1" >> "{}"\ncp "$1" "$2"\necho "REMARK $3 $4" >> "$2"\n'.format(
+            sch_path / "calls.txt"))
+        os.chmod(prepwizard, os.stat(prepwizard).st_mode | stat.S_IEXEC)
+        return str(sch_path)
+    return create
+
+
+def get_calls(sch_path):
+    calls_file = os.path.join(sch_path, "calls.txt")
+    return read(calls_file).split() if os.path.exists(calls_file) else []
+
+
+def prepare(tmp_path, folder, content, sch_path, cache="cache"):
+    working_dir = tmp_path / folder
+    working_dir.mkdir(exist_ok=True)
+    write(str(working_dir / "ligand.pdb"), content)
+    plop_rot_temp.prepare_pdb("ligand.pdb", "ligand_p.pdb", sch_path, cwd=str(working_dir),
+                              preparation_cache=str(tmp_path / cache))
+    return read(str(working_dir / "ligand_p.pdb"))
+
+
+def test_prepared_structure_is_reused(tmp_path, schrodinger):
+    sch_path = schrodinger()
+    prepared = prepare(tmp_path, "run_1", "HETATM 1\n", sch_path)
+    assert get_calls(sch_path) == ["ligand.pdb"]
+    # Other working directory, same structure: prepwizard is not run again
+    assert prepare(tmp_path, "run_2", "HETATM 1\n", sch_path) == prepared
+    assert get_calls(sch_path) == ["ligand.pdb"]
+    cache = disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None)
+    assert cache.read_stats() == {"hits": 1, "misses": 1}
+    # Other structure
+    assert prepare(tmp_path, "run_3", "HETATM 2\n", sch_path) != prepared
+    assert get_calls(sch_path) == ["ligand.pdb", "ligand.pdb"]
+    assert cache.read_stats() == {"hits": 1, "misses": 2}
+    assert len(cache.get_entries()) == 2
+
+
+def test_other_schrodinger_or_options_prepare_again(tmp_path, schrodinger, monkeypatch):
+    sch_path = schrodinger()
+    prepare(tmp_path, "run_1", "HETATM 1\n", sch_path)
+    other_sch_path = schrodinger("other_schrodinger")
+    prepare(tmp_path, "run_2", "HETATM 1\n", other_sch_path)
+    assert get_calls(other_sch_path) == ["ligand.pdb"]
+    monkeypatch.setattr(plop_rot_temp, "PREPWIZARD_OPTIONS", ["-noepik", "-noimpref"])
+    assert prepare(tmp_path, "run_3", "HETATM 1\n", sch_path).endswith("REMARK -noepik -noimpref\n")
+    assert get_calls(sch_path) == ["ligand.pdb", "ligand.pdb"]
+    assert disk_cache.DiskCache(str(tmp_path / "cache"), max_size=None).read_stats() == {"hits": 0, "misses": 3}
+
+
+def test_preparation_key():
+    key = plop_rot_temp.get_preparation_key("HETATM 1\n", "/opt/schrodinger")
+    assert key == plop_rot_temp.get_preparation_key("HETATM 1\n", "/opt/schrodinger/")
+    assert key != plop_rot_temp.get_preparation_key("HETATM 2\n", "/opt/schrodinger")
+    assert key != plop_rot_temp.get_preparation_key("HETATM 1\n", "/opt/schrodinger2021")
+    assert key != plop_rot_temp.get_preparation_key("HETATM 1\n", "/opt/schrodinger", ["-noepik"])
+
+
+def test_without_cache(tmp_path, schrodinger):
+    sch_path = schrodinger()
+    for n in range(2):
+        working_dir = tmp_path / "run"
+        working_dir.mkdir(exist_ok=True)
+        write(str(working_dir / "ligand.pdb"), "HETATM 1\n")
+        plop_rot_temp.prepare_pdb("ligand.pdb", "ligand_p.pdb", sch_path, cwd=str(working_dir),
+                                  preparation_cache=None)
+    assert get_calls(sch_path) == ["ligand.pdb", "ligand.pdb"]
+    assert not os.path.exists(str(tmp_path / "cache"))
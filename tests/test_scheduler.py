@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import pytest
+from frag_pele import scheduler, serie_handler
+
+SERIE = """a.pdb\tC1\tN1\tb.pdb\tC2\tN2
+a.pdb\tC1\tN1\tc.pdb\tC3*1*\tN3
+a.pdb\tC1\tN1\tc.pdb\tC3\tN3
+a.pdb\tC1\tN1\tb.pdb\tC2\tN2\tc.pdb\tC4\tN4
+d.pdb\tC1\tN1
+"""
+
+
+def grow(node, parent_result, log_dir, fail=(), no_top=()):
+    """
+    Growing of a node that only records its ID, writes its best structure and returns the IDs of its ancestors.
+    """
+    with open(os.path.join(log_dir, "grown.txt"), "a") as log:
+        log.write(node["ID"] + "\n")
+    if node["ID"] in fail:
+        sys.exit("Growing {} failed".format(node["ID"]))
+    if node["ID"] not in no_top:
+        os.makedirs(os.path.dirname(node["top"]), exist_ok=True)
+        with open(node["top"], "w") as top:
+            top.write("END\n")
+    return {"IDs": (parent_result or {"IDs": []})["IDs"] + [node["ID"]]}
+
+
+def prepare(node, parent_result, log_dir, fail=(), no_top=()):
+    """
+    Preparation of a node that takes longer than its growing and leaves a mark when it starts and when it finishes.
+    """
+    open(os.path.join(log_dir, "{}.preparing".format(node["ID"])), "w").close()
+    time.sleep(0.3)
+    open(os.path.join(log_dir, "{}.prepared".format(node["ID"])), "w").close()
+
+
+def grow_after_preparation(node, parent_result, log_dir, fail=(), no_top=()):
+    """
+    Growing that records the nodes grown while their preparation was still running.
+    """
+    preparing = os.path.exists(os.path.join(log_dir, "{}.preparing".format(node["ID"])))
+    prepared = os.path.exists(os.path.join(log_dir, "{}.prepared".format(node["ID"])))
+    if preparing and not prepared:
+        with open(os.path.join(log_dir, "grown_while_preparing.txt"), "a") as log:
+            log.write(node["ID"] + "\n")
+    time.sleep(0.1)
+    return grow(node, parent_result, log_dir, fail, no_top)
+
+
+def read_grown(log_dir):
+    with open(os.path.join(log_dir, "grown.txt")) as log:
+        return log.read().split()
+
+
+@pytest.fixture
+def graph(tmp_path):
+    serie_file = tmp_path / "serie_file.conf"
+    serie_file.write_text(SERIE)
+    instructions = serie_handler.read_instructions_from_file(str(serie_file))
+    return serie_handler.build_growing_graph(instructions, "complex.pdb", str(tmp_path))
+
+
+def get_node(graph, ID):
+    return [node for node in graph if node["ID"] == ID][0]
+
+
+def test_shared_prefixes_are_one_node(graph, tmp_path):
+    assert [node["ID"] for node in graph] == ["aC1N1", "aC1N1bC2N2", "aC1N1cC3N3", "aC1N1cC3N3", "aC1N1bC2N2cC4N4",
+                                              "dC1N1"]
+    root, child_b, child_c_1, child_c, grandchild, other_root = graph
+    assert root["parent"] is None and other_root["parent"] is None
+    assert root["children"] == [child_b["key"], child_c_1["key"], child_c["key"]]
+    assert child_b["children"] == [grandchild["key"]]
+    assert grandchild["parent"] == child_b["key"]
+    # Each growing starts from the best structure of its parent
+    assert root["complex"] == "complex.pdb"
+    assert child_b["complex"] == root["top"] and grandchild["complex"] == child_b["top"]
+    assert root["top"] == os.path.join(str(tmp_path), "complex_aC1N1", "aC1N1_top.pdb")
+    assert root["task"] == (os.path.join(str(tmp_path), "a.pdb"), "C1", "N1", "aC1N1", None)
+    assert [node["step"] for node in graph] == [0, 1, 1, 1, 2, 0]
+    assert root["successive"] and not other_root["successive"]
+
+
+def test_back_references_are_part_of_the_node(graph):
+    # Same fragment and atoms, with and without a back-reference to the first fragment, are different growings
+    child_c_1, child_c = graph[2:4]
+    assert child_c_1["task"][1:] == ("C3", "N3", "cC3N3", "1")
+    assert child_c["task"][1:] == ("C3", "N3", "cC3N3", None)
+    assert child_c_1["key"] != child_c["key"]
+    assert len(set([node["key"] for node in graph])) == len(graph)
+
+
+def test_back_reference_of_first_growing_is_ignored(tmp_path):
+    instructions = [[("a.pdb", "C1", "N1", "aC1N1", "1"), ("b.pdb", "C2", "N2", "bC2N2", None)],
+                    [("a.pdb", "C1", "N1", "aC1N1", None), ("c.pdb", "C2", "N2", "cC2N2", None)]]
+    graph = serie_handler.build_growing_graph(instructions, "complex.pdb")
+    assert [node["ID"] for node in graph] == ["aC1N1", "aC1N1bC2N2", "aC1N1cC2N2"]
+    assert graph[0]["task"][4] is None
+
+
+@pytest.mark.parametrize("max_concurrent_growings", [1, 3])
+def test_shared_prefix_is_grown_once(graph, tmp_path, max_concurrent_growings):
+    results = scheduler.run_graph(graph, grow, max_concurrent_growings, str(tmp_path))
+    assert [status for node, status, result, duration in results] == ["done"] * len(graph)
+    grown = read_grown(str(tmp_path))
+    assert sorted(grown) == sorted([node["ID"] for node in graph])
+    # Parents are grown before their children
+    for node in graph:
+        if node["parent"] is not None:
+            parent = [parent for parent in graph if parent["key"] == node["parent"]][0]
+            assert grown.index(parent["ID"]) < grown.index(node["ID"])
+    grandchild = get_node(graph, "aC1N1bC2N2cC4N4")
+    assert [result for node, status, result, duration in results if node is grandchild][0] == \
+        {"IDs": ["aC1N1", "aC1N1bC2N2", "aC1N1bC2N2cC4N4"]}
+
+
+@pytest.mark.parametrize("max_concurrent_growings", [1, 3])
+def test_failures_skip_descendants(graph, tmp_path, max_concurrent_growings):
+    results = scheduler.run_graph(graph, grow, max_concurrent_growings, str(tmp_path), fail=["aC1N1bC2N2"],
+                                  no_top=["dC1N1"])
+    statuses = dict([(node["ID"] + str(node["task"][4]), (status, result)) for node, status, result, duration
+                     in results])
+    assert statuses["aC1N1None"][0] == "done"
+    # The SystemExit of the growing is contained and reported
+    assert statuses["aC1N1bC2N2None"][0] == "failed"
+    assert scheduler.get_error_message(statuses["aC1N1bC2N2None"][1]) == "SystemExit: Growing aC1N1bC2N2 failed"
+    assert statuses["aC1N1bC2N2cC4N4None"] == ("skipped", "Skipped because growing aC1N1bC2N2 failed.")
+    # The sibling branches are not affected
+    assert statuses["aC1N1cC3N31"][0] == statuses["aC1N1cC3N3None"][0] == "done"
+    # A growing without best structure has no children, so it does not skip anything
+    assert statuses["dC1N1None"][0] == "done"
+    assert "aC1N1bC2N2cC4N4" not in read_grown(str(tmp_path))
+
+
+@pytest.mark.parametrize("max_concurrent_growings", [1, 3])
+def test_missing_best_structure_skips_descendants(graph, tmp_path, max_concurrent_growings):
+    results = scheduler.run_graph(graph, grow, max_concurrent_growings, str(tmp_path), no_top=["aC1N1"])
+    statuses = [status for node, status, result, duration in results]
+    assert statuses == ["done", "skipped", "skipped", "skipped", "skipped", "done"]
+    assert results[1][2] == "Skipped because growing aC1N1 did not produce {}.".format(graph[0]["top"])
+    assert sorted(read_grown(str(tmp_path))) == ["aC1N1", "dC1N1"]
+
+
+def test_pool_and_serial_results_match(tmp_path):
+    outputs = []
+    for max_concurrent_growings in (1, 3):
+        execution_dir = tmp_path / str(max_concurrent_growings)
+        execution_dir.mkdir()
+        serie_file = execution_dir / "serie_file.conf"
+        serie_file.write_text(SERIE)
+        instructions = serie_handler.read_instructions_from_file(str(serie_file))
+        graph = serie_handler.build_growing_graph(instructions, "complex.pdb", str(execution_dir))
+        results = scheduler.run_graph(graph, grow, max_concurrent_growings, str(execution_dir),
+                                      fail=["aC1N1bC2N2"], no_top=["dC1N1"])
+        outputs.append([(node["ID"], node["task"][4], status,
+                         scheduler.get_error_message(result) if status != "done" else result)
+                        for node, status, result, duration in results])
+    assert outputs[0] == outputs[1]
+    assert [status for ID, fragment_number, status, result in outputs[0]] == \
+        ["done", "failed", "done", "done", "skipped", "done"]
+
+
+@pytest.mark.parametrize("max_concurrent_growings", [1, 3])
+def test_stop_on_failure(graph, tmp_path, max_concurrent_growings):
+    results = scheduler.run_graph(graph, grow, max_concurrent_growings, str(tmp_path), fail=["aC1N1"],
+                                  stop_on_failure=True)
+    statuses = [status for node, status, result, duration in results]
+    assert statuses[0] == "failed"
+    assert statuses[1:5] == ["skipped"] * 4
+    if max_concurrent_growings == 1:
+        # Serial growings stop at the first failure, as the debug mode always did
+        assert read_grown(str(tmp_path)) == ["aC1N1"]
+        assert results[5][1:3] == ("skipped", "Skipped because growing aC1N1 failed and the serie stopped at the "
+                                              "first failure.")
+    else:
+        # The growings that were already running finish
+        assert statuses[5] == "done"
+
+
+@pytest.mark.parametrize("max_concurrent_growings", [1, 2])
+def test_nodes_are_not_grown_while_preparing(tmp_path, max_concurrent_growings):
+    instructions = [("{}.pdb".format(name), "C1", "N1", "{}C1N1".format(name)) for name in "abcdefgh"]
+    graph = serie_handler.build_growing_graph(instructions, "complex.pdb", str(tmp_path))
+    results = scheduler.run_graph(graph, grow_after_preparation, max_concurrent_growings, str(tmp_path),
+                                  prepare_function=prepare, prepare_ahead=3)
+    assert [status for node, status, result, duration in results] == ["done"] * len(graph)
+    # Growings that were waiting for a free slot were prepared ahead, and none of them started before its preparation
+    # finished
+    prepared = [node["ID"] for node in graph if os.path.exists(str(tmp_path / "{}.prepared".format(node["ID"])))]
+    assert len(prepared) >= len(graph) - max_concurrent_growings - 1
+    assert not os.path.exists(str(tmp_path / "grown_while_preparing.txt"))
+    if max_concurrent_growings == 1:
+        # The growings keep the order of the serie
+        assert read_grown(str(tmp_path)) == [node["ID"] for node in graph]
+
+
+def test_write_summary(graph, tmp_path):
+    results = scheduler.run_graph(graph, grow, 1, str(tmp_path), fail=["aC1N1bC2N2"])
+    summary_file = str(tmp_path / "preparation_summary.tsv")
+    scheduler.write_summary(results, summary_file, done_label="prepared")
+    with open(summary_file) as summary:
+        rows = [line.rstrip("\n").split("\t") for line in summary]
+    assert rows[0] == ["ID", "Fragment", "Core_atom", "Fragment_atom", "Status", "Time(s)", "Message"]
+    assert len(rows) == len(graph) + 1
+    assert [row[0] for row in rows[1:]] == [node["ID"] for node in graph]
+    assert rows[1][1:5] == [os.path.join(str(tmp_path), "a.pdb"), "C1", "N1", "prepared"]
+    assert rows[1][6] == ""
+    assert float(rows[1][5]) >= 0
+    assert rows[2][4:] == ["failed", rows[2][5], "SystemExit: Growing aC1N1bC2N2 failed"]
+    assert rows[5][4:] == ["skipped", "0.0", "Skipped because growing aC1N1bC2N2 failed."]
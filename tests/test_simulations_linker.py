@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import pytest
+import frag_pele.constants as c
+from frag_pele.Growing import simulations_linker
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+COMPLEX = os.path.join(DIR, "1w7h_preparation_structure_2w.pdb")
+
+
+def render_control(working_dir, steps=3, name="result"):
+    """
+    :return: control file of a simulation of the test complex, from the template used by the growings. str
+    """
+    return simulations_linker.control_file_modifier(c.CONTROL_TEMPLATE, [COMPLEX], "", str(working_dir),
+                                                    results_path=os.path.join(str(working_dir), name), steps=steps,
+                                                    center="[0, 0, 0]", step=name)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_fake_simulation_result(tmp_path):
+    control = render_control(tmp_path)
+    result = run(simulations_linker.run_simulation_async(None, control, cpus=3, backend="fake"))
+    assert result.succeeded
+    assert result.return_code == 0
+    assert not result.timed_out
+    assert result.duration > 0
+    assert result.peak_rss > 0
+    assert result.command[-4:] == ["--processors", "3", "--step_time", str(c.FAKE_PELE_STEP_TIME)]
+    # The output of PELE goes to a log file of each run
+    assert result.log_file == "{}.log".format(os.path.splitext(control)[0])
+    with open(result.log_file) as log:
+        assert "Fake PELE simulation finished" in log.read()
+    assert sorted(os.listdir(str(tmp_path / "result"))) == ["logFile.txt", "processorMapping.txt", "report_1",
+                                                          "report_2", "trajectory_1.pdb", "trajectory_2.pdb"]
+
+
+def test_failed_simulation(tmp_path):
+    control = str(tmp_path / "missing.conf")
+    log_file = str(tmp_path / "pele.log")
+    result = run(simulations_linker.run_simulation_async(None, control, cpus=2, backend="fake", log_file=log_file))
+    assert result.return_code != 0
+    assert not result.succeeded
+    with open(log_file) as log:
+        assert "missing.conf" in log.read()
+
+
+@pytest.mark.parametrize("sampled_rss", [None, FileNotFoundError("/proc")])
+def test_memory_without_proc(tmp_path, monkeypatch, sampled_rss):
+    def get_process_tree_rss(pid):
+        if isinstance(sampled_rss, Exception):
+            raise sampled_rss
+        return sampled_rss
+
+    # Without /proc (p.ex. macOS) or when it can not be read, the result of the simulation is kept
+    monkeypatch.setattr(simulations_linker, "get_process_tree_rss", get_process_tree_rss)
+    result = run(simulations_linker.run_simulation_async(None, render_control(tmp_path), cpus=2, backend="fake"))
+    assert result.succeeded
+    assert result.peak_rss == simulations_linker.timings.get_peak_rss()[1] > 0
+
+
+def test_timeout_terminates_simulation(tmp_path):
+    control = render_control(tmp_path, steps=100)
+    backend = simulations_linker.FakePeleBackend(step_time=1.)
+    start = time.time()
+    result = run(simulations_linker.run_simulation_async(None, control, cpus=2, backend=backend, timeout=1.))
+    assert time.time() - start < 10
+    assert result.timed_out
+    assert result.return_code != 0
+    assert not result.succeeded
+    assert 1. <= result.duration < 10
+
+
+def test_core_limit(tmp_path, monkeypatch):
+    used = []
+
+    class RecordingLimiter(simulations_linker.CoreLimiter):
+        async def acquire(self, cpus):
+            acquired = await super(RecordingLimiter, self).acquire(cpus)
+            used.append(self.total_cpus - self.available)
+            return acquired
+
+    monkeypatch.setattr(simulations_linker, "CoreLimiter", RecordingLimiter)
+    backend = simulations_linker.FakePeleBackend(step_time=0.05)
+    simulations = [{"path_to_pele": None, "control_in": render_control(tmp_path, name=str(n)), "cpus": cpus}
+                   for n, cpus in enumerate([2, 3, 2, 8])]
+    results = simulations_linker.run_simulations(simulations, total_cpus=4, backend=backend)
+    assert [result.control_file for result in results] == [simulation["control_in"] for simulation in simulations]
+    assert all([result.succeeded for result in results])
+    # The cores in use never go over the total, and a simulation that asks for more runs alone with all of them
+    assert len(used) == 4
+    assert max(used) <= 4
+    assert 4 in used
+
+
+def test_fake_step_time_option(monkeypatch):
+    from frag_pele import main
+    monkeypatch.setattr(main.sys, "argv", ["frag_pele", "-cp", "complex.pdb", "-sef", "serie_file.conf",
+                                           "--pele_backend", "fake", "--fake_step_time", "0.5"])
+    arguments = main.parse_arguments()
+    assert arguments[-1] == 0.5
+    assert "fake" in arguments
+
+
+def test_fake_results_are_analysed(tmp_path):
+    import pandas as pd
+    from frag_pele.Growing import bestStructs
+    from frag_pele.Analysis import analyser
+    control = render_control(tmp_path, steps=5)
+    results = os.path.join(str(tmp_path), "result")
+    start = time.time()
+    return_code = simulations_linker.simulation_runner(None, control, cpus=4,
+                                                       backend=simulations_linker.FakePeleBackend(step_time=0.02),
+                                                       cwd=str(tmp_path))
+    assert return_code == 0
+    # 3 trajectories of 5 steps
+    assert time.time() - start >= 3 * 5 * 0.02
+    top_result = tmp_path / "top_result"
+    top_result.mkdir()
+    best_structure, structures = bestStructs.main("Binding Energy", str(top_result), path=results, n_structs=4)
+    assert len(structures) == 4
+    assert sorted(os.listdir(str(top_result))) == sorted(structures)
+    reports = pd.concat([pd.read_csv(os.path.join(results, "report_{}".format(n)), sep="    ", engine="python")
+                         for n in (1, 2, 3)])
+    assert best_structure.endswith("_BindingEnergy{}.pdb".format(reports["Binding Energy"].min()))
+    with open(str(top_result / best_structure)) as pdb:
+        lines = pdb.read().splitlines()
+    assert lines[0].startswith("MODEL")
+    assert len([line for line in lines if line.startswith("HETATM") and line[21] == "L"]) == 15
+    analyser.analyse_at_epoch(c.REPORT_NAME, results, str(tmp_path), column="Binding Energy")
+    scores = pd.read_csv(str(tmp_path / "simulation_score_summary.tsv"), sep="\t")
+    assert list(scores["Fragment_Results_Folder"]) == [results]
+    assert scores["Score"][0] < reports["Binding Energy"].quantile(0.25)
@@ -0,0 +1,155 @@
+import os
+import copy
+import shutil
+import filecmp
+import pytest
+from frag_pele.Growing import template_fragmenter
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES = os.path.join(DIR, "data", "original", "DataLocal", "Templates", "OPLS2005", "HeteroAtoms",
+                         "templates_generated")
+# Templates written by the original (atom by atom) implementation for 3 growing steps
+EXPECTED = os.path.join(DIR, "data", "templates_expected")
+GROWING_MODES = ["SoftcoreLike", "SpreadHcharge", "AllLinear"]
+TOTAL_STEPS = 3
+
+
+@pytest.mark.parametrize("growing_mode", GROWING_MODES)
+def test_schedule_matches_original_templates(tmp_path, growing_mode):
+    fragment_atoms, core_atoms, templates = template_fragmenter.create_templates_schedule(
+        os.path.join(TEMPLATES, "3ipz"), os.path.join(TEMPLATES, "grwz"), TOTAL_STEPS, "H7", "C6",
+        str(tmp_path / "grwz"), initial_step=1, growing_mode=growing_mode)
+    assert len(templates) == TOTAL_STEPS + 1
+    for n, template in enumerate(templates):
+        assert filecmp.cmp(template, os.path.join(EXPECTED, growing_mode, "grwz_{}".format(n)), shallow=False)
+
+
+@pytest.mark.parametrize("growing_mode", GROWING_MODES)
+def test_main_matches_original_templates(tmp_path, growing_mode):
+    for n in range(TOTAL_STEPS + 1):
+        output = str(tmp_path / "grwz_{}".format(n))
+        template_fragmenter.main(os.path.join(TEMPLATES, "3ipz"), os.path.join(TEMPLATES, "grwz"), n + 1,
+                                 TOTAL_STEPS, "H7", "C6", output, growing_mode=growing_mode)
+        assert filecmp.cmp(output, os.path.join(EXPECTED, growing_mode, "grwz_{}".format(n)), shallow=False)
+
+
+def rewrite_keeping_mtime(path, old, new):
+    """
+    It rewrites a template with the same size and modification time, as a rewrite of new parameters within the
+    resolution of the modification time of the file system (1 s in NFS, HFS+ or ext3) would do.
+    """
+    status = os.stat(path)
+    with open(path) as template_file:
+        content = template_file.read()
+    with open(path, "w") as template_file:
+        template_file.write(content.replace(old, new, 1))
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns))
+    assert os.stat(path).st_size == status.st_size
+
+
+def test_load_template_memo(tmp_path, monkeypatch):
+    path = str(tmp_path / "grwz")
+    shutil.copy(os.path.join(TEMPLATES, "grwz"), path)
+    template = template_fragmenter.load_template(path)
+    parsed = []
+    init = template_fragmenter.TemplateImpact.__init__
+
+    def counted_init(self, path_to_template):
+        parsed.append(path_to_template)
+        init(self, path_to_template)
+
+    monkeypatch.setattr(template_fragmenter.TemplateImpact, "__init__", counted_init)
+    # Unchanged or touched (same content): taken from the memo, as a new object
+    copy = template_fragmenter.load_template(path)
+    assert copy is not template and copy.list_of_atoms.keys() == template.list_of_atoms.keys()
+    status = os.stat(path)
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns + 10 ** 9))
+    template_fragmenter.load_template(path)
+    assert parsed == []
+    # New parameters with the same size and modification time: parsed again
+    assert template.list_of_atoms[1].charge == 0.473
+    rewrite_keeping_mtime(path, " 0.473000 ", " 0.373000 ")
+    assert template_fragmenter.load_template(path).list_of_atoms[1].charge == 0.373
+    assert parsed == [path]
+    # Other size: parsed again
+    with open(path, "a") as template_file:
+        template_file.write("\n")
+    template_fragmenter.load_template(path)
+    assert parsed == [path, path]
+
+
+def scan_terms(template, index_atom):
+    """
+    :return: bonds, thetas, phis and iphis of an atom, found going through all the terms of the template. tuple
+    """
+    return ([index for index in template.list_of_bonds if index_atom in index],
+            [index for index in template.list_of_thetas if index_atom in index],
+            [phi for phi in template.list_of_phis if index_atom in (phi.atom1, phi.atom2, phi.atom3, phi.atom4)],
+            [iphi for iphi in template.list_of_iphis if index_atom in (iphi.atom1, iphi.atom2, iphi.atom3,
+                                                                       iphi.atom4)])
+
+
+def find_terms(template, index_atom):
+    """
+    :return: bonds, thetas, phis and iphis of an atom, found with the indexes of the template. tuple
+    """
+    return (template.find_bond_from_atom(index_atom), template.find_theta_from_atom(index_atom),
+            template.find_phi_from_atom(index_atom), template.find_iphi_from_atom(index_atom))
+
+
+def as_keys(terms):
+    # Phis are compared by identity, as the template does
+    return sorted([term if isinstance(term, tuple) else id(term) for term in terms])
+
+
+def assert_indexes_are_consistent(template):
+    atoms = range(1, max(template.list_of_atoms) + 3)
+    found = [find_terms(template, index_atom) for index_atom in atoms]
+    for index_atom, terms in zip(atoms, found):
+        for found_terms, scanned_terms in zip(terms, scan_terms(template, index_atom)):
+            assert as_keys(found_terms) == as_keys(scanned_terms)
+    # The indexes kept updated give the same terms than the ones built from scratch
+    template.build_indexes()
+    for index_atom, terms in zip(atoms, found):
+        for found_terms, rebuilt_terms in zip(terms, find_terms(template, index_atom)):
+            assert as_keys(found_terms) == as_keys(rebuilt_terms)
+    for name in set([atom.pdb_atom_name for atom in template.list_of_atoms.values()]):
+        assert template.find_index_of_atom_name(name) == min([index for index, atom in template.list_of_atoms.items()
+                                                              if atom.pdb_atom_name == name])
+
+
+def test_atom_indexes_after_edits():
+    template = template_fragmenter.TemplateImpact(os.path.join(TEMPLATES, "grwz"))
+    assert template.atom_indexes is None
+    assert_indexes_are_consistent(template)
+    # Delete an atom with all its terms
+    index_h6 = template.find_index_of_atom_name("_H6_")
+    template.erease_atom_from_template("_H6_")
+    assert find_terms(template, index_h6) == ([], [], [], [])
+    assert template.find_index_of_atom_name("_H6_") is None
+    assert_indexes_are_consistent(template)
+    # Replace terms: the bond and theta keep their keys, the phi moves to other atoms
+    bond_index = template.find_bond_from_atom(5)[0]
+    template.replace_bond(bond_index, template_fragmenter.Bond(bond_index[0], bond_index[1], 100., 1.5))
+    theta_index = template.find_theta_from_atom(5)[0]
+    template.replace_theta(theta_index, template_fragmenter.Theta(theta_index[0], theta_index[1], theta_index[2],
+                                                                  50., 120.))
+    old_phi = template.find_phi_from_atom(5)[0]
+    new_phi = template_fragmenter.Phi(old_phi.atom1, old_phi.atom2, old_phi.atom3, 13, 1., -1., 2., False)
+    template.replace_phi(old_phi, new_phi)
+    assert new_phi in template.find_phi_from_atom(13)
+    assert all([phi is not old_phi for phi in template.find_phi_from_atom(old_phi.atom4)])
+    # Replace an atom by one with the name of other atom: the first of them is found by name
+    renamed = copy.copy(template.list_of_atoms[14])
+    renamed.pdb_atom_name = "_O1_"
+    template.replace_atom(10, renamed)
+    assert template.find_index_of_atom_name("_O1_") == 10
+    assert_indexes_are_consistent(template)
+    # Add terms of a new atom
+    template.add_bond(template_fragmenter.Bond(14, 15, 300., 1.0))
+    template.add_theta(template_fragmenter.Theta(12, 14, 15, 30., 109.))
+    template.add_phi(template_fragmenter.Phi(8, 12, 14, 15, 0.5, 1., 3., False))
+    template.add_phi(template_fragmenter.Phi(12, 14, 15, 11, 0.5, -1., 2., True))
+    assert find_terms(template, 15)[:2] == ([(14, 15)], [(12, 14, 15)])
+    assert [len(terms) for terms in find_terms(template, 15)[2:]] == [1, 1]
+    assert_indexes_are_consistent(template)
@@ -0,0 +1,66 @@
+import os
+import json
+import collections
+import pytest
+from frag_pele.Helpers import timings
+
+Usage = collections.namedtuple("Usage", ["ru_maxrss"])
+
+
+def read_records(path):
+    with open(path) as timings_file:
+        return [json.loads(line) for line in timings_file]
+
+
+def test_span_writes_timings(tmp_path):
+    with timings.Span("growing", str(tmp_path), ID="a"):
+        with timings.Span("pele", str(tmp_path), step=1):
+            sum(range(100000))
+    with pytest.raises(ValueError):
+        with timings.Span("clustering", str(tmp_path), step=1):
+            raise ValueError()
+    records = read_records(os.path.join(str(tmp_path), "timings.jsonl"))
+    # The inner spans are written when they finish, before the outer ones
+    assert [record["name"] for record in records] == ["pele", "growing", "clustering"]
+    assert [record["parent"] for record in records] == ["growing", None, None]
+    assert [record["status"] for record in records] == ["ok", "ok", "ValueError"]
+    assert records[0]["attributes"] == {"step": 1}
+    assert records[1]["wall"] >= records[0]["wall"] >= 0
+    assert records[0]["peak_rss"] > 0
+    assert records[0]["peak_rss_increase"] >= 0
+
+
+def test_peak_rss_in_kb(monkeypatch):
+    monkeypatch.setattr(timings.resource, "getrusage", lambda who: Usage(300 * 1024 * 1024))
+    monkeypatch.setattr(timings.sys, "platform", "darwin")
+    assert timings.get_peak_rss() == (300 * 1024, 300 * 1024)
+    monkeypatch.setattr(timings.sys, "platform", "linux")
+    assert timings.get_peak_rss() == (300 * 1024 * 1024, 300 * 1024 * 1024)
+
+
+def test_summary(tmp_path):
+    growing_dir = tmp_path / "growing" / "step"
+    growing_dir.mkdir(parents=True)
+    records = [{"name": "growing", "parent": None, "attributes": {}, "status": "ok", "wall": 10., "cpu": 1.,
+                "children_cpu": 8., "peak_rss": 2048, "children_peak_rss": 512000},
+               {"name": "pele", "parent": "growing", "attributes": {"step": 1}, "status": "ok", "wall": 3.,
+                "cpu": 0., "children_cpu": 3., "peak_rss": 1024, "children_peak_rss": 512000},
+               {"name": "pele", "parent": "growing", "attributes": {"step": 2}, "status": "CalledProcessError",
+                "wall": 5., "cpu": 0., "children_cpu": 5., "peak_rss": 1024, "children_peak_rss": 256000}]
+    with open(str(growing_dir / "timings.jsonl"), "w") as timings_file:
+        for record in records:
+            timings_file.write(json.dumps(record) + "\n")
+        timings_file.write('{"name": "truncat')
+    read = timings.read_timings([str(tmp_path)])
+    assert len(read) == 3
+    summary = timings.summarise(read)
+    assert [group["name"] for group in summary] == ["growing", "pele"]
+    pele = summary[1]
+    assert (pele["calls"], pele["errors"], pele["wall"], pele["max_wall"]) == (2, 1, 8., 5.)
+    assert pele["share"] == 80.
+    assert pele["children_peak_rss"] == 512000
+    assert [group["name"] for group in timings.summarise(read, "step")] == \
+        ["growing[step=-]", "pele[step=2]", "pele[step=1]"]
+    table = timings.format_summary(summary).splitlines()
+    assert table[0].split()[-1] == "Peak(MB)"
+    assert table[3].split() == ["pele", "2", "1", "8.00", "4.00", "5.00", "0.00", "8.00", "80.0", "500.0"]